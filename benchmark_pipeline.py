@@ -0,0 +1,372 @@
+import os
+import sys
+import csv
+import json
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from docstore import STORE_ENV
+from main import run_script
+from organize_outputs import LABEL_DICT
+from run_report import RunReport
+from workspace import WORKDIR_ENV
+
+# Benchmark de bout en bout du pipeline, 100 % hors-ligne, sur un manuel synthétique :
+# - PDF généré avec PyMuPDF : exercices numérotés, mots en gras / italique / couleur, images, densité variable
+# - pages rendues avec PyMuPDF (pas de Ghostscript) et labels YOLO écrits depuis les positions connues des images
+# - Gemini remplacé par un stub déterministe (exercices reconstruits depuis le contenu généré)
+# - classifieur remplacé par un modèle réduit aléatoire (classification/src/benchmark.py, preset tiny)
+# Les étapes tournent comme dans main.py (un processus par script), dans un dossier de travail séparé
+# (MALIN_WORKDIR) : pages/s et pic de RSS par étape, comparés à une référence.
+
+# Run ce script avec :
+# python benchmark_pipeline.py --pages 30 --output bench_ref.json
+# python benchmark_pipeline.py --pages 30 --baseline bench_ref.json --threshold 0.25
+
+BASE_DIR = Path(__file__).resolve().parent
+CLASSIF_SRC = BASE_DIR / "classification" / "src"
+
+PDF_NAME = "bench.pdf"
+
+# En dessous de cette durée (démarrage de Python compris), le débit d'une étape est trop bruité pour être comparé
+MIN_COMPARED_SECONDS = 0.5
+
+DENSITIES = {
+    # exercices par page, lignes d'énoncé par exercice, probabilité d'une image par exercice
+    "low": ((1, 2), (2, 4), 0.3),
+    "medium": ((2, 4), (3, 6), 0.4),
+    "high": ((4, 6), (4, 9), 0.5),
+}
+
+INSTRUCTIONS = [
+    "Recopie les phrases en soulignant le verbe.",
+    "Complète avec le bon déterminant.",
+    "Entoure le nom dans chaque groupe de mots.",
+    "Classe les mots dans l'ordre alphabétique.",
+    "Écris ces phrases au pluriel.",
+    "Relie chaque sujet à son verbe.",
+    "Barre l'intrus dans chaque liste.",
+    "Conjugue les verbes au présent.",
+    "Réponds aux questions par une phrase.",
+    "Trouve le contraire de chaque adjectif.",
+]
+
+WORDS = ["le", "la", "les", "un", "une", "des", "chat", "chien", "maison", "école", "jardin", "maîtresse", "élève",
+         "cahier", "crayon", "arbre", "oiseau", "rivière", "soleil", "petit", "grand", "joli", "rouge", "vert",
+         "mange", "joue", "chante", "court", "regarde", "écrit", "lit", "dans", "avec", "sous", "sur", "vers",
+         "demain", "hier", "toujours", "souvent", "été", "hiver", "forêt", "château", "poisson", "fenêtre"]
+
+# Styles de mots : (police base 14 de PyMuPDF, couleur RGB)
+PLAIN = ("helv", (0, 0, 0))
+WORD_STYLES = [
+    ("hebo", (0, 0, 0)),  # gras
+    ("heit", (0, 0, 0)),  # italique
+    ("helv", (0.85, 0.1, 0.1)),  # rouge
+    ("helv", (0.1, 0.3, 0.8)),  # bleu
+    ("hebi", (0.1, 0.5, 0.1)),  # gras italique vert
+]
+
+PAGE_WIDTH, PAGE_HEIGHT = fitz.paper_size("a4")
+MARGIN = 50
+
+
+# =========================
+# MANUEL SYNTHÉTIQUE
+# =========================
+class PageWriter:
+    """Écriture mot à mot (un span par style) avec retour à la ligne automatique."""
+
+    def __init__(self, page, y):
+        self.page = page
+        self.x = MARGIN
+        self.y = y
+
+    def newline(self, size):
+        self.x = MARGIN
+        self.y += size * 1.5
+
+    def words(self, words, size, style=PLAIN, styles=None):
+        for i, word in enumerate(words):
+            font, color = styles[i] if styles else style
+            width = fitz.get_text_length(word, fontname=font, fontsize=size)
+            if self.x + width > PAGE_WIDTH - MARGIN:
+                self.newline(size)
+            self.page.insert_text((self.x, self.y), word, fontname=font, fontsize=size, color=color)
+            self.x += width + fitz.get_text_length(" ", fontname=font, fontsize=size)
+
+
+def synthetic_image(rng, width, height):
+    """Pixmap RGB unie (illustration factice)."""
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, width, height), False)
+    pix.clear_with(rng.randrange(40, 220))
+    return pix
+
+
+def make_textbook(pdf_path, n_pages, density="mixed", seed=0):
+    """Génère le PDF et renvoie la vérité terrain : {page: {"exercises": [...], "images": [fitz.Rect]}}."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    truth = {}
+
+    for page_num in range(1, n_pages + 1):
+        level = rng.choice(sorted(DENSITIES)) if density == "mixed" else density
+        (ex_min, ex_max), (lines_min, lines_max), p_image = DENSITIES[level]
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        writer = PageWriter(page, MARGIN + 12)
+        exercises, images = [], []
+
+        for num in range(1, rng.randint(ex_min, ex_max) + 1):
+            if writer.y > PAGE_HEIGHT - 120:
+                break
+            size = rng.choice([10, 11, 12])
+
+            # Numéro (gras, couleur) + consigne (gras)
+            instruction = rng.choice(INSTRUCTIONS)
+            writer.words([str(num)], size + 2, ("hebo", (0.1, 0.3, 0.8)))
+            writer.words(instruction.split(), size, ("hebo", (0, 0, 0)))
+            writer.newline(size)
+
+            # Image éventuelle, à droite de l'énoncé
+            statement_lines = []
+            image_id = None
+            if rng.random() < p_image and writer.y + 80 < PAGE_HEIGHT - MARGIN:
+                rect = fitz.Rect(PAGE_WIDTH - MARGIN - 90, writer.y - size, PAGE_WIDTH - MARGIN, writer.y - size + 70)
+                page.insert_image(rect, pixmap=synthetic_image(rng, 90, 70))
+                image_id = f"p{page_num}c{len(images)}"
+                images.append(rect)
+
+            # Énoncé : lignes de mots, certains stylés
+            for _ in range(rng.randint(lines_min, lines_max)):
+                if writer.y > PAGE_HEIGHT - MARGIN - 20:
+                    break
+                words = [rng.choice(WORDS) for _ in range(rng.randint(4, 9))]
+                words[0] = words[0].capitalize()
+                words[-1] += "."
+                styles = [rng.choice(WORD_STYLES) if rng.random() < 0.2 else PLAIN for _ in words]
+                writer.words([f"{chr(97 + len(statement_lines))}."], size)
+                writer.words(words, size, styles=styles)
+                writer.newline(size)
+                statement_lines.append(f"{chr(97 + len(statement_lines))}. " + " ".join(words))
+            writer.newline(size)
+
+            statement = "\n".join(statement_lines)
+            if image_id is not None:
+                statement += f"\n\\image{{{image_id}}}"
+            exercises.append({"number": str(num), "instruction": instruction, "statement": statement})
+
+        truth[page_num] = {"exercises": exercises, "images": images}
+
+    doc.save(pdf_path)
+    doc.close()
+    return truth
+
+
+def render_pages(pdf_path, files_dir, dpi):
+    """Équivalent de pdfToImages.py (page_N.png) sans Ghostscript."""
+    files_dir.mkdir(parents=True, exist_ok=True)
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            page.get_pixmap(dpi=dpi).save(str(files_dir / f"page_{page.number + 1}.png"))
+
+
+def write_yolo_labels(truth, files_dir, predict_dir):
+    """Sorties d'un predict YOLO (labels .txt + image) construites depuis les positions des images."""
+    labels_dir = predict_dir / "labels"
+    labels_dir.mkdir(parents=True, exist_ok=True)
+    for page_num, page_truth in truth.items():
+        shutil.copy(files_dir / f"page_{page_num}.png", predict_dir / f"page_{page_num}.png")
+        if not page_truth["images"]:
+            continue
+        with open(labels_dir / f"page_{page_num}.txt", "w") as f:
+            for r in page_truth["images"]:
+                f.write(f"0 {(r.x0 + r.x1) / 2 / PAGE_WIDTH:.6f} {(r.y0 + r.y1) / 2 / PAGE_HEIGHT:.6f} "
+                        f"{r.width / PAGE_WIDTH:.6f} {r.height / PAGE_HEIGHT:.6f}\n")
+
+
+# =========================
+# STUBS (GEMINI, CLASSIFIEUR)
+# =========================
+def gemini_stub(truth, extraction_dir):
+    """Réponse déterministe à la place de Gemini : extractionOut/page_N.json au format de prompt.txt."""
+    extraction_dir.mkdir(parents=True, exist_ok=True)
+    for page_num, page_truth in truth.items():
+        data = [{
+            "id": f"p{page_num}_ex{ex['number']}",
+            "type": "exercise",
+            "images": "\\image{" in ex["statement"],
+            "image_type": "single" if "\\image{" in ex["statement"] else "none",
+            "properties": {"number": ex["number"], "instruction": ex["instruction"], "labels": [],
+                           "statement": ex["statement"], "hint": None, "example": None, "references": None},
+        } for ex in page_truth["exercises"]]
+        with open(extraction_dir / f"page_{page_num}.json", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def classifier_stub(extraction_dir, output_dir):
+    """Prédictions déterministes (sans torch) au format de inference.py."""
+    labels = sorted(LABEL_DICT)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for tsv_path in sorted(extraction_dir.glob("page_*.tsv")):
+        with open(tsv_path, "r", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f, delimiter="\t"))
+        preds = [labels[sum(map(ord, r["id"])) % len(labels)] for r in rows]
+        with open(output_dir / f"pred_{tsv_path.stem}.txt", "w") as f:
+            f.writelines(f"{p}\n" for p in preds)
+        with open(output_dir / f"pred_{tsv_path.stem}.tsv", "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f, delimiter="\t")
+            writer.writerow(["textbook", "id", "instruction_hint_example", "statement", "label", "pred"])
+            for r, p in zip(rows, preds):
+                writer.writerow([r["textbook"], r["id"], r["instruction_hint_example"], r["statement"], r["label"], p])
+
+
+def build_tiny_classifier(out_dir):
+    """Modèle SingleBert réduit (poids aléatoires) + modelebase, comme classification/src/benchmark.py."""
+    sys.path.insert(0, str(CLASSIF_SRC))
+    from benchmark import build_model
+    from models_bert_torch import MAX_SEQUENCE_LENGTH
+
+    model_paths, modelebase = build_model(out_dir, "tiny", MAX_SEQUENCE_LENGTH)
+    return model_paths["single"], modelebase
+
+
+# =========================
+# BENCHMARK
+# =========================
+def run_benchmark(work, n_pages, density, seed, dpi, classifier, style_workers):
+    os.environ[WORKDIR_ENV] = str(work)
+    os.environ.pop(STORE_ENV, None)  # le benchmark mesure le mode fichiers
+
+    pdf_path = work / "PdfSource" / PDF_NAME
+    pdf_path.parent.mkdir(parents=True, exist_ok=True)
+    print(f"[INFO] Manuel synthétique : {n_pages} pages, densité {density}, graine {seed}")
+    truth = make_textbook(str(pdf_path), n_pages, density, seed)
+
+    # Préparation (non mesurée) : rendu des pages, labels YOLO, modèle réduit
+    render_pages(str(pdf_path), work / "files", dpi)
+    write_yolo_labels(truth, work / "files", work / "output" / "detImages" / "predict")
+    if classifier == "tiny":
+        model, modelebase = build_tiny_classifier(str(work / "classif_model"))
+        os.environ["MALIN_CLASSIF_MODEL"] = model
+        os.environ["MALIN_CLASSIF_BASE_MODEL"] = modelebase
+        os.environ["MALIN_CLASSIF_CACHE"] = str(work / "classif_model" / "predictions.sqlite")
+
+    report = RunReport(PDF_NAME, work, argv=sys.argv[1:])
+    run_script("pdfToTxtStyle.py", pdf_path, work / "files_style", "true", report=report)
+    run_script("detectImages.py", "--labels-only", report=report)
+    run_script("cropImages.py", report=report)
+    run_script("drawBoxes.py", "--dpi", dpi, report=report)
+    gemini_stub(truth, work / "extractionOut")
+    run_script("exercises_tsv.py", work / "extractionOut", report=report)
+    if classifier == "tiny":
+        run_script("classification.py", report=report)
+    else:
+        classifier_stub(work / "extractionOut", work / "classificationOut")
+    run_script("style-post.py", "--workers", style_workers, report=report)
+    run_script("organize_outputs.py", PDF_NAME, report=report)
+    report.save()
+
+    stages = {}
+    for stage in report.data["stages"]:
+        wall = stage["wall_seconds"]
+        stages[Path(stage["stage"]).stem] = {
+            "wall_seconds": wall,
+            "pages_per_sec": round(n_pages / wall, 2) if wall else None,
+            "peak_rss_mb": stage.get("peak_rss_mb"),
+        }
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "pages": n_pages, "density": density, "seed": seed, "dpi": dpi, "classifier": classifier,
+            "style_workers": style_workers,
+            "exercises": sum(len(t["exercises"]) for t in truth.values()),
+            "images": sum(len(t["images"]) for t in truth.values()),
+            "python": report.data["python"], "machine": report.data["machine"], "cpus": os.cpu_count(),
+        },
+        "stages": stages,
+    }
+
+
+def find_regressions(result, baseline, threshold):
+    """Étapes plus lentes (pages/s) ou plus gourmandes (pic de RSS) que la référence au-delà du seuil."""
+    regressions = []
+    for name, base in baseline["stages"].items():
+        cur = result["stages"].get(name)
+        if cur is None:
+            continue
+        if (base.get("pages_per_sec") and cur.get("pages_per_sec") is not None
+                and base["wall_seconds"] >= MIN_COMPARED_SECONDS
+                and cur["pages_per_sec"] < base["pages_per_sec"] * (1 - threshold)):
+            regressions.append(f"{name} : {cur['pages_per_sec']} pages/s (référence {base['pages_per_sec']})")
+        if (base.get("peak_rss_mb") and cur.get("peak_rss_mb") is not None
+                and cur["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold)):
+            regressions.append(f"{name} : pic RSS {cur['peak_rss_mb']} Mo (référence {base['peak_rss_mb']} Mo)")
+    return regressions
+
+
+def print_results(result, baseline=None):
+    print(f"\n{'étape':<20} {'pages/s':>10} {'réf.':>10} {'pic RSS Mo':>12} {'réf.':>10}")
+    for name, cur in result["stages"].items():
+        base = (baseline or {}).get("stages", {}).get(name, {})
+        print(f"{name:<20} {str(cur['pages_per_sec']):>10} {str(base.get('pages_per_sec', '-')):>10} "
+              f"{str(cur['peak_rss_mb']):>12} {str(base.get('peak_rss_mb', '-')):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20, help="Nombre de pages du manuel synthétique")
+    parser.add_argument("--density", choices=["mixed", *sorted(DENSITIES)], default="mixed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dpi", type=int, default=150, help="Résolution du rendu des pages")
+    parser.add_argument("--classifier", choices=["tiny", "stub"], default="tiny",
+                        help="tiny : modèle réduit via classification.py ; stub : prédictions déterministes sans torch")
+    parser.add_argument("--style-workers", type=int, default=1)
+    parser.add_argument("--workdir", default=None, help="Dossier de travail (défaut : dossier temporaire supprimé)")
+    parser.add_argument("--output", default=None, help="Fichier JSON des résultats (réutilisable comme référence)")
+    parser.add_argument("--baseline", default=None, help="Résultats de référence à comparer")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Écart relatif toléré sur pages/s et pic de RSS avant échec")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ("pages", "density", "seed", "dpi", "classifier"):
+            if baseline["meta"].get(key) != getattr(args, key):
+                print(f"[WARN] Référence obtenue avec {key}={baseline['meta'].get(key)} (ici {getattr(args, key)})")
+
+    if args.workdir:
+        work = Path(args.workdir).resolve()
+        shutil.rmtree(work, ignore_errors=True)
+        work.mkdir(parents=True)
+        result = run_benchmark(work, args.pages, args.density, args.seed, args.dpi, args.classifier,
+                               args.style_workers)
+    else:
+        with tempfile.TemporaryDirectory(prefix="malin-bench-pipeline-") as tmp:
+            result = run_benchmark(Path(tmp), args.pages, args.density, args.seed, args.dpi, args.classifier,
+                                   args.style_workers)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"[OK] Résultats : {args.output}")
+
+    print_results(result, baseline)
+    if baseline is not None:
+        regressions = find_regressions(result, baseline, args.threshold)
+        if regressions:
+            print(f"\n[ERR] Régressions au-delà de {args.threshold:.0%} :")
+            for r in regressions:
+                print(f"  - {r}")
+            sys.exit(1)
+        print(f"\n[OK] Aucune régression au-delà de {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
 import os
+import csv
+import json
+import argparse
 import subprocess
 import sys
 import shutil
+import tempfile
+import urllib.request
 from pathlib import Path
 
+from docstore import TSV_COLUMNS, open_store, page_of
+from profiling import profiled_stages, python_cmd
+from workspace import atomic_open, page_selected, selected_pages, work_dir
+
 # ================= CONFIGURATION DES CHEMINS FIXES =================
 base_dir = Path(__file__).resolve().parent
 # INPUT_DIR = base_dir / "extractionOutStyle"
@@ -13,43 +22,110 @@ base_dir = Path(__file__).resolve().parent
 CLASSIF_PROJECT_ROOT = base_dir / "classification"
 
 # 2. Chemin vers vos résultats d'extraction (Entrée)
-EXTRACTION_DIR = base_dir / "extractionOut"
+EXTRACTION_DIR = work_dir() / "extractionOut"
 
 # 3. NOUVEAU : Chemin vers le dossier de sortie de classification
-CLASSIF_OUTPUT_DIR = base_dir / "classificationOut"
+CLASSIF_OUTPUT_DIR = work_dir() / "classificationOut"
 
 # Définition des fichiers requis dans le projet de classification
 INFERENCE_SCRIPT = CLASSIF_PROJECT_ROOT / "src" / "inference.py"
-MODEL_PATH = CLASSIF_PROJECT_ROOT / "modeles" / "ex_classif" / "saved_model_classification_ft_camembert.pt"
-BASE_MODEL = CLASSIF_PROJECT_ROOT / "modeles" / "camembert-base"
+SHARDED_SCRIPT = CLASSIF_PROJECT_ROOT / "src" / "sharded_inference.py"
+# Modèle remplaçable par variables d'environnement (ex. modèle réduit de benchmark_pipeline.py)
+MODEL_PATH = Path(os.environ.get("MALIN_CLASSIF_MODEL",
+                                 CLASSIF_PROJECT_ROOT / "modeles" / "ex_classif" / "saved_model_classification_ft_camembert.pt"))
+BASE_MODEL = Path(os.environ.get("MALIN_CLASSIF_BASE_MODEL", CLASSIF_PROJECT_ROOT / "modeles" / "camembert-base"))
+
+# Cache persistant des prédictions (partagé entre pages et manuels)
+CACHE_FILE = Path(os.environ.get("MALIN_CLASSIF_CACHE", CLASSIF_PROJECT_ROOT / "cache" / "predictions.sqlite"))
+
+
+# Colonnes écrites par inference.py dans pred_*.tsv
+PRED_COLUMNS = ["textbook", "id", "instruction_hint_example", "statement", "label", "pred"]
 
 
 # ===================================================================
 
-def run_batch_classification():
+def classify_with_server(tsv_file, output_txt, output_tsv, server_url):
+    """Classe un TSV via le service local (serve.py) et écrit les mêmes fichiers que inference.py."""
+    with open(tsv_file, "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f, delimiter="\t"))
+
+    payload = {"exercises": [
+        {"id": r["id"], "instruction_hint_example": r["instruction_hint_example"], "statement": r["statement"]}
+        for r in rows
+    ]}
+    request = urllib.request.Request(
+        server_url.rstrip("/") + "/classify",
+        data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=600) as resp:
+        predictions = json.loads(resp.read().decode("utf-8"))["predictions"]
+
+    with atomic_open(output_txt, "w") as f:
+        for p in predictions:
+            f.write(f"{p['pred']}\n")
+
+    with atomic_open(output_tsv, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(PRED_COLUMNS)
+        for r, p in zip(rows, predictions):
+            writer.writerow([r["textbook"], r["id"], r["instruction_hint_example"], r["statement"], r["label"], p["pred"]])
+
+
+def run_sharded_classification(workers, threads, extraction_dir=EXTRACTION_DIR, output_dir=CLASSIF_OUTPUT_DIR):
+    """Classe toutes les pages en une fois sur `workers` processus de `threads` threads chacun."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    print(f"--- Classification shardée : {workers} workers x {threads} threads ---\n")
+
+    if "inference" in profiled_stages():
+        # cProfile ne suit pas les workers (processus spawn) : pas de profil en mode shardé
+        print("[WARN] Profil inference indisponible en mode shardé (--workers)")
+
+    cmd = [
+        sys.executable, str(SHARDED_SCRIPT), "run",
+        "--inputdir", str(extraction_dir),
+        "--outputdir", str(output_dir),
+        "--modele", str(MODEL_PATH),
+        "--modelebase", str(BASE_MODEL),
+        "--bertarchi", "single",
+        "--workers", str(workers),
+        "--threads", str(threads),
+        "--cache", str(CACHE_FILE)
+    ]
+    try:
+        subprocess.run(cmd, check=True, cwd=str(CLASSIF_PROJECT_ROOT))
+        print(f"[OK] Succès ! Résultats dans : classificationOut/\n")
+    except subprocess.CalledProcessError:
+        print(f"[ERR] Échec de la classification shardée\n")
+
+
+def run_batch_classification(server_url=None, extraction_dir=EXTRACTION_DIR, output_dir=CLASSIF_OUTPUT_DIR):
     # Création du dossier de sortie s'il n'existe pas
-    CLASSIF_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
 
     print(f"--- Configuration ---")
     print(f"Dossier Classif : {CLASSIF_PROJECT_ROOT}")
-    print(f"Dossier Extraits : {EXTRACTION_DIR}")
-    print(f"Dossier Sortie   : {CLASSIF_OUTPUT_DIR}\n")
+    print(f"Dossier Extraits : {extraction_dir}")
+    print(f"Dossier Sortie   : {output_dir}")
+    print(f"Service          : {server_url or '-'}\n")
 
     # Vérifications de sécurité
     if not CLASSIF_PROJECT_ROOT.exists():
         print(f"[ERR] Dossier malin-local introuvable.")
         return
-    if not INFERENCE_SCRIPT.exists():
+    if server_url is None and not INFERENCE_SCRIPT.exists():
         print(f"[ERR] inference.py introuvable.")
         return
-    if not EXTRACTION_DIR.exists():
+    if not extraction_dir.exists():
         print(f"[ERR] Dossier extractionOut introuvable.")
         return
 
     # Liste des fichiers .tsv générés par Gemini
-    tsv_files = list(EXTRACTION_DIR.glob("*.tsv"))
+    tsv_files = list(extraction_dir.glob("*.tsv"))
     # On filtre pour ne pas re-traiter des fichiers "pred_" si le dossier est mélangé
-    tsv_files = [f for f in tsv_files if not f.name.startswith("pred_")]
+    # (et on garde les pages de MALIN_PAGES, cf. main.py --resume)
+    tsv_files = [f for f in tsv_files if not f.name.startswith("pred_") and page_selected(page_of(f.stem))]
 
     if not tsv_files:
         print(f"[WARN] Aucun fichier .tsv d'origine trouvé.")
@@ -61,12 +137,20 @@ def run_batch_classification():
         print(f">> Traitement de : {tsv_file.name}")
 
         # Fichiers de sortie dans le NOUVEAU dossier
-        output_txt = CLASSIF_OUTPUT_DIR / f"pred_{tsv_file.stem}.txt"
-        output_tsv = CLASSIF_OUTPUT_DIR / f"pred_{tsv_file.stem}.tsv"
+        output_txt = output_dir / f"pred_{tsv_file.stem}.txt"
+        output_tsv = output_dir / f"pred_{tsv_file.stem}.tsv"
+
+        if server_url is not None:
+            try:
+                classify_with_server(tsv_file, output_txt, output_tsv, server_url)
+                print(f"[OK] Succès (service) ! Résultats dans : classificationOut/\n")
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[ERR] Échec du traitement pour {tsv_file.name} : {e}\n")
+            continue
 
         # Construction de la commande
         cmd = [
-            sys.executable, str(INFERENCE_SCRIPT),
+            *python_cmd("inference", INFERENCE_SCRIPT, f"inference_{tsv_file.stem}"),
             "--testfile", str(tsv_file),
             "-c1", "instruction_hint_example",
             "-c2", "statement",
@@ -74,7 +158,8 @@ def run_batch_classification():
             "--modelebase", str(BASE_MODEL),
             "--bertarchi", "single",
             "--ypredtxtfile", str(output_txt),
-            "--ypredtsvfile", str(output_tsv)
+            "--ypredtsvfile", str(output_tsv),
+            "--cache", str(CACHE_FILE)
         ]
 
         try:
@@ -85,5 +170,55 @@ def run_batch_classification():
             print(f"[ERR] Échec du traitement pour {tsv_file.name}\n")
 
 
+def run_store_classification(store, server_url=None, workers=None, threads=1):
+    """Classification des exercices en base (MALIN_STORE), prédictions réécrites en base.
+
+    inference.py / sharded_inference.py lisent des TSV : ceux-ci ne vivent que dans un
+    dossier temporaire local, le temps de l'étape.
+    """
+    with tempfile.TemporaryDirectory(prefix="malin-classif-") as tmp:
+        input_dir, output_dir = Path(tmp) / "in", Path(tmp) / "out"
+        input_dir.mkdir()
+        for page in store.pages("exercises"):
+            if not page_selected(page):
+                continue  # MALIN_PAGES
+            with open(input_dir / f"page_{page}.tsv", "w", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=TSV_COLUMNS, delimiter="\t")
+                writer.writeheader()
+                writer.writerows(store.exercise_rows(page))
+
+        if workers and not server_url:
+            run_sharded_classification(workers, threads, input_dir, output_dir)
+        else:
+            run_batch_classification(server_url, input_dir, output_dir)
+
+        for pred_tsv in sorted(output_dir.glob("pred_*.tsv")):
+            with open(pred_tsv, "r", encoding="utf-8", newline="") as f:
+                rows = list(csv.DictReader(f, delimiter="\t"))
+            store.put_predictions(page_of(pred_tsv.stem), [(r["id"], r["pred"]) for r in rows])
+    print(f"[OK] Prédictions écrites en base : {store.path}")
+
+
 if __name__ == "__main__":
-    run_batch_classification()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", default=os.environ.get("MALIN_CLASSIF_SERVER"),
+                        help="URL du service de classification (classification/src/serve.py)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Nombre de processus de classification (sharding de toutes les pages)")
+    parser.add_argument("--threads", type=int, default=1, help="Threads torch par processus (avec --workers)")
+    args = parser.parse_args()
+    store = open_store()
+    if store is not None:
+        run_store_classification(store, args.server, args.workers, args.threads)
+        store.close()
+    elif args.workers and not args.server and selected_pages() is not None:
+        # sharded_inference.py classe tout un dossier : copie des seules pages de MALIN_PAGES
+        with tempfile.TemporaryDirectory(prefix="malin-classif-") as tmp:
+            for tsv_file in EXTRACTION_DIR.glob("page_*.tsv"):
+                if page_selected(page_of(tsv_file.stem)):
+                    shutil.copy(tsv_file, tmp)
+            run_sharded_classification(args.workers, args.threads, Path(tmp))
+    elif args.workers and not args.server:
+        run_sharded_classification(args.workers, args.threads)
+    else:
+        run_batch_classification(args.server)
\ No newline at end of file
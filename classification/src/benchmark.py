@@ -0,0 +1,255 @@
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import torch
+
+from inference import labelDict, load_exercises, set_torch_threads
+from models_bert_torch import compute_input_arrays, SingleBert, SiameseBert, DualBert
+
+try:
+    import resource  # POSIX uniquement
+except ImportError:
+    resource = None
+
+# Benchmark de débit du classifieur, 100 % hors-ligne :
+# - modèle SingleBert initialisé aléatoirement (forme camembert-base ou réduite)
+# - tokenizer WordLevel synthétique
+# - TSV d'exercices synthétiques au format de extraction-gemini-vision.py
+# Chaque configuration (batch, longueur, threads, backend) tourne dans un processus séparé
+# pour mesurer le pic de RSS. Résultats en JSON pour comparer les versions.
+
+# Run ce script avec :
+# python3 ./src/benchmark.py --preset tiny --batch-sizes 1,8,32 --seq-lens 128,256 \
+# --threads 1,4 --backends eager,int8 --archis single,siamese --output bench.json
+
+PRESETS = {
+    # même forme que camembert-base
+    "base": dict(hidden_size=768, num_hidden_layers=12, num_attention_heads=12, intermediate_size=3072),
+    "small": dict(hidden_size=256, num_hidden_layers=4, num_attention_heads=4, intermediate_size=1024),
+    "tiny": dict(hidden_size=64, num_hidden_layers=2, num_attention_heads=2, intermediate_size=256),
+}
+
+BACKENDS = ["eager", "jit", "int8"]
+
+ARCHIS = {"single": SingleBert, "siamese": SiameseBert, "dual": DualBert, "dual-concurrent": DualBert}
+
+SPECIAL_TOKENS = ["<s>", "<pad>", "</s>", "<unk>", "<mask>"]
+
+WORDS = ["recopie", "complète", "souligne", "le", "la", "les", "verbe", "phrase", "mot", "écris", "entoure",
+         "relie", "classe", "chaque", "dans", "avec", "nom", "adjectif", "chat", "maison", "école", "jardin",
+         "pluriel", "singulier", "barre", "intrus", "conjugue", "présent", "passé", "futur", "ligne", "ordre",
+         "alphabétique", "trouve", "réponds", "question", "texte", "lis", "colorie", "case", "bonne", "réponse"]
+
+
+def build_tokenizer(out_dir):
+    """Tokenizer WordLevel hors-ligne, gabarit CamemBERT (<s> A </s></s> B </s>, token_type_ids à 0)."""
+    from tokenizers import Tokenizer
+    from tokenizers.models import WordLevel
+    from tokenizers.pre_tokenizers import Whitespace
+    from tokenizers.processors import TemplateProcessing
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {tok: i for i, tok in enumerate(SPECIAL_TOKENS + WORDS)}
+    tok = Tokenizer(WordLevel(vocab, unk_token="<unk>"))
+    tok.pre_tokenizer = Whitespace()
+    tok.post_processor = TemplateProcessing(
+        single="<s> $A </s>",
+        pair="<s> $A </s> </s> $B </s>",
+        special_tokens=[("<s>", vocab["<s>"]), ("</s>", vocab["</s>"])],
+    )
+    fast = PreTrainedTokenizerFast(tokenizer_object=tok, bos_token="<s>", eos_token="</s>", sep_token="</s>",
+                                   cls_token="<s>", unk_token="<unk>", pad_token="<pad>", mask_token="<mask>")
+    fast.save_pretrained(out_dir)
+    return len(vocab)
+
+
+def build_model(work_dir, preset, max_seq_len, archis=("single",)):
+    """Crée modelebase (config + poids aléatoires + tokenizer) et un .pt fine-tuné factice par architecture."""
+    from transformers import CamembertConfig, CamembertModel
+
+    base_dir = Path(work_dir) / "camembert-bench"
+    base_dir.mkdir(parents=True, exist_ok=True)
+    vocab_size = build_tokenizer(str(base_dir))
+    torch.manual_seed(0)
+    config = CamembertConfig(vocab_size=vocab_size, max_position_embeddings=max_seq_len + 2, type_vocab_size=1,
+                             pad_token_id=1, bos_token_id=0, eos_token_id=2, **PRESETS[preset])
+    CamembertModel(config).save_pretrained(str(base_dir))
+
+    model_paths = {}
+    for archi in archis:
+        model = ARCHIS[archi](str(base_dir), labelDict.keys())
+        if archi == "dual-concurrent":
+            model.concurrent = True
+        model_paths[archi] = str(Path(work_dir) / f"model_bench_{archi}.pt")
+        torch.save(model, model_paths[archi])
+    return model_paths, str(base_dir)
+
+
+def write_synthetic_tsv(path, n_exercises, words_per_exercise, seed=0):
+    """TSV d'exercices synthétiques avec les colonnes de convert_json_to_tsv (exercises_tsv.py)."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(["textbook", "id", "full_ex", "num", "indicator", "instruction", "hint", "example",
+                         "statement", "instruction_hint_example", "label", "grandtype", "stratify_key"])
+        for i in range(n_exercises):
+            instruction = " ".join(rng.choice(WORDS) for _ in range(max(1, words_per_exercise // 4)))
+            statement = " ".join(rng.choice(WORDS) for _ in range(words_per_exercise))
+            writer.writerow(["bench", f"p1_ex{i + 1}", f"{instruction} {statement}", str(i + 1), "none",
+                             instruction, "", "", statement, instruction, "none", "none", "none"])
+
+
+def make_backend(model, backend, example):
+    if backend == "eager":
+        return model
+    if backend == "int8":
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "jit":
+        model.model.config.torchscript = True  # sorties en tuple pour le traçage
+        with torch.no_grad():
+            return torch.jit.trace(model, example)
+    raise ValueError(f"Backend inconnu : {backend}")
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024  # octets (macOS) / Ko (Linux)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def bench_one(cfg):
+    """Exécuté dans un processus dédié : renvoie les mesures d'une configuration."""
+    from transformers import AutoTokenizer
+
+    set_torch_threads(cfg["threads"], 1)
+    tokenizer = AutoTokenizer.from_pretrained(cfg["modelebase"], do_lower_case=True, use_fast=False)
+    model = torch.load(cfg["modele"], map_location=torch.device("cpu"), weights_only=False)
+    model.eval()
+
+    double = cfg["archi"] != "single"
+    _, x = load_exercises(cfg["testfile"], "instruction_hint_example", "statement")
+    start = time.perf_counter()
+    inputs = compute_input_arrays(x, ["instruction_hint_example", "statement"], tokenizer, cfg["seq_len"],
+                                  double=double, labels=False)
+    encode_seconds = time.perf_counter() - start
+
+    bs = cfg["batch_size"]
+    if double:
+        batches = [tuple([inputs[f"{k}_1"][i:i + bs], inputs[f"{k}_2"][i:i + bs]]
+                         for k in ("input_ids", "attention_mask", "token_type_ids"))
+                   for i in range(0, len(x), bs)]
+    else:
+        batches = [tuple(inputs[k][i:i + bs] for k in ("input_ids", "attention_mask", "token_type_ids"))
+                   for i in range(0, len(x), bs)]
+    model = make_backend(model, cfg["backend"], batches[0])
+
+    latencies = []
+    with torch.no_grad():
+        for batch in batches[:cfg["warmup"]]:
+            model(*batch)
+        for batch in batches:
+            t0 = time.perf_counter()
+            model(*batch)
+            latencies.append(time.perf_counter() - t0)
+
+    forward_seconds = sum(latencies)
+    return {
+        "archi": cfg["archi"], "batch_size": bs, "seq_len": cfg["seq_len"], "threads": cfg["threads"],
+        "backend": cfg["backend"],
+        "exercises": len(x),
+        "exercises_per_sec": len(x) / (encode_seconds + forward_seconds),
+        "forward_exercises_per_sec": len(x) / forward_seconds,
+        "encode_seconds": encode_seconds,
+        "batch_latency_p50_ms": 1000 * statistics.median(latencies),
+        "batch_latency_p99_ms": 1000 * percentile(latencies, 99),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def parse_list(value, cast=int):
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="tiny")
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--seq-lens", default="128,256")
+    parser.add_argument("--threads", default=str(os.cpu_count() or 1))
+    parser.add_argument("--backends", default="eager")
+    parser.add_argument("--archis", default="single", help=f"Architectures : {', '.join(ARCHIS)}")
+    parser.add_argument("--exercises", type=int, default=128, help="Exercices synthétiques par configuration")
+    parser.add_argument("--words", type=int, default=60, help="Mots par énoncé synthétique")
+    parser.add_argument("--warmup", type=int, default=2, help="Batchs de chauffe (non mesurés)")
+    parser.add_argument("--output", default=None, help="Fichier JSON (défaut : stdout)")
+    args = parser.parse_args()
+
+    backends = parse_list(args.backends, str)
+    for b in backends:
+        if b not in BACKENDS:
+            parser.error(f"backend inconnu : {b} (choix : {', '.join(BACKENDS)})")
+    seq_lens = parse_list(args.seq_lens)
+    archis = parse_list(args.archis, str)
+    for a in archis:
+        if a not in ARCHIS:
+            parser.error(f"architecture inconnue : {a} (choix : {', '.join(ARCHIS)})")
+        if a != "single" and "jit" in backends:
+            parser.error("le backend jit n'est disponible que pour l'architecture single")
+
+    with tempfile.TemporaryDirectory(prefix="malin-bench-") as work_dir:
+        print(f"*BUILD MODEL* preset={args.preset}", file=sys.stderr)
+        model_paths, modelebase = build_model(work_dir, args.preset, max(seq_lens), archis)
+        testfile = os.path.join(work_dir, "bench.tsv")
+        write_synthetic_tsv(testfile, args.exercises, args.words)
+
+        ctx = multiprocessing.get_context("spawn")
+        results = []
+        for archi, bs, seq_len, threads, backend in itertools.product(archis, parse_list(args.batch_sizes), seq_lens,
+                                                                     parse_list(args.threads), backends):
+            cfg = dict(modele=model_paths[archi], modelebase=modelebase, testfile=testfile, archi=archi,
+                       batch_size=bs, seq_len=seq_len, threads=threads, backend=backend, warmup=args.warmup)
+            with ctx.Pool(1) as pool:
+                res = pool.apply(bench_one, (cfg,))
+            results.append(res)
+            print(f"  {archi:<15} bs={bs:<3} len={seq_len:<4} threads={threads:<3} {backend:<6} -> "
+                  f"{res['exercises_per_sec']:.1f} ex/s, p50 {res['batch_latency_p50_ms']:.1f} ms, "
+                  f"p99 {res['batch_latency_p99_ms']:.1f} ms", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "preset": args.preset,
+            "exercises": args.exercises,
+            "words": args.words,
+            "torch": torch.__version__,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[OK] Résultats : {args.output}", file=sys.stderr)
+    else:
+        print(text)
@@ -27,6 +27,112 @@ import json
 
 from prepare_data import load_data
 from models_bert_torch import compute_input_arrays, MAX_SEQUENCE_LENGTH, SingleBert, DualBert, SiameseBert
+from prediction_cache import PredictionCache, model_id
+
+# LABELS RELANCE MARS 2025
+# TODO mettre à jour dynamiquement selon le modèle
+labelDict = {
+    'Associe': 0,
+    'AssocieCoche': 1,
+    'CM': 2,
+    'CacheIntrus': 3,
+    'Classe': 4,
+    'ClasseCM': 5,
+    'CliqueEcrire': 6,
+    'CocheGroupeMots': 7,
+    'CocheIntrus': 8,
+    'CocheLettre': 9,
+    'CocheMot': 10,
+    'CocheMot*': 11,
+    'CochePhrase': 12,
+    'Echange': 13,
+    'EditPhrase': 14,
+    'EditTexte': 15,
+    'ExpressionEcrite': 16,
+    'GenreNombre': 17,
+    'Phrases': 18,
+    'Question': 19,
+    'RC': 20,
+    'RCCadre': 21,
+    'RCDouble': 22,
+    'RCImage': 23,
+    'Texte': 24,
+    'Trait': 25,
+    'TransformeMot': 26,
+    'TransformePhrase': 27,
+    'VraiFaux': 28
+}
+inverseLabelDict = {v: k for k, v in labelDict.items()}
+
+def set_torch_threads(threads=None, interop_threads=None):
+    """Fixe explicitement le nombre de threads intra-op / inter-op de torch (None = défaut torch)."""
+    if threads:
+        torch.set_num_threads(threads)
+    if interop_threads:
+        # Doit être appelé avant tout travail parallèle inter-op
+        torch.set_num_interop_threads(interop_threads)
+
+
+def load_exercises(testfile, column1, column2):
+    """Lit le TSV d'exercices : renvoie (df_test complet, x_test avec les 2 colonnes d'entrée)."""
+    df_full = pd.read_csv(testfile, header=[0], sep="\t")  # Lecture du tsv en dataframe
+    df_test = load_data(df_full, ["textbook", "id", column1, column2], only_cats=[], merge_dict={})
+    x_test = df_test[[column1, column2]].fillna("")
+    return df_test, x_test
+
+
+def save_predictions(df_test, y_pred, pred_file_txt=None, pred_file_tsv=None):
+    """Sauvegarde des prédictions en txt (une par ligne) et/ou du df complet en tsv."""
+    df_test.loc[:, "pred"] = y_pred
+    # Écriture dans un .tmp puis renommage : un fichier de prédictions présent est complet
+    if pred_file_txt is not None:
+        with open(f"{pred_file_txt}.tmp", "w") as f:
+            for pred in y_pred:
+                f.write(f"{pred}\n")
+            # json.dump(y_pred, f, indent=4)
+        os.replace(f"{pred_file_txt}.tmp", pred_file_txt)
+        print("Saved in", pred_file_txt)
+    if pred_file_tsv is not None:
+        df_test.to_csv(f"{pred_file_tsv}.tmp", sep="\t", index=False)
+        os.replace(f"{pred_file_tsv}.tmp", pred_file_tsv)
+
+
+def load_model(modele, device):
+    """Charge le modèle fine-tuné (objet torch complet) sur le device."""
+    model = torch.load(modele, map_location=torch.device('cpu'), weights_only=False)
+    model.to(device)
+    model.eval()
+    return model
+
+
+def predict_logits(model, tokenizer, x, column1, column2, double, device, batch_size=1):
+    """Encode les exercices de x (df avec column1/column2) et renvoie les logits (np.array par exercice)."""
+    input_test = compute_input_arrays(x, [column1, column2], tokenizer, MAX_SEQUENCE_LENGTH, double=double,
+                                      labels=False)
+
+    eval_dataset = Dataset.from_dict(input_test)
+    eval_dataset.set_format(type="torch", device=device)
+    eval_dataloader = DataLoader(
+        eval_dataset,
+        sampler=SequentialSampler(eval_dataset),
+        batch_size=batch_size)
+
+    preds = []
+    for batch in eval_dataloader:
+        with torch.no_grad():
+            if double is True:
+                ids = [batch['input_ids_1'], batch['input_ids_2']]
+                mask = [batch['attention_mask_1'], batch['attention_mask_2']]
+                token_type_ids = [batch['token_type_ids_1'], batch['token_type_ids_2']]
+            else:
+                ids, mask, token_type_ids = batch['input_ids'], batch['attention_mask'], batch['token_type_ids']
+
+            outputs = model(ids, attention_mask=mask, token_type_ids=token_type_ids)  # scores
+
+            for pred in outputs.detach().cpu().numpy():
+                preds.append(pred)
+    return preds
+
 
 if __name__ == "__main__":
 
@@ -48,6 +154,9 @@ if __name__ == "__main__":
     # --bertarchi <single|dual|siamese>\
     # --ypredtxtfile <chemin de sauvegarde des prédictions seules en txt> (optionnel) \
     # --ypredtsvfile <chemin de sauvegarde du df complet avec les prédictions en tsv> (optionnel)
+    # --cache <base SQLite du cache de prédictions> (optionnel)
+    # --threads <threads intra-op torch> --interop-threads <threads inter-op torch> (optionnels)
+    # --concurrent-encoders (optionnel, bertarchi dual : 2 encodeurs en parallèle)
 
     # Exemple :
     # python3 ./src/inference.py
@@ -73,6 +182,11 @@ if __name__ == "__main__":
     parser.add_argument("-a", "--bertarchi")
     parser.add_argument("-txt", "--ypredtxtfile", default=None)
     parser.add_argument("-tsv", "--ypredtsvfile", default=None)
+    parser.add_argument("--cache", default=None, help="Base SQLite du cache de prédictions (optionnel)")
+    parser.add_argument("--threads", type=int, default=None, help="Threads intra-op torch (défaut : torch)")
+    parser.add_argument("--interop-threads", type=int, default=None, help="Threads inter-op torch (défaut : torch)")
+    parser.add_argument("--concurrent-encoders", action="store_true",
+                        help="bertarchi dual : exécuter les 2 encodeurs en parallèle")
 
     args = parser.parse_args()
     testfile = args.testfile
@@ -83,41 +197,9 @@ if __name__ == "__main__":
     bertarchi = args.bertarchi
     pred_file_txt = args.ypredtxtfile
     pred_file_tsv = args.ypredtsvfile
+    cache_file = args.cache
+    set_torch_threads(args.threads, args.interop_threads)
 
-    # LABELS RELANCE MARS 2025
-    # TODO mettre à jour dynamiquement selon le modèle
-    labelDict = {
-        'Associe': 0,
-        'AssocieCoche': 1,
-        'CM': 2,
-        'CacheIntrus': 3,
-        'Classe': 4,
-        'ClasseCM': 5,
-        'CliqueEcrire': 6,
-        'CocheGroupeMots': 7,
-        'CocheIntrus': 8,
-        'CocheLettre': 9,
-        'CocheMot': 10,
-        'CocheMot*': 11,
-        'CochePhrase': 12,
-        'Echange': 13,
-        'EditPhrase': 14,
-        'EditTexte': 15,
-        'ExpressionEcrite': 16,
-        'GenreNombre': 17,
-        'Phrases': 18,
-        'Question': 19,
-        'RC': 20,
-        'RCCadre': 21,
-        'RCDouble': 22,
-        'RCImage': 23,
-        'Texte': 24,
-        'Trait': 25,
-        'TransformeMot': 26,
-        'TransformePhrase': 27,
-        'VraiFaux': 28
-    }
-    inverseLabelDict = {v: k for k, v in labelDict.items()}
     labels = labelDict.keys()
     print("LABELS :")
     pprint(labelDict)
@@ -129,18 +211,9 @@ if __name__ == "__main__":
     else:
         double = True
 
-    # Tokenizer
-    print("TOKENIZER:")
-    tokenizer = AutoTokenizer.from_pretrained(modelebase, do_lower_case=True, use_fast=False)
-    print(tokenizer)
-    print()
-
     # Chargement des données en df avec les colonnes consigne + énoncé
     # TODO : charger le df directement sorti de la tâche d'extraction
-    ex_ids = pd.read_csv(testfile, sep='\t')['id'].tolist()
-    df_full = pd.read_csv(testfile, header=[0], sep="\t")  # Lecture du tsv en dataframe
-    df_test = load_data(df_full, ["textbook", "id", column1, column2], only_cats=[], merge_dict={})
-    x_test = df_test[[column1, column2]].fillna("")
+    df_test, x_test = load_exercises(testfile, column1, column2)
 
     print("INPUT DATA:")
     try:
@@ -150,64 +223,70 @@ if __name__ == "__main__":
         print(x_test.to_string().encode('ascii', 'replace').decode('ascii'))
     print()
 
-    print("*ENCODE DATA*")
-    input_test = compute_input_arrays(x_test, [column1, column2], tokenizer, MAX_SEQUENCE_LENGTH, double=double,
-                                      labels=False)
-    print()
-
-    eval_dataset = Dataset.from_dict(input_test)
-    eval_dataset.set_format(type="torch", device=device)
-    eval_dataloader = DataLoader(
-        eval_dataset,
-        sampler=SequentialSampler(eval_dataset),
-        batch_size=1)
-
-    ############# Modèle ################
-    print("*LOAD MODEL*")
-    print()
-
-    # if bertarchi == "single":
-    #     model = SingleBert(modele,labels)
-    # elif bertarchi == "dual":
-    #     model = DualBert(modele,labels)
-    # elif bertarchi == "siamese":
-    #     model = SiameseBert(modele,labels)
-    model = torch.load(modele, map_location=torch.device('cpu'), weights_only=False)
-    model.to(device)
-
-    # criterion = CrossEntropyLoss()
-
-    ############ Prediction #############
-    print("*PREDICT*")
-    print()
-
-    model.eval()
-    preds = []
-    pred_label_ids = []
-
-    # for batch in tqdm(eval_dataloader, desc="Evaluating"):
-    for batch in eval_dataloader:
-        with torch.no_grad():
-            if double is True:
-                ids = [batch['input_ids_1'], batch['input_ids_2']]
-                mask = [batch['attention_mask_1'], batch['attention_mask_2']]
-                token_type_ids = [batch['token_type_ids_1'], batch['token_type_ids_2']]
-                labels = batch["labels"]
-            else:
-                ids, mask, token_type_ids = batch['input_ids'], batch['attention_mask'], batch['token_type_ids']
-
-            outputs = model(ids, attention_mask=mask, token_type_ids=token_type_ids)  # scores
-
-            # compute the predictions
-            for pred in outputs.detach().cpu().numpy():
-                preds.append(pred)
-                pred_label_ids.append(pred.argmax(-1))
+    ############# Cache ################
+    # Les consignes se répètent d'une page et d'un manuel à l'autre : on ne passe au modèle
+    # que les exercices absents du cache (et une seule fois par texte identique)
+    cache = None
+    keys = None
+    cached = {}
+    if cache_file is not None:
+        cache = PredictionCache(cache_file, model_id(modele, bertarchi, MAX_SEQUENCE_LENGTH))
+        keys = [cache.key(t1, t2) for t1, t2 in zip(x_test[column1], x_test[column2])]
+        cached = cache.get_many(keys)
+        todo, seen = [], set()
+        for i, k in enumerate(keys):
+            if k not in cached and k not in seen:  # 1 seule occurrence par clé
+                seen.add(k)
+                todo.append(i)
+    else:
+        todo = list(range(len(x_test)))
+
+    logits = {}
+    if todo:
+        # Tokenizer
+        print("TOKENIZER:")
+        tokenizer = AutoTokenizer.from_pretrained(modelebase, do_lower_case=True, use_fast=False)
+        print(tokenizer)
+        print()
+
+        ############# Modèle ################
+        print("*LOAD MODEL*")
+        print()
+
+        # if bertarchi == "single":
+        #     model = SingleBert(modele,labels)
+        # elif bertarchi == "dual":
+        #     model = DualBert(modele,labels)
+        # elif bertarchi == "siamese":
+        #     model = SiameseBert(modele,labels)
+        model = load_model(modele, device)
+        if bertarchi == "dual":
+            model.concurrent = args.concurrent_encoders
+
+        # criterion = CrossEntropyLoss()
+
+        ############ Prediction #############
+        print("*ENCODE DATA* + *PREDICT*")
+        print()
+
+        preds = predict_logits(model, tokenizer, x_test.iloc[todo], column1, column2, double, device)
+        logits = dict(zip(todo, preds))
+
+    if cache is not None:
+        cache.put_many((keys[i], inverseLabelDict[int(pred.argmax(-1))], pred) for i, pred in logits.items())
+        by_key = {keys[i]: int(pred.argmax(-1)) for i, pred in logits.items()}
+        pred_label_ids = [by_key[k] if k in by_key else labelDict[cached[k][0]] for k in keys]
+        print(cache.report())
+        print()
+        cache.close()
+    else:
+        pred_label_ids = [int(logits[i].argmax(-1)) for i in range(len(x_test))]
 
     # convert ids to labels
     y_pred = [inverseLabelDict[id] for id in pred_label_ids]
 
-    # Merge in dataframe
-    df_test.loc[:, "pred"] = y_pred
+    # Merge in dataframe + sauvegarde (txt / tsv)
+    save_predictions(df_test, y_pred, pred_file_txt, pred_file_tsv)
     print("PREDICTIONS:")
     try:
         print(df_test.head(10))
@@ -215,15 +294,3 @@ if __name__ == "__main__":
         # On remplace les caractères spéciaux par des '?' juste pour l'affichage console
         print(df_test.head(10).to_string().encode('cp1252', 'replace').decode('cp1252'))
     print()
-
-    # Sauvegarde des prédictions en txt
-    if pred_file_txt is not None:
-        with open(pred_file_txt, "w") as f:
-            for pred in y_pred:
-                f.write(f"{pred}\n")
-            # json.dump(y_pred, f, indent=4)
-        print("Saved in", pred_file_txt)
-
-    # Sauvegarde des prédictions en tsv
-    if pred_file_tsv is not None:
-        df_test.to_csv(pred_file_tsv, sep="\t", index=False)
@@ -4,6 +4,8 @@ from torch.nn import Linear, Dropout
 
 from transformers import AutoConfig, CamembertModel, AutoModel
 
+from concurrent.futures import ThreadPoolExecutor
+
 # Variables globales
 global MAX_SEQUENCE_LENGTH
 MAX_SEQUENCE_LENGTH = 256 # pour truncation_strategy dans convert_to_transformer_inputs
@@ -129,6 +131,15 @@ def compute_input_arrays(df, columns, tokenizer, max_sequence_length, double=Tru
 
 ### CREATE MODELS
 
+# Thread dédié au 2e encodeur de DualBert (concurrent=True), créé à la demande
+_ENCODER_POOL = None
+
+def _encoder_pool():
+    global _ENCODER_POOL
+    if _ENCODER_POOL is None:
+        _ENCODER_POOL = ThreadPoolExecutor(max_workers=1)
+    return _ENCODER_POOL
+
 # Utilisation directe de CamembertForSequenceClassification, ou bien custom classes :
 
 class SingleBert(torch.nn.Module):
@@ -160,8 +171,11 @@ class SiameseBert(torch.nn.Module):
         _, output= self.model(ids, attention_mask = mask, token_type_ids = token_type_ids)
         return output
     def forward(self, ids, attention_mask, token_type_ids):
-        embedding_1 = self.model(ids[0], attention_mask = attention_mask[0], token_type_ids = token_type_ids[0])[0]
-        embedding_2 = self.model(ids[1], attention_mask = attention_mask[1], token_type_ids = token_type_ids[1])[0]
+        # Un seul appel à l'encodeur partagé : les 2 séquences (même longueur après padding)
+        # sont concaténées sur la dimension batch puis séparées avant le pooling
+        n = ids[0].shape[0]
+        embedding = self.model(cat([ids[0], ids[1]], 0), attention_mask = cat([attention_mask[0], attention_mask[1]], 0), token_type_ids = cat([token_type_ids[0], token_type_ids[1]], 0))[0] #torch.Size([32, 250, 768])
+        embedding_1, embedding_2 = embedding[:n], embedding[n:]
         pooled_output_1 = embedding_1.mean(axis=1) #torch.Size([16, 768])
         pooled_output_2 = embedding_2.mean(axis=1) #torch.Size([16, 768])
         pooled_output = cat([pooled_output_1,pooled_output_2],1) #torch.Size([16, 1536])
@@ -171,8 +185,9 @@ class SiameseBert(torch.nn.Module):
         return scores
 
 class DualBert(torch.nn.Module):
-    def __init__(self,modele,labels):
+    def __init__(self,modele,labels,concurrent=False):
         super().__init__()
+        self.concurrent = concurrent # exécuter les 2 encodeurs en parallèle
         config = AutoConfig.from_pretrained(modele)
         self.model_1 = CamembertModel.from_pretrained(modele)
         self.model_2 = CamembertModel.from_pretrained(modele)
@@ -180,8 +195,20 @@ class DualBert(torch.nn.Module):
         self.dense = Linear(2*config.hidden_size,config.hidden_size)
         self.classifier = Linear(config.hidden_size, len(labels)) # final layer
     def forward(self, ids, attention_mask, token_type_ids):
-        embedding_1 = self.model_1(ids[0], attention_mask = attention_mask[0], token_type_ids = token_type_ids[0])[0]
-        embedding_2 = self.model_2(ids[1], attention_mask = attention_mask[1], token_type_ids = token_type_ids[1])[0] #torch.Size([16, 250, 768])
+        # getattr : les modèles sauvegardés avant l'ajout de l'option n'ont pas l'attribut
+        if getattr(self, "concurrent", False):
+            # Les noyaux torch libèrent le GIL : l'encodeur 2 tourne dans un thread pendant l'encodeur 1.
+            # Le mode grad est propre à chaque thread : on reprend celui de l'appelant (torch.no_grad de l'inférence)
+            grad_enabled = torch.is_grad_enabled()
+            def encode_2():
+                with torch.set_grad_enabled(grad_enabled):
+                    return self.model_2(ids[1], attention_mask = attention_mask[1], token_type_ids = token_type_ids[1])
+            future_2 = _encoder_pool().submit(encode_2)
+            embedding_1 = self.model_1(ids[0], attention_mask = attention_mask[0], token_type_ids = token_type_ids[0])[0]
+            embedding_2 = future_2.result()[0]
+        else:
+            embedding_1 = self.model_1(ids[0], attention_mask = attention_mask[0], token_type_ids = token_type_ids[0])[0]
+            embedding_2 = self.model_2(ids[1], attention_mask = attention_mask[1], token_type_ids = token_type_ids[1])[0] #torch.Size([16, 250, 768])
         pooled_output_1 = embedding_1.mean(axis=1) #torch.Size([16, 768])
         pooled_output_2 = embedding_2.mean(axis=1) #torch.Size([16, 768])
         pooled_output = cat([pooled_output_1,pooled_output_2],1) #torch.Size([16, 1536])
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import unicodedata
+
+# Cache persistant des prédictions (SQLite).
+# Clé = hash(identifiant du modèle + consigne normalisée + énoncé normalisé)
+# Valeur = étiquette prédite + logits
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Normalise un texte d'exercice pour la clé de cache (Unicode NFC, espaces fusionnés)."""
+    if text is None or (isinstance(text, float) and text != text):  # None ou NaN pandas
+        return ""
+    text = unicodedata.normalize("NFC", str(text))
+    return _SPACES.sub(" ", text).strip()
+
+
+def model_id(modele, bertarchi, max_sequence_length):
+    """Identifiant du modèle : nom, taille et date du fichier de poids + architecture."""
+    stat = os.stat(modele)
+    return f"{os.path.basename(modele)}|{stat.st_size}|{stat.st_mtime_ns}|{bertarchi}|{max_sequence_length}"
+
+
+class PredictionCache:
+    def __init__(self, path, model_id):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.model_id = model_id
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "key TEXT PRIMARY KEY, label TEXT NOT NULL, logits TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS stats ("
+            "model_id TEXT PRIMARY KEY, hits INTEGER NOT NULL, misses INTEGER NOT NULL)"
+        )
+        self.conn.commit()
+
+    def key(self, text1, text2):
+        raw = "\x1f".join([self.model_id, normalize_text(text1), normalize_text(text2)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Renvoie {clé: (label, logits)} pour les clés présentes et met à jour les compteurs."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        # SQLite limite le nombre de paramètres par requête
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, label, logits FROM predictions WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for key, label, logits in rows:
+                found[key] = (label, json.loads(logits))
+        hits = sum(1 for k in keys if k in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, entries):
+        """entries : itérable de (clé, label, logits)."""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO predictions (key, label, logits) VALUES (?, ?, ?)",
+            [(k, label, json.dumps([float(x) for x in logits])) for k, label, logits in entries],
+        )
+        self.conn.commit()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self):
+        """Cumule les compteurs en base et renvoie un résumé (exécution + total)."""
+        self.conn.execute(
+            "INSERT INTO stats (model_id, hits, misses) VALUES (?, ?, ?) "
+            "ON CONFLICT(model_id) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+            (self.model_id, self.hits, self.misses),
+        )
+        self.conn.commit()
+        total_hits, total_misses = self.conn.execute(
+            "SELECT hits, misses FROM stats WHERE model_id = ?", (self.model_id,)
+        ).fetchone()
+        total = total_hits + total_misses
+        total_rate = total_hits / total if total else 0.0
+        return (f"CACHE : {self.hits} hits / {self.hits + self.misses} ({self.hit_rate:.1%}) - "
+                f"cumulé : {total_hits} / {total} ({total_rate:.1%})")
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,245 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import torch
+from transformers import AutoTokenizer
+
+from inference import labelDict, inverseLabelDict, load_model, predict_logits
+from models_bert_torch import MAX_SEQUENCE_LENGTH
+from prediction_cache import PredictionCache, model_id
+
+# Service local de classification : le modèle reste chargé en mémoire et les exercices
+# sont reçus en JSON. Les requêtes concurrentes sont regroupées en micro-batchs.
+
+# Run ce script avec :
+# python3 ./src/serve.py \
+# --modele modeles/ex_classif/saved_model_classification_ft_camembert.pt \
+# --modelebase modeles/camembert-base \
+# --bertarchi single \
+# --port 8765 --max-batch-size 32 --max-wait-ms 20 \
+# --cache cache/predictions.sqlite (optionnel)
+
+# Endpoints :
+# POST /classify  {"exercises": [{"id": "p9_ex1", "instruction_hint_example": "...", "statement": "..."}]}
+#              -> {"predictions": [{"id": "p9_ex1", "pred": "CM"}]}
+# GET  /health
+# GET  /metrics
+
+COLUMN1 = "instruction_hint_example"
+COLUMN2 = "statement"
+
+
+class Classifier:
+    """Modèle + tokenizer chargés une fois ; cache optionnel (ouvert dans le thread de batch)."""
+
+    def __init__(self, modele, modelebase, bertarchi, device, cache_file=None):
+        self.modele = modele
+        self.bertarchi = bertarchi
+        self.double = bertarchi != "single"
+        self.device = device
+        self.cache_file = cache_file
+        self.cache = None
+        self.tokenizer = AutoTokenizer.from_pretrained(modelebase, do_lower_case=True, use_fast=False)
+        self.model = load_model(modele, device)
+
+    def __call__(self, items):
+        """items : liste de (consigne, énoncé) -> liste d'étiquettes."""
+        if self.cache_file is not None and self.cache is None:
+            self.cache = PredictionCache(self.cache_file, model_id(self.modele, self.bertarchi, MAX_SEQUENCE_LENGTH))
+
+        cached = {}
+        keys = None
+        todo = list(range(len(items)))
+        if self.cache is not None:
+            keys = [self.cache.key(t1, t2) for t1, t2 in items]
+            cached = self.cache.get_many(keys)
+            todo = [i for i, k in enumerate(keys) if k not in cached]
+
+        labels = [None] * len(items)
+        if todo:
+            x = pd.DataFrame([items[i] for i in todo], columns=[COLUMN1, COLUMN2]).fillna("")
+            preds = predict_logits(self.model, self.tokenizer, x, COLUMN1, COLUMN2, self.double, self.device,
+                                   batch_size=len(todo))
+            for i, pred in zip(todo, preds):
+                labels[i] = inverseLabelDict[int(pred.argmax(-1))]
+            if self.cache is not None:
+                self.cache.put_many((keys[i], labels[i], pred) for i, pred in zip(todo, preds))
+        for i, k in enumerate(keys or []):
+            if k in cached:
+                labels[i] = cached[k][0]
+        return labels
+
+
+class _Job:
+    def __init__(self, items):
+        self.items = items
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """Regroupe les requêtes arrivées dans une fenêtre de max_wait_ms (jusqu'à max_batch_size exercices)."""
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=20):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "exercises": 0, "batches": 0, "errors": 0,
+                      "batch_seconds": 0.0, "max_batch_exercises": 0}
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, items):
+        job = _Job(items)
+        self.jobs.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _loop(self):
+        pending = None
+        while True:
+            batch = [pending or self.jobs.get()]
+            pending = None
+            size = len(batch[0].items)
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self.jobs.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if size + len(job.items) > self.max_batch_size:
+                    pending = job  # ouvrira le batch suivant
+                    break
+                batch.append(job)
+                size += len(job.items)
+            self._run(batch, size)
+
+    def _run(self, batch, size):
+        items = [item for job in batch for item in job.items]
+        start = time.perf_counter()
+        try:
+            labels = self.predict_fn(items) if items else []
+        except Exception as e:
+            for job in batch:
+                job.error = e
+                job.done.set()
+            with self.lock:
+                self.stats["errors"] += len(batch)
+            return
+        elapsed = time.perf_counter() - start
+
+        offset = 0
+        for job in batch:
+            job.result = labels[offset:offset + len(job.items)]
+            offset += len(job.items)
+            job.done.set()
+
+        with self.lock:
+            self.stats["requests"] += len(batch)
+            self.stats["exercises"] += size
+            self.stats["batches"] += 1
+            self.stats["batch_seconds"] += elapsed
+            self.stats["max_batch_exercises"] = max(self.stats["max_batch_exercises"], size)
+
+    def metrics(self):
+        with self.lock:
+            stats = dict(self.stats)
+        batches = stats["batches"] or 1
+        stats["mean_batch_exercises"] = stats["exercises"] / batches
+        stats["mean_batch_ms"] = 1000 * stats["batch_seconds"] / batches
+        stats["queue_depth"] = self.jobs.qsize()
+        return stats
+
+
+def make_handler(batcher, classifier, started_at):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok", "model": classifier.modele, "bertarchi": classifier.bertarchi,
+                                 "device": str(classifier.device)})
+            elif self.path == "/metrics":
+                metrics = batcher.metrics()
+                metrics["uptime_seconds"] = time.time() - started_at
+                if classifier.cache is not None:
+                    metrics["cache_hits"] = classifier.cache.hits
+                    metrics["cache_misses"] = classifier.cache.misses
+                    metrics["cache_hit_rate"] = classifier.cache.hit_rate
+                self._send(200, metrics)
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/classify":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                exercises = json.loads(self.rfile.read(length).decode("utf-8"))["exercises"]
+                items = [(ex.get(COLUMN1) or "", ex.get(COLUMN2) or "") for ex in exercises]
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                self._send(400, {"error": f"JSON invalide : {e}"})
+                return
+            try:
+                labels = batcher.submit(items)
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            self._send(200, {"predictions": [{"id": ex.get("id"), "pred": label}
+                                             for ex, label in zip(exercises, labels)]})
+
+        def log_message(self, format, *args):
+            pass  # pas de log par requête
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--modele")
+    parser.add_argument("-mb", "--modelebase")
+    parser.add_argument("-a", "--bertarchi", default="single")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--cache", default=None, help="Base SQLite du cache de prédictions (optionnel)")
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print("GPU available :", device)
+    print(f"LABELS : {len(labelDict)}")
+
+    print("*LOAD MODEL*")
+    classifier = Classifier(args.modele, args.modelebase, args.bertarchi, device, cache_file=args.cache)
+    batcher = MicroBatcher(classifier, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(batcher, classifier, time.time()))
+    print(f"[OK] Service de classification sur http://{args.host}:{args.port} "
+          f"(batch <= {args.max_batch_size}, fenêtre {args.max_wait_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
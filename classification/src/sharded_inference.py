@@ -0,0 +1,226 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import time
+from pathlib import Path
+
+import pandas as pd
+import torch
+from transformers import AutoTokenizer
+
+from inference import (inverseLabelDict, load_exercises, load_model, predict_logits, save_predictions,
+                       set_torch_threads)
+from models_bert_torch import MAX_SEQUENCE_LENGTH
+from prediction_cache import PredictionCache, model_id
+
+# Classification multi-cœurs : les exercices de toutes les pages d'un document sont découpés
+# en K shards, traités par K processus (T threads torch chacun), puis les prédictions sont
+# réécrites par page (pred_page_N.txt / pred_page_N.tsv, même format que inference.py).
+
+# Run ce script avec :
+# python3 ./src/sharded_inference.py run \
+# --inputdir ../extractionOut --outputdir ../classificationOut \
+# --modele modeles/ex_classif/saved_model_classification_ft_camembert.pt \
+# --modelebase modeles/camembert-base --bertarchi single \
+# --workers 4 --threads 2
+#
+# Choix automatique de K x T pour la machine :
+# python3 ./src/sharded_inference.py autotune --inputdir ../extractionOut \
+# --modele ... --modelebase ... --bertarchi single --output autotune.json
+
+COLUMN1 = "instruction_hint_example"
+COLUMN2 = "statement"
+
+WORKER_START_TIMEOUT = 900  # secondes pour charger le modèle dans chaque worker
+
+# État d'un processus worker (initialisé une fois par processus)
+_worker = {}
+
+
+def _init_worker(modele, modelebase, bertarchi, threads, interop_threads, batch_size, ready):
+    set_torch_threads(threads, interop_threads)
+    _worker["batch_size"] = batch_size
+    _worker["tokenizer"] = AutoTokenizer.from_pretrained(modelebase, do_lower_case=True, use_fast=False)
+    _worker["model"] = load_model(modele, torch.device("cpu"))
+    _worker["double"] = bertarchi != "single"
+    ready.wait()  # le chronométrage ne commence qu'une fois tous les modèles chargés
+
+
+def _predict_shard(x):
+    return predict_logits(_worker["model"], _worker["tokenizer"], x, COLUMN1, COLUMN2, _worker["double"],
+                          torch.device("cpu"), batch_size=_worker["batch_size"])
+
+
+def page_sort_key(path):
+    m = re.search(r"(\d+)", path.stem)
+    return (int(m.group(1)) if m else 0, path.name)
+
+
+def list_tsv_files(inputdir):
+    files = [f for f in Path(inputdir).glob("*.tsv") if not f.name.startswith("pred_")]
+    return sorted(files, key=page_sort_key)
+
+
+def make_shards(n, workers, batch_size):
+    """Découpe [0, n) en au plus `workers` intervalles contigus alignés sur batch_size.
+
+    Les lots (batchs) sont donc identiques quel que soit K : sortie déterministe.
+    """
+    n_batches = -(-n // batch_size)
+    per_shard = -(-n_batches // max(1, workers))
+    shards = []
+    for b in range(0, n_batches, per_shard or 1):
+        start, end = b * batch_size, min(n, (b + per_shard) * batch_size)
+        if start < end:
+            shards.append((start, end))
+    return shards
+
+
+def run_shards(x, modele, modelebase, bertarchi, workers, threads, interop_threads=1, batch_size=8):
+    """Prédit les logits de x (df COLUMN1/COLUMN2) sur K processus ; renvoie (logits, secondes de calcul)."""
+    shards = make_shards(len(x), workers, batch_size)
+    if not shards:
+        return [], 0.0
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Barrier(len(shards) + 1)
+    with ctx.Pool(len(shards), initializer=_init_worker,
+                  initargs=(modele, modelebase, bertarchi, threads, interop_threads, batch_size, ready)) as pool:
+        ready.wait(timeout=WORKER_START_TIMEOUT)
+        start = time.perf_counter()
+        results = pool.map(_predict_shard, [x.iloc[a:b] for a, b in shards], chunksize=1)
+        elapsed = time.perf_counter() - start
+    return [pred for shard in results for pred in shard], elapsed
+
+
+def run(args):
+    files = list_tsv_files(args.inputdir)
+    if not files:
+        print("[WARN] Aucun fichier .tsv d'origine trouvé.")
+        return
+    os.makedirs(args.outputdir, exist_ok=True)
+
+    # 1. Chargement de toutes les pages dans l'ordre
+    pages = []
+    for f in files:
+        df_test, x_test = load_exercises(str(f), COLUMN1, COLUMN2)
+        pages.append((f, df_test, x_test))
+    x_all = [row for _, _, x in pages for row in x.itertuples(index=False, name=None)]
+    print(f"--- {len(files)} pages, {len(x_all)} exercices ---")
+
+    # 2. Cache : seuls les exercices absents (et distincts) partent aux workers
+    labels = [None] * len(x_all)
+    todo = list(range(len(x_all)))
+    cache = None
+    if args.cache is not None:
+        cache = PredictionCache(args.cache, model_id(args.modele, args.bertarchi, MAX_SEQUENCE_LENGTH))
+        keys = [cache.key(t1, t2) for t1, t2 in x_all]
+        cached = cache.get_many(keys)
+        todo, seen = [], set()
+        for i, k in enumerate(keys):
+            if k in cached:
+                labels[i] = cached[k][0]
+            elif k not in seen:
+                seen.add(k)
+                todo.append(i)
+
+    # 3. Prédiction shardée
+    if todo:
+        x = pd.DataFrame([x_all[i] for i in todo], columns=[COLUMN1, COLUMN2])
+        print(f"*PREDICT* {len(todo)} exercices sur {args.workers} workers x {args.threads} threads")
+        preds, elapsed = run_shards(x, args.modele, args.modelebase, args.bertarchi, args.workers,
+                                    args.threads, args.interop_threads, args.batchsize)
+        if elapsed:
+            print(f"[INFO] {len(todo) / elapsed:.1f} exercices/s")
+        by_index = {i: inverseLabelDict[int(pred.argmax(-1))] for i, pred in zip(todo, preds)}
+        for i, label in by_index.items():
+            labels[i] = label
+        if cache is not None:
+            by_key = {keys[i]: label for i, label in by_index.items()}
+            cache.put_many((keys[i], by_index[i], pred) for i, pred in zip(todo, preds))
+            labels = [by_key.get(k, label) for k, label in zip(keys, labels)]
+
+    if cache is not None:
+        print(cache.report())
+        cache.close()
+
+    # 4. Réécriture par page
+    offset = 0
+    for f, df_test, x_test in pages:
+        y_pred = labels[offset:offset + len(x_test)]
+        offset += len(x_test)
+        save_predictions(df_test, y_pred,
+                         os.path.join(args.outputdir, f"pred_{f.stem}.txt"),
+                         os.path.join(args.outputdir, f"pred_{f.stem}.tsv"))
+    print(f"[OK] Prédictions écrites dans {args.outputdir}")
+
+
+def candidate_configs(cpus):
+    """Combinaisons K x T avec K * T <= nombre de cœurs."""
+    configs = []
+    k = 1
+    while k <= cpus:
+        configs.append((k, max(1, cpus // k)))
+        k *= 2
+    return configs
+
+
+def autotune(args):
+    files = list_tsv_files(args.inputdir)
+    rows = [row for f in files for row in load_exercises(str(f), COLUMN1, COLUMN2)[1].itertuples(index=False, name=None)]
+    if not rows:
+        print("[WARN] Aucun exercice pour l'auto-tuning.")
+        return
+    while len(rows) < args.sample:
+        rows = rows + rows
+    x = pd.DataFrame(rows[:args.sample], columns=[COLUMN1, COLUMN2])
+
+    cpus = args.cpus or os.cpu_count() or 1
+    results = []
+    for workers, threads in candidate_configs(cpus):
+        _, elapsed = run_shards(x, args.modele, args.modelebase, args.bertarchi, workers, threads,
+                                args.interop_threads, args.batchsize)
+        rate = len(x) / elapsed if elapsed else 0.0
+        results.append({"workers": workers, "threads": threads, "exercises_per_sec": rate})
+        print(f"  K={workers:<3} T={threads:<3} -> {rate:.1f} exercices/s")
+
+    best = max(results, key=lambda r: r["exercises_per_sec"])
+    print(f"[OK] Meilleure configuration : --workers {best['workers']} --threads {best['threads']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"cpus": cpus, "sample": len(x), "batchsize": args.batchsize,
+                       "best": best, "results": results}, f, indent=2)
+        print(f"[OK] Résultats : {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def common(p):
+        p.add_argument("--inputdir", required=True, help="Dossier des TSV d'exercices (extractionOut)")
+        p.add_argument("-m", "--modele", required=True)
+        p.add_argument("-mb", "--modelebase", required=True)
+        p.add_argument("-a", "--bertarchi", default="single")
+        p.add_argument("--batchsize", type=int, default=8)
+        p.add_argument("--interop-threads", type=int, default=1)
+
+    p_run = sub.add_parser("run", help="Classer toutes les pages d'un document")
+    common(p_run)
+    p_run.add_argument("--outputdir", required=True)
+    p_run.add_argument("--workers", type=int, default=1)
+    p_run.add_argument("--threads", type=int, default=max(1, os.cpu_count() or 1))
+    p_run.add_argument("--cache", default=None, help="Base SQLite du cache de prédictions (optionnel)")
+
+    p_tune = sub.add_parser("autotune", help="Choisir K x T pour la machine")
+    common(p_tune)
+    p_tune.add_argument("--sample", type=int, default=128, help="Nombre d'exercices mesurés")
+    p_tune.add_argument("--cpus", type=int, default=None, help="Cœurs à utiliser (défaut : tous)")
+    p_tune.add_argument("--output", default=None, help="Fichier JSON des résultats")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        autotune(args)
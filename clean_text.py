@@ -1,33 +1,30 @@
 import os
 import json
 import sys
-from pathlib import Path
+
+from docstore import open_store
+from workspace import work_dir
 
 # --- FIX WINDOWS ENCODING ---
 if sys.platform == "win32":
     sys.stdout.reconfigure(encoding='utf-8')
 
 
+# Espaces fins / insécables -> espace normal, en un seul passage str.translate
+SPACE_TABLE = str.maketrans({
+    '\u2009': ' ',  # THSB (Thin Space)
+    '\u202F': ' ',  # NNBSP (Narrow No-Break Space)
+    '\u00A0': ' ',  # NBSP (Non-Breaking Space classique)
+})
+
+
 def clean_string(text):
     """
     Remplace les espaces insécables et fins par des espaces normaux.
     """
     if not isinstance(text, str):
         return text
-
-    replacements = {
-        '\u2009': ' ',  # THSB (Thin Space)
-        '\u202F': ' ',  # NNBSP (Narrow No-Break Space)
-        '\u00A0': ' ',  # NBSP (Non-Breaking Space classique)
-        ' ': ' ',  # Caractère littéral THSB
-        ' ': ' '  # Caractère littéral NNBSP
-    }
-
-    cleaned = text
-    for char, replacement in replacements.items():
-        cleaned = cleaned.replace(char, replacement)
-
-    return cleaned
+    return text.translate(SPACE_TABLE)
 
 
 def recursive_clean(data):
@@ -44,9 +41,26 @@ def recursive_clean(data):
         return data
 
 
+def process_store_cleaning(store):
+    """Même nettoyage sur les exercices en base (objets JSON et colonnes TSV)."""
+    pages = store.pages("exercises")
+    print(f"[INFO] Nettoyage de {len(pages)} pages dans {store.path}...")
+    for page in pages:
+        store.put_exercises(page, recursive_clean(store.get_exercises(page)),
+                            [recursive_clean(r) for r in store.exercise_rows(page)])
+    print(f"[OK] {len(pages)} pages nettoyées (THSB/NNBSP retirés).")
+
+
 def process_cleaning():
-    base_dir = Path(__file__).resolve().parent
-    extraction_dir = base_dir / "extractionOut"
+    # Les nouvelles extractions sont déjà nettoyées à l'écriture (extraction-gemini-vision.py) :
+    # ce script sert aux rattrapages sur des sorties plus anciennes.
+    store = open_store()
+    if store is not None:
+        process_store_cleaning(store)
+        store.close()
+        return
+
+    extraction_dir = work_dir() / "extractionOut"
 
     if not extraction_dir.exists():
         print(f"[ERR] Dossier introuvable : {extraction_dir}")
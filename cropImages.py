@@ -1,8 +1,22 @@
-from pathlib import Path
+import argparse
 import cv2
 import json
 
-base_dir = Path(__file__).resolve().parent
+from crop_geometry import pdf_renderable, raster_box_to_pdf_rect
+from docstore import open_store, page_of
+from memory_budget import release_buffers
+from workspace import atomic_open, page_selected, work_dir
+
+# Par défaut, les découpes sont prises dans le raster de files/ (résolution de pdfToImages.py).
+# Avec --pdf, chaque zone détectée est rendue directement depuis le PDF à --dpi (PyMuPDF, clip) :
+# le raster de la page peut alors rester en basse résolution pour YOLO et Gemini (main.py --crop-dpi).
+parser = argparse.ArgumentParser()
+parser.add_argument("--pdf", type=str, default=None, help="PDF source : découpes rendues depuis le PDF")
+parser.add_argument("--dpi", type=int, default=450, help="Résolution des découpes rendues depuis le PDF")
+args = parser.parse_args()
+
+# Dossier de travail (MALIN_WORKDIR, défaut : dossier du script)
+base_dir = work_dir()
 
 # Paths
 files_dir = base_dir / "files"
@@ -10,29 +24,75 @@ detnum_folder = base_dir / "output" / "detImages" / "predict"
 crop_folder = detnum_folder / "crops"
 crop_folder.mkdir(exist_ok=True, parents=True)
 
-# Get all JSON files
-json_files = list(detnum_folder.glob("*.json"))
+# Stockage unique du document (MALIN_STORE) : détections lues en base
+store = open_store()
+
+# Get all JSON files (ou les pages avec détections en base)
+if store is not None:
+    stems = [f"page_{page}" for page in store.pages("shapes")]
+else:
+    stems = [json_file.stem for json_file in detnum_folder.glob("*.json")]
+stems = [stem for stem in stems if page_selected(page_of(stem))]  # MALIN_PAGES
+
+
+def load_detection(stem):
+    if store is not None:
+        return store.get_shapes(page_of(stem))
+    with open(detnum_folder / f"{stem}.json", "r", encoding="utf-8") as jf:
+        return json.load(jf)
+
 
-for json_file in json_files:
+def crop_from_pdf(page, data, page_num):
+    """Découpes rendues depuis le PDF à args.dpi, sans décoder le raster de la page."""
+    for shape in data["shapes"]:
+        clip = raster_box_to_pdf_rect(page, shape["points"], data["imageWidth"], data["imageHeight"])
+        if clip.is_empty:
+            continue
+        pix = page.get_pixmap(dpi=args.dpi, clip=clip)
+        crop_name = f"p{page_num}c{shape['id']}.png"
+        with atomic_open(crop_folder / crop_name, "wb") as f:
+            f.write(pix.tobytes("png"))
+        pix = None
+        print(f"[OK] Saved crop: {crop_name} ({args.dpi} dpi)")
+
+
+pdf_doc = None
+if args.pdf:
+    import fitz  # PyMuPDF, déjà requis par pdfToTxtStyle.py
+
+    pdf_doc = fitz.open(args.pdf)
+
+for stem in stems:
     # Always map JSON -> .png from original files
-    image_name_png = json_file.stem + ".png"
+    image_name_png = stem + ".png"
     image_path = files_dir / image_name_png
 
     if not image_path.exists():
-        print(f"[ERR] Image not found for {json_file.name}")
+        print(f"[ERR] Image not found for {stem}")
         continue
 
-    # Load original image
-    img = cv2.imread(str(image_path))
-    h, w = img.shape[:2]
-
     # Extract page number
-    stem = json_file.stem
     page_num = stem.split("_")[-1]
 
     # Read JSON
-    with open(json_file, "r", encoding="utf-8") as jf:
-        data = json.load(jf)
+    data = load_detection(stem)
+    if not data or not data["shapes"]:
+        continue  # page sans détection
+
+    if pdf_doc is not None:
+        page = pdf_doc[int(page_num) - 1]
+        if pdf_renderable(page, data):
+            crop_from_pdf(page, data, page_num)
+            page = None
+            release_buffers()
+            continue
+        print(f"[INFO] {stem} : page pivotée ou raster différent de la MediaBox, découpes prises dans le raster")
+
+    # Load original image
+    img = cv2.imread(str(image_path))
+    h, w = img.shape[:2]
+
+    if data is not None:
         for shape in data["shapes"]:
             (x_min, y_min), (x_max, y_max) = shape["points"]
 
@@ -51,3 +111,10 @@ for json_file in json_files:
             crop_name = f"p{page_num}c{shape_id}.png"
             cv2.imwrite(str(crop_folder / crop_name), roi)
             print(f"[OK] Saved crop: {crop_name}")
+
+    # Mode mémoire bornée : page libérée avant de décoder la suivante
+    img = roi = None  # roi est une vue qui garderait la page en mémoire
+    release_buffers()
+
+if pdf_doc is not None:
+    pdf_doc.close()
@@ -0,0 +1,35 @@
+# Correspondance entre le raster d'une page (files/page_N.png) et les coordonnées PyMuPDF de la page,
+# pour rendre les découpes depuis le PDF (cropImages.py --pdf).
+#
+# Ghostscript (pdfToImages.py, sans -dUseCropBox) rend la MediaBox entière, alors que les coordonnées
+# de page PyMuPDF partent du coin haut gauche de la CropBox (page.rect) : un pixel du raster est d'abord
+# ramené en points de la MediaBox, puis décalé de la position de la CropBox (page.cropbox_position).
+
+
+def raster_box_to_pdf_rect(page, points, image_width, image_height):
+    """Boîte en pixels du raster de la page -> rectangle en coordonnées PyMuPDF de la page.
+
+    Le raster couvre toute la MediaBox : l'échelle est la taille de la MediaBox (points) sur la taille
+    de l'image (pixels), quelle que soit la résolution du rendu. Le rectangle est limité à la page visible.
+    """
+    import fitz  # PyMuPDF, déjà requis par pdfToTxtStyle.py
+
+    (x_min, y_min), (x_max, y_max) = points
+    media = page.mediabox_size
+    offset = page.cropbox_position
+    sx = media.x / image_width
+    sy = media.y / image_height
+    rect = fitz.Rect(x_min * sx - offset.x, y_min * sy - offset.y, x_max * sx - offset.x, y_max * sy - offset.y)
+    return rect & page.rect
+
+
+def pdf_renderable(page, data):
+    """Le raster correspond-il à la MediaBox de la page (mêmes proportions, pas de rotation) ?
+
+    Sinon (page pivotée, raster d'une autre origine), découpe depuis le raster.
+    """
+    if page.rotation:
+        return False
+    media = page.mediabox_size
+    raster_ratio = data["imageWidth"] / data["imageHeight"]
+    return abs(raster_ratio / (media.x / media.y) - 1) < 0.01
@@ -1,105 +1,126 @@
-from ultralytics import YOLO
 from pathlib import Path
-import cv2
+import argparse
 import json
 
-# Base directory = dossier du script
+from PIL import Image
+
+from docstore import open_store, page_of
+from memory_budget import page_budget, release_buffers
+from workspace import atomic_open, page_selected, work_dir
+
+# Base directory = dossier du script (modèles) ; données dans le dossier de travail
 base_dir = Path(__file__).resolve().parent
+data_dir = work_dir()
 
 # Directories
-files_dir = base_dir / "files"
+files_dir = data_dir / "files"
 models_dir = base_dir / "models"
-output_dir = base_dir / "output"
-output_dir.mkdir(exist_ok=True)
+output_dir = data_dir / "output"
 
 # Classes per model
 classes_dict = {
     "detImages": ["image"],
 }
 
-# Get all PNG files
-images = list(files_dir.glob("*.png"))
-
 # Model paths (RELATIVE)
 model_paths = {
     "detImages": models_dir / "detImages.pt",
 }
 
-run_folders = []
 
 # Step 1: Detection
-for model_name, model_path in model_paths.items():
-    print(f"\n=== Loading model {model_name} ===")
-    model = YOLO(str(model_path))
-
-    model_output_dir = output_dir / model_name
-    model_output_dir.mkdir(exist_ok=True, parents=True)
-
-    for image_path in images:
-        print(f"Processing {image_path.name} with {model_name}...")
-        _ = model.predict(
-            source=str(image_path),
-            save=True,
-            save_txt=True,
-            project=str(model_output_dir),
-            name="predict",
-            exist_ok=True
-        )
-
-    run_folders.append((model_name, model_output_dir))
-    print(f"==> {model_name} finished\n")
+def run_detection(images):
+    """Prédictions YOLO (images annotées + labels .txt) dans output/<modèle>/predict."""
+    from ultralytics import YOLO
+
+    run_folders = []
+    for model_name, model_path in model_paths.items():
+        print(f"\n=== Loading model {model_name} ===")
+        model = YOLO(str(model_path))
+
+        model_output_dir = output_dir / model_name
+        model_output_dir.mkdir(exist_ok=True, parents=True)
+
+        # YOLO ouvre les labels .txt en ajout : une page relancée (reprise) repart de zéro
+        for p in images:
+            (model_output_dir / "predict" / "labels" / f"{p.stem}.txt").unlink(missing_ok=True)
+
+        # Lots de N pages (mode mémoire bornée, MALIN_MAX_PAGES), sinon page par page.
+        # stream=True : les résultats (image décodée + image annotée) ne sont pas gardés
+        # après sauvegarde des sorties.
+        chunk = page_budget() or 1
+        for start in range(0, len(images), chunk):
+            batch = images[start:start + chunk]
+            print(f"Processing {', '.join(p.name for p in batch)} with {model_name}...")
+            for _ in model.predict(
+                source=[str(p) for p in batch] if len(batch) > 1 else str(batch[0]),
+                batch=len(batch),
+                stream=True,
+                save=True,
+                save_txt=True,
+                project=str(model_output_dir),
+                name="predict",
+                exist_ok=True
+            ):
+                pass
+            release_buffers()
+
+        run_folders.append((model_name, model_output_dir))
+        print(f"==> {model_name} finished\n")
+    return run_folders
+
 
 # Step 2: TXT → JSON
-for model_name, run_folder in run_folders:
+def labels_to_json(model_name, run_folder, store=None):
     labels_dir = run_folder / "predict" / "labels"
     images_dir = run_folder / "predict"
 
-    if not labels_dir.exists():
-        print(f"No labels found for {model_name}")
-        continue
+    if not images_dir.exists():
+        print(f"No predictions found for {model_name}")
+        return
 
     print(f"Transforming labels to JSON for {model_name}")
 
-    for txt_file in labels_dir.glob("*.txt"):
-
-        image_path = images_dir / f"{txt_file.stem}.jpg"
-        if not image_path.exists():
-            image_path = images_dir / f"{txt_file.stem}.png"
-        if not image_path.exists():
-            continue
-
-        img = cv2.imread(str(image_path))
-        if img is None:
+    # Une détection (JSON ou base) par image prédite, shapes vide sans label : YOLO n'écrit pas de .txt
+    # pour une page sans détection, et la reprise (run_manifest.py) attend ce JSON, écrit en dernier
+    for image_path in sorted(images_dir.glob("page_*.png")) + sorted(images_dir.glob("page_*.jpg")):
+        if not page_selected(page_of(image_path.stem)):
+            continue  # MALIN_PAGES
+        txt_file = labels_dir / f"{image_path.stem}.txt"
+
+        # Dimensions lues dans l'en-tête de l'image, sans décoder la page
+        try:
+            with Image.open(image_path) as img:
+                w, h = img.size
+        except OSError:
             print(f"[WARN] Could not read image: {image_path}")
             continue
 
-        h, w = img.shape[:2]
-
         shapes = []
-        with open(txt_file, "r") as f:
-            for idx, line in enumerate(f.readlines()):
-                cls, x_c, y_c, bw, bh = map(float, line.strip().split())
-                cls = int(cls)
-
-                x_center = x_c * w
-                y_center = y_c * h
-                width = bw * w
-                height = bh * h
-
-                x_min = x_center - width / 2
-                y_min = y_center - height / 2
-                x_max = x_center + width / 2
-                y_max = y_center + height / 2
-
-                shape = {
-                    "id": idx,
-                    "label": classes_dict.get(model_name, [str(cls)])[cls],
-                    "points": [
-                        [x_min, y_min],
-                        [x_max, y_max]
-                    ]
-                }
-                shapes.append(shape)
+        lines = txt_file.read_text().splitlines() if txt_file.exists() else []
+        for idx, line in enumerate(lines):
+            cls, x_c, y_c, bw, bh = map(float, line.strip().split())
+            cls = int(cls)
+
+            x_center = x_c * w
+            y_center = y_c * h
+            width = bw * w
+            height = bh * h
+
+            x_min = x_center - width / 2
+            y_min = y_center - height / 2
+            x_max = x_center + width / 2
+            y_max = y_center + height / 2
+
+            shape = {
+                "id": idx,
+                "label": classes_dict.get(model_name, [str(cls)])[cls],
+                "points": [
+                    [x_min, y_min],
+                    [x_max, y_max]
+                ]
+            }
+            shapes.append(shape)
 
         json_dict = {
             "shapes": shapes,
@@ -107,8 +128,42 @@ for model_name, run_folder in run_folders:
             "imageWidth": w
         }
 
+        page = page_of(txt_file.stem)
+        if store is not None and page is not None:
+            store.put_shapes(page, json_dict)
+            print(f"[OK] Saved shapes: {txt_file.stem} -> {store.path}")
+            continue
+
         json_path = images_dir / f"{txt_file.stem}.json"
-        with open(json_path, "w", encoding="utf-8") as jf:
+        with atomic_open(json_path, "w", encoding="utf-8") as jf:
             json.dump(json_dict, jf, ensure_ascii=False, indent=2)
 
         print(f"[OK] Saved JSON: {json_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels-only", action="store_true",
+                        help="Convertir les labels YOLO déjà présents en JSON, sans relancer la détection")
+    args = parser.parse_args()
+
+    output_dir.mkdir(exist_ok=True)
+
+    # Stockage unique du document (MALIN_STORE) : détections en base au lieu des JSON
+    store = open_store()
+
+    if args.labels_only:
+        run_folders = [(model_name, output_dir / model_name) for model_name in model_paths]
+    else:
+        # Get all PNG files
+        run_folders = run_detection([p for p in files_dir.glob("*.png") if page_selected(page_of(p.stem))])
+
+    for model_name, run_folder in run_folders:
+        labels_to_json(model_name, run_folder, store)
+
+    if store is not None:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
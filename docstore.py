@@ -0,0 +1,198 @@
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+
+# Stockage optionnel des artefacts intermédiaires d'un document dans une seule base SQLite,
+# au lieu des petits fichiers par page (files_style/page_N.csv, détections JSON,
+# extractionOut/page_N.json|tsv, pred_page_N.tsv, --style.json) relus et re-parsés à chaque étape.
+# Tables typées, indexées par numéro de page : lines, shapes, exercises, predictions, styled.
+#
+# Activé par la variable d'environnement MALIN_STORE (chemin de la base), cf. main.py --store.
+# Sans MALIN_STORE, open_store() renvoie None et les scripts gardent leurs fichiers.
+
+STORE_ENV = "MALIN_STORE"
+
+LINE_COLUMNS = ["phrase", "font_family", "size", "color_hex", "style_tag", "overrides"]
+
+# Colonnes du TSV de classification (cf. convert_json_to_tsv dans exercises_tsv.py)
+TSV_COLUMNS = ["textbook", "id", "full_ex", "num", "indicator", "instruction", "hint", "example",
+               "statement", "instruction_hint_example", "label", "grandtype", "stratify_key"]
+EXERCISE_COLUMNS = ["id", "num", "instruction", "hint", "example", "statement", "instruction_hint_example",
+                    "full_ex"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page INTEGER NOT NULL, kind TEXT NOT NULL,
+    PRIMARY KEY (page, kind));
+CREATE TABLE IF NOT EXISTS lines (
+    page INTEGER NOT NULL, line INTEGER NOT NULL,
+    phrase TEXT NOT NULL, font_family TEXT, size REAL, color_hex TEXT, style_tag TEXT, overrides TEXT,
+    PRIMARY KEY (page, line));
+CREATE TABLE IF NOT EXISTS shapes (
+    page INTEGER NOT NULL, shape_id INTEGER NOT NULL, label TEXT,
+    x_min REAL, y_min REAL, x_max REAL, y_max REAL, image_width INTEGER, image_height INTEGER,
+    PRIMARY KEY (page, shape_id));
+CREATE TABLE IF NOT EXISTS exercises (
+    page INTEGER NOT NULL, position INTEGER NOT NULL, id TEXT,
+    num TEXT, instruction TEXT, hint TEXT, example TEXT, statement TEXT,
+    instruction_hint_example TEXT, full_ex TEXT, data TEXT NOT NULL,
+    PRIMARY KEY (page, position));
+CREATE INDEX IF NOT EXISTS exercises_id ON exercises (page, id);
+CREATE TABLE IF NOT EXISTS predictions (
+    page INTEGER NOT NULL, id TEXT NOT NULL, pred TEXT NOT NULL,
+    PRIMARY KEY (page, id));
+CREATE TABLE IF NOT EXISTS styled (
+    page INTEGER NOT NULL, position INTEGER NOT NULL, data TEXT NOT NULL,
+    PRIMARY KEY (page, position));
+"""
+
+
+def page_of(name):
+    """Numéro de page d'un nom de fichier ou d'un stem (page_9.png, page_9 -> 9)."""
+    m = re.search(r"page_(\d+)", str(name))
+    return int(m.group(1)) if m else None
+
+
+def open_store():
+    """DocStore de MALIN_STORE, ou None si le stockage unique n'est pas activé."""
+    path = os.environ.get(STORE_ENV)
+    return DocStore(path) if path else None
+
+
+class DocStore:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        # timeout : style-post peut écrire depuis plusieurs processus
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def _replace_page(self, table, page, columns, rows):
+        """Remplace toutes les lignes d'une page dans une table (une transaction) et marque la page produite."""
+        with self.conn:
+            self.conn.execute(f"DELETE FROM {table} WHERE page = ?", (page,))
+            self.conn.executemany(
+                f"INSERT INTO {table} (page, {', '.join(columns)}) VALUES (?, {', '.join('?' * len(columns))})",
+                [(page, *row) for row in rows],
+            )
+            self.conn.execute("INSERT OR IGNORE INTO pages (page, kind) VALUES (?, ?)", (page, table))
+
+    def pages(self, kind):
+        """Pages produites pour un type d'artefact (lines, shapes, exercises, predictions, styled), triées."""
+        rows = self.conn.execute("SELECT page FROM pages WHERE kind = ? ORDER BY page", (kind,))
+        return [page for (page,) in rows]
+
+    def count(self, table):
+        """Nombre de lignes d'une table (lines, shapes, exercises, predictions, styled)."""
+        return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def has_page(self, page, kind):
+        return self.conn.execute("SELECT 1 FROM pages WHERE page = ? AND kind = ?", (page, kind)).fetchone() is not None
+
+    def delete_page(self, page, kind):
+        """Supprime les artefacts d'une page pour un type (reprise : résultats périmés, cf. run_manifest.py)."""
+        with self.conn:
+            self.conn.execute(f"DELETE FROM {kind} WHERE page = ?", (page,))
+            self.conn.execute("DELETE FROM pages WHERE page = ? AND kind = ?", (page, kind))
+
+    # --- lignes de texte (pdfToTxtStyle) ---
+
+    def put_lines(self, page, rows):
+        """rows : tuples (phrase, font_family, size, color_hex, style_tag, overrides)."""
+        self._replace_page("lines", page, ["line", *LINE_COLUMNS], [(i, *row) for i, row in enumerate(rows)])
+
+    def get_lines(self, page):
+        rows = self.conn.execute(
+            f"SELECT {', '.join(LINE_COLUMNS)} FROM lines WHERE page = ? ORDER BY line", (page,))
+        return [dict(zip(LINE_COLUMNS, ("" if v is None else v for v in row))) for row in rows]
+
+    def lines_csv(self, page):
+        """Texte de files_style/page_N.csv tel que l'extraction le lit (entrée texte de Gemini).
+
+        Fins de ligne "\n" : le fichier est écrit en "\r\n" (csv.writer), mais relu en mode texte,
+        qui les convertit en "\n" ; le prompt est donc le même dans les deux modes.
+        """
+        buf = io.StringIO()
+        w = csv.writer(buf, delimiter=";", lineterminator="\n")
+        w.writerow(LINE_COLUMNS)
+        for row in self.get_lines(page):
+            w.writerow([row["phrase"], row["font_family"], f"{row['size']:g}", row["color_hex"],
+                        row["style_tag"], row["overrides"]])
+        return buf.getvalue()
+
+    # --- détections (detectImages) ---
+
+    def put_shapes(self, page, detection):
+        """detection : {"shapes": [...], "imageHeight": h, "imageWidth": w} (format du JSON de détection)."""
+        w, h = detection["imageWidth"], detection["imageHeight"]
+        rows = [(s["id"], s["label"], s["points"][0][0], s["points"][0][1], s["points"][1][0], s["points"][1][1], w, h)
+                for s in detection["shapes"]]
+        self._replace_page("shapes", page,
+                           ["shape_id", "label", "x_min", "y_min", "x_max", "y_max", "image_width", "image_height"],
+                           rows)
+
+    def get_shapes(self, page):
+        """Même structure que le JSON de détection, ou None si la page n'a pas de détection."""
+        rows = self.conn.execute(
+            "SELECT shape_id, label, x_min, y_min, x_max, y_max, image_width, image_height "
+            "FROM shapes WHERE page = ? ORDER BY shape_id", (page,)).fetchall()
+        if not rows:
+            return None
+        return {
+            "shapes": [{"id": sid, "label": label, "points": [[x0, y0], [x1, y1]]}
+                       for sid, label, x0, y0, x1, y1, _, _ in rows],
+            "imageHeight": rows[0][7],
+            "imageWidth": rows[0][6],
+        }
+
+    # --- exercices (extraction Gemini) ---
+
+    def put_exercises(self, page, exercises, tsv_rows):
+        """exercises : liste d'objets JSON ; tsv_rows : colonnes TSV correspondantes (dicts)."""
+        rows = [(i, *(r.get(c) for c in EXERCISE_COLUMNS), json.dumps(ex, ensure_ascii=False))
+                for i, (ex, r) in enumerate(zip(exercises, tsv_rows))]
+        self._replace_page("exercises", page, ["position", *EXERCISE_COLUMNS, "data"], rows)
+
+    def get_exercises(self, page):
+        rows = self.conn.execute("SELECT data FROM exercises WHERE page = ? ORDER BY position", (page,))
+        return [json.loads(data) for (data,) in rows]
+
+    def exercise_rows(self, page):
+        """Lignes du TSV de classification (dicts TSV_COLUMNS) d'une page."""
+        rows = self.conn.execute(
+            f"SELECT {', '.join(EXERCISE_COLUMNS)} FROM exercises WHERE page = ? ORDER BY position", (page,))
+        out = []
+        for row in rows:
+            r = dict.fromkeys(TSV_COLUMNS, "none")
+            r["textbook"] = "manual_CE1"
+            r.update(zip(EXERCISE_COLUMNS, ("" if v is None else v for v in row)))
+            out.append(r)
+        return out
+
+    # --- prédictions (classification) ---
+
+    def put_predictions(self, page, predictions):
+        """predictions : itérable de (id, étiquette)."""
+        self._replace_page("predictions", page, ["id", "pred"], list(dict(predictions).items()))
+
+    def get_predictions(self, page):
+        rows = self.conn.execute("SELECT id, pred FROM predictions WHERE page = ?", (page,))
+        return dict(rows.fetchall())
+
+    # --- exercices stylisés (style-post) ---
+
+    def put_styled(self, page, exercises):
+        self._replace_page("styled", page, ["position", "data"],
+                           [(i, json.dumps(ex, ensure_ascii=False)) for i, ex in enumerate(exercises)])
+
+    def get_styled(self, page):
+        rows = self.conn.execute("SELECT data FROM styled WHERE page = ? ORDER BY position", (page,))
+        return [json.loads(data) for (data,) in rows]
+
+    def close(self):
+        self.conn.close()
@@ -1,10 +1,22 @@
 import os
 import json
+import argparse
 import cv2
-from pathlib import Path
+import numpy as np
 
-# Base directory
-base_dir = Path(__file__).parent.resolve()
+from docstore import open_store, page_of
+from memory_budget import release_buffers
+from workspace import atomic_open, page_selected, work_dir
+
+# Résolution du raster de files/ (pdfToImages.py) : traits et étiquettes sont réglés pour 450 dpi
+# et mis à l'échelle, pour rester lisibles par Gemini à plus basse résolution (main.py --render-dpi)
+parser = argparse.ArgumentParser()
+parser.add_argument("--dpi", type=int, default=450, help="Résolution des images de files/")
+args = parser.parse_args()
+k = args.dpi / 450
+
+# Base directory = dossier de travail (MALIN_WORKDIR, défaut : dossier du script)
+base_dir = work_dir()
 
 images_path = base_dir / "files"
 json_path = base_dir / "output" / "detImages" / "predict"
@@ -13,9 +25,13 @@ output_path = base_dir / "files-out"
 # Create output folder if not exists
 os.makedirs(output_path, exist_ok=True)
 
+# Stockage unique du document (MALIN_STORE) : détections lues en base
+store = open_store()
+
 # 1. On récupère la liste de TOUTES les images sources
 valid_extensions = (".png", ".jpg", ".jpeg")
-all_images = [f for f in os.listdir(images_path) if f.lower().endswith(valid_extensions)]
+all_images = [f for f in os.listdir(images_path) if f.lower().endswith(valid_extensions)
+              and page_selected(page_of(f))]  # MALIN_PAGES
 
 print(f"[INFO] Traitement de {len(all_images)} images depuis {images_path}")
 
@@ -32,12 +48,14 @@ for image_name in all_images:
     # 3. On cherche s'il existe un JSON correspondant
     json_name = os.path.splitext(image_name)[0] + ".json"
     json_file_path = os.path.join(json_path, json_name)
+    data = store.get_shapes(page_of(image_name)) if store is not None else None
 
-    if os.path.exists(json_file_path):
+    if data is not None or (store is None and os.path.exists(json_file_path)):
         # --- CAS 1 : Il y a des détections (JSON trouvé) ---
         try:
-            with open(json_file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            if data is None:
+                with open(json_file_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
 
             # Extract page number for labeling
             page_num = ''.join([c for c in image_name if c.isdigit()]) or "0"
@@ -49,13 +67,13 @@ for image_name in all_images:
                 shape_id = shape["id"]
 
                 # --- Draw Box (Red) ---
-                cv2.rectangle(img, (x1, y1), (x2, y2), (0, 0, 255), 6)
+                cv2.rectangle(img, (x1, y1), (x2, y2), (0, 0, 255), max(1, round(6 * k)))
 
                 # --- Draw Label ---
                 label_text = f"p{page_num}c{shape_id}"
                 font = cv2.FONT_HERSHEY_SIMPLEX
-                scale = 2.8
-                thickness = 8
+                scale = 2.8 * k
+                thickness = max(1, round(8 * k))
 
                 (text_w, text_h), baseline = cv2.getTextSize(label_text, font, scale, thickness)
                 box_cx = (x1 + x2) // 2
@@ -63,18 +81,22 @@ for image_name in all_images:
 
                 text_x = box_cx - text_w // 2
                 text_y = box_cy + text_h // 2
-                padding = 20
+                padding = round(20 * k)
 
                 tx1 = text_x - padding
                 ty1 = text_y - text_h - padding
                 tx2 = text_x + text_w + padding
                 ty2 = text_y + padding
 
-                # Background for text
-                overlay = img.copy()
-                cv2.rectangle(overlay, (tx1, ty1), (tx2, ty2), (0, 0, 0), -1)
+                # Background for text : fond noir à 85 % mélangé sur la seule zone du label
+                # (même résultat qu'un overlay de la page entière, sans copier la page)
                 alpha = 0.85
-                cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0, img)
+                h, w = img.shape[:2]
+                bx1, by1 = max(tx1, 0), max(ty1, 0)
+                bx2, by2 = min(tx2 + 1, w), min(ty2 + 1, h)
+                if bx1 < bx2 and by1 < by2:
+                    roi = img[by1:by2, bx1:bx2]
+                    img[by1:by2, bx1:bx2] = cv2.addWeighted(np.zeros_like(roi), alpha, roi, 1 - alpha, 0)
 
                 # Text itself
                 cv2.putText(img, label_text, (text_x, text_y), font,
@@ -91,6 +113,15 @@ for image_name in all_images:
 
     # 4. Sauvegarde finale (Modifiée ou Originale) dans files-out
     out_file = os.path.join(output_path, image_name)
-    cv2.imwrite(out_file, img)
+    ok, encoded = cv2.imencode(os.path.splitext(image_name)[1], img)
+    if ok:
+        with atomic_open(out_file, "wb") as f:
+            f.write(encoded.tobytes())
+    else:
+        print(f"[ERR] Could not encode {image_name}")
+
+    # Mode mémoire bornée : page libérée avant de décoder la suivante
+    img = roi = None  # roi est une vue qui garderait la page en mémoire
+    release_buffers()
 
 print("[DONE] DrawBoxes finished.")
\ No newline at end of file
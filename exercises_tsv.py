@@ -0,0 +1,148 @@
+import os
+import re
+import csv
+import json
+import sys
+from pathlib import Path
+
+from docstore import TSV_COLUMNS
+from workspace import atomic_open, work_dir
+
+# Conversion des exercices extraits (extractionOut/page_N.json) en TSV de classification
+# (extractionOut/page_N.tsv, colonnes TSV_COLUMNS). Utilisé par extraction-gemini-vision.py
+# après chaque page ; en script, reconvertit tous les JSON d'un dossier :
+# python exercises_tsv.py [dossier]   (défaut : extractionOut du dossier de travail)
+
+
+def clean_text_for_tsv(text) -> str:
+    """Nettoie le texte pour le format TSV (pas de tabulations ni sauts de ligne)."""
+    if text is None:
+        return ""
+    # On remplace les tabulations et nouvelles lignes par des espaces
+    return str(text).replace('\t', ' ').replace('\n', ' ').strip()
+
+
+def load_json_robust(json_path: str):
+    """Tente de charger un JSON même s'il contient des caractères invalides."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    try:
+        # 1. Tentative standard mais permissive
+        return json.loads(content, strict=False)
+    except json.JSONDecodeError:
+        try:
+            # 2. Tentative de nettoyage des caractères de contrôle (sauf \n formatage)
+            # On échappe les retours à la ligne qui semblent être dans des valeurs
+            cleaned = re.sub(r'(?<!\\)\n', '\\n', content)
+            return json.loads(cleaned, strict=False)
+        except:
+            # 3. Echec
+            raise ValueError("Impossible de parser le JSON même après nettoyage.")
+
+
+# =========================
+# CONVERTISSEUR JSON -> TSV
+# =========================
+def normalize_exercises(data, source: str):
+    """Normalisation : on veut une liste d'exercices (None si le format n'est pas exploitable)."""
+    if isinstance(data, dict):
+        if "items" in data:
+            return data["items"]
+        elif "$defs" in data:
+            print(f"[WARN] Structure JSON complexe (schema) ignorée pour TSV : {source}")
+            return None
+        else:
+            return [data]
+    elif not isinstance(data, list):
+        print(f"[WARN] Format JSON inattendu pour {source}")
+        return None
+    return data
+
+
+def exercise_tsv_row(ex) -> list:
+    """Ligne TSV (colonnes TSV_COLUMNS) d'un exercice extrait."""
+    # Récupération des propriétés (parfois imbriquées, parfois à plat)
+    props = ex.get("properties", {}) if "properties" in ex else ex
+
+    # Champs simples
+    id_val = ex.get("id", "none")
+    numero = clean_text_for_tsv(props.get("number") or props.get("numero"))
+    if not numero: numero = "none"
+
+    # Textes
+    instruction = clean_text_for_tsv(props.get("instruction") or props.get("consignes"))
+    hint = clean_text_for_tsv(props.get("hint") or props.get("conseil"))
+    example = clean_text_for_tsv(props.get("example") or props.get("exemple"))
+
+    # Enoncé + Labels
+    raw_statement = clean_text_for_tsv(props.get("statement") or props.get("enonce"))
+    labels_list = props.get("labels", [])
+
+    if labels_list and isinstance(labels_list, list):
+        labels_text = " ".join([clean_text_for_tsv(l) for l in labels_list])
+        statement = f"{raw_statement} {labels_text}".strip()
+    else:
+        statement = raw_statement
+
+    # Colonnes composées (concaténation pour le modèle BERT)
+    parts_ihe = [p for p in [instruction, hint, example] if p]
+    instruction_hint_example = " ".join(parts_ihe)
+
+    parts_full = [p for p in [instruction, hint, example, statement] if p]
+    full_ex = " ".join(parts_full)
+
+    return [
+        "manual_CE1",  # textbook
+        id_val,  # id
+        full_ex,  # full_ex
+        numero,  # num
+        "none",  # indicator
+        instruction,  # instruction
+        hint,  # hint
+        example,  # example
+        statement,  # statement (inclut les labels)
+        instruction_hint_example,  # Colonne clé pour la classification
+        "none",  # label (cible)
+        "none",  # grandtype
+        "none"  # stratify_key
+    ]
+
+
+def convert_json_to_tsv(json_path: str, tsv_path: str):
+    """Convertit un fichier JSON extrait en fichier TSV pour la classification."""
+    try:
+        # Utilisation du chargeur robuste
+        data = normalize_exercises(load_json_robust(json_path), json_path)
+        if data is None:
+            return
+
+        with atomic_open(tsv_path, "w", encoding="utf-8", newline="") as tsv_file:
+            writer = csv.writer(tsv_file, delimiter="\t")
+
+            # En-têtes exacts requis
+            writer.writerow(TSV_COLUMNS)
+
+            for ex in data:
+                writer.writerow(exercise_tsv_row(ex))
+
+        print(f" [TSV] Généré : {os.path.basename(tsv_path)}")
+
+    except Exception as e:
+        print(f" [ERR] Echec conversion TSV pour {json_path}: {e}")
+
+
+def main():
+    extraction_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else work_dir() / "extractionOut"
+    if not extraction_dir.exists():
+        print(f"[ERR] Dossier introuvable : {extraction_dir}")
+        return
+
+    json_files = sorted(extraction_dir.glob("*.json"))
+    print(f"[INFO] {len(json_files)} fichiers JSON à convertir")
+    for json_path in json_files:
+        convert_json_to_tsv(str(json_path), str(json_path.with_suffix(".tsv")))
+
+
+if __name__ == "__main__":
+    main()
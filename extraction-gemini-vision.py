@@ -1,18 +1,24 @@
 import os
 import time
 import json
-import csv
-import re
 import sys
 import argparse  # <--- Ajouté
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from pathlib import Path
 
 import PIL.Image
 from google import genai
+from google.genai import types
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 
+from clean_text import recursive_clean
+from docstore import TSV_COLUMNS, DocStore, open_store, page_of
+from memory_budget import page_budget
+from exercises_tsv import convert_json_to_tsv, exercise_tsv_row, normalize_exercises
+from workspace import atomic_open, page_selected, work_dir
+
 # --- FIX WINDOWS ENCODING ---
 if sys.platform == "win32":
     sys.stdout.reconfigure(encoding='utf-8')
@@ -22,6 +28,10 @@ if sys.platform == "win32":
 # =========================
 parser = argparse.ArgumentParser()
 parser.add_argument("--style", type=str, default="false", help="Mode style (true/false)")
+parser.add_argument("--base-url", default=os.environ.get("MALIN_GEMINI_BASE_URL"),
+                    help="URL de l'API Gemini (ex. serveur simulé mock_gemini.py)")
+parser.add_argument("--workers", type=int, default=1, help="Pages traitées en parallèle (threads)")
+parser.add_argument("--max-backoff", type=float, default=60, help="Pause maximale entre deux tentatives (s)")
 args = parser.parse_args()
 
 # Conversion string "true"/"false" en booléen
@@ -34,16 +44,17 @@ MODEL_NAME = "gemini-2.5-flash"
 base_dir = Path(__file__).parent.resolve()
 api_key_path = base_dir / "apikey.txt"
 
-# Dossiers d'entrée/sortie
-image_dir = os.path.join(base_dir, "files-out")
-text_dir = os.path.join(base_dir, "files_style")
+# Dossiers d'entrée/sortie (dossier de travail : MALIN_WORKDIR, défaut : dossier du script)
+data_dir = work_dir()
+image_dir = os.path.join(data_dir, "files-out")
+text_dir = os.path.join(data_dir, "files_style")
 
 if STYLE_MODE:
     prompt_file = os.path.join(base_dir, "promptStyle.txt")
-    output_dir = os.path.join(base_dir, "extractionOutStyle")
+    output_dir = os.path.join(data_dir, "extractionOutStyle")
 else:
     prompt_file = os.path.join(base_dir, "prompt.txt")
-    output_dir = os.path.join(base_dir, "extractionOut")
+    output_dir = os.path.join(data_dir, "extractionOut")
 
 os.makedirs(output_dir, exist_ok=True)
 
@@ -68,25 +79,18 @@ def clean_fenced_json(text: str) -> str:
     return t
 
 
-def clean_text_for_tsv(text) -> str:
-    """Nettoie le texte pour le format TSV (pas de tabulations ni sauts de ligne)."""
-    if text is None:
-        return ""
-    # On remplace les tabulations et nouvelles lignes par des espaces
-    return str(text).replace('\t', ' ').replace('\n', ' ').strip()
-
-
 def save_json_safely(raw_text: str, out_path: str) -> None:
     """Sauvegarde le JSON proprement, ou le texte brut si le parsing échoue."""
     cleaned = clean_fenced_json(raw_text)
     try:
         # strict=False permet d'accepter les sauts de ligne dans les strings (fréquent avec les LLM)
-        parsed = json.loads(cleaned, strict=False)
-        with open(out_path, "w", encoding="utf-8") as f:
+        # Espaces fins / insécables normalisés après parsing (aussi ceux écrits en échappements \u202f)
+        parsed = recursive_clean(json.loads(cleaned, strict=False))
+        with atomic_open(out_path, "w", encoding="utf-8") as f:
             json.dump(parsed, f, ensure_ascii=False, indent=2)
     except Exception:
         # Si ça échoue quand même, on sauvegarde le texte brut pour debug/réparation
-        with open(out_path, "w", encoding="utf-8") as f:
+        with atomic_open(out_path, "w", encoding="utf-8") as f:
             f.write(cleaned)
 
 
@@ -95,109 +99,20 @@ def load_api_key(path: str) -> str:
         return f.read().strip()
 
 
-def load_json_robust(json_path: str):
-    """Tente de charger un JSON même s'il contient des caractères invalides."""
-    with open(json_path, "r", encoding="utf-8") as f:
-        content = f.read()
-
-    try:
-        # 1. Tentative standard mais permissive
-        return json.loads(content, strict=False)
-    except json.JSONDecodeError:
-        try:
-            # 2. Tentative de nettoyage des caractères de contrôle (sauf \n formatage)
-            # On échappe les retours à la ligne qui semblent être dans des valeurs
-            cleaned = re.sub(r'(?<!\\)\n', '\\n', content)
-            return json.loads(cleaned, strict=False)
-        except:
-            # 3. Echec
-            raise ValueError("Impossible de parser le JSON même après nettoyage.")
-
-
-# =========================
-# CONVERTISSEUR JSON -> TSV
-# =========================
-def convert_json_to_tsv(json_path: str, tsv_path: str):
-    """Convertit un fichier JSON extrait en fichier TSV pour la classification."""
+def save_exercises_to_store(store, page: int, raw_text: str, out_path: str) -> bool:
+    """Exercices + colonnes TSV en base ; si la réponse n'est pas exploitable, texte brut dans out_path."""
+    cleaned = clean_fenced_json(raw_text)
     try:
-        # Utilisation du chargeur robuste
-        data = load_json_robust(json_path)
-
-        # Normalisation : on veut une liste d'exercices
-        if isinstance(data, dict):
-            if "items" in data:
-                data = data["items"]
-            elif "$defs" in data:
-                print(f"[WARN] Structure JSON complexe (schema) ignorée pour TSV : {json_path}")
-                return
-            else:
-                data = [data]
-        elif not isinstance(data, list):
-            print(f"[WARN] Format JSON inattendu pour {json_path}")
-            return
-
-        with open(tsv_path, "w", encoding="utf-8", newline="") as tsv_file:
-            writer = csv.writer(tsv_file, delimiter="\t")
-
-            # En-têtes exacts requis
-            writer.writerow([
-                "textbook", "id", "full_ex", "num", "indicator", "instruction",
-                "hint", "example", "statement", "instruction_hint_example",
-                "label", "grandtype", "stratify_key"
-            ])
-
-            for ex in data:
-                # Récupération des propriétés (parfois imbriquées, parfois à plat)
-                props = ex.get("properties", {}) if "properties" in ex else ex
-
-                # Champs simples
-                id_val = ex.get("id", "none")
-                numero = clean_text_for_tsv(props.get("number") or props.get("numero"))
-                if not numero: numero = "none"
-
-                # Textes
-                instruction = clean_text_for_tsv(props.get("instruction") or props.get("consignes"))
-                hint = clean_text_for_tsv(props.get("hint") or props.get("conseil"))
-                example = clean_text_for_tsv(props.get("example") or props.get("exemple"))
-
-                # Enoncé + Labels
-                raw_statement = clean_text_for_tsv(props.get("statement") or props.get("enonce"))
-                labels_list = props.get("labels", [])
-
-                if labels_list and isinstance(labels_list, list):
-                    labels_text = " ".join([clean_text_for_tsv(l) for l in labels_list])
-                    statement = f"{raw_statement} {labels_text}".strip()
-                else:
-                    statement = raw_statement
-
-                # Colonnes composées (concaténation pour le modèle BERT)
-                parts_ihe = [p for p in [instruction, hint, example] if p]
-                instruction_hint_example = " ".join(parts_ihe)
-
-                parts_full = [p for p in [instruction, hint, example, statement] if p]
-                full_ex = " ".join(parts_full)
-
-                # Écriture de la ligne
-                writer.writerow([
-                    "manual_CE1",  # textbook
-                    id_val,  # id
-                    full_ex,  # full_ex
-                    numero,  # num
-                    "none",  # indicator
-                    instruction,  # instruction
-                    hint,  # hint
-                    example,  # example
-                    statement,  # statement (inclut les labels)
-                    instruction_hint_example,  # Colonne clé pour la classification
-                    "none",  # label (cible)
-                    "none",  # grandtype
-                    "none"  # stratify_key
-                ])
-
-        print(f" [TSV] Généré : {os.path.basename(tsv_path)}")
-
-    except Exception as e:
-        print(f" [ERR] Echec conversion TSV pour {json_path}: {e}")
+        exercises = normalize_exercises(recursive_clean(json.loads(cleaned, strict=False)), out_path)
+    except Exception:
+        exercises = None
+    if exercises is None:
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(cleaned)
+        return False
+    rows = [dict(zip(TSV_COLUMNS, exercise_tsv_row(ex))) for ex in exercises]
+    store.put_exercises(page, exercises, rows)
+    return True
 
 
 # =========================
@@ -221,7 +136,7 @@ def generate_content_safe(client: genai.Client, contents) -> Optional[str]:
                 print(f" [ERR] Erreur fatale Gemini : {e}")
                 return None
 
-            backoff = min(60, max(2, 2 ** attempt))  # Max 60s d'attente
+            backoff = min(args.max_backoff, max(2, 2 ** attempt))  # Max 60s d'attente par défaut
             print(f" [INFO] Quota atteint. Pause de {backoff}s...")
             time.sleep(backoff)
 
@@ -232,9 +147,12 @@ def generate_content_safe(client: genai.Client, contents) -> Optional[str]:
 # =========================
 # PIPELINE PRINCIPAL
 # =========================
-def process_image_file(client: genai.Client, image_path: str) -> None:
+def process_image_file(client: genai.Client, image_path: str, store=None) -> None:
     name = os.path.basename(image_path)
     stem, _ = os.path.splitext(name)
+    page = page_of(stem)
+    if page is None:
+        store = None  # hors convention page_N : fichiers
 
     # Chemins des fichiers
     csv_path = os.path.join(text_dir, f"{stem}.csv")
@@ -243,7 +161,10 @@ def process_image_file(client: genai.Client, image_path: str) -> None:
     out_tsv = os.path.join(output_dir, f"{stem}.tsv")
 
     # 1. VÉRIFICATION INTELLIGENTE JSON/TSV
-    if os.path.exists(out_json):
+    if store is not None and store.has_page(page, "exercises"):
+        print(f" [SKIP] {stem} déjà fait (exercices en base).")
+        return
+    if store is None and os.path.exists(out_json):
         # Le JSON existe déjà
         if not os.path.exists(out_tsv):
             # MAIS le TSV manque -> on le génère et on s'arrête là
@@ -257,31 +178,44 @@ def process_image_file(client: genai.Client, image_path: str) -> None:
     print(f" [RUN] Traitement de {stem}...")
 
     # 2. CONVERSION CSV -> TXT (Entrée texte pour Gemini)
-    if not os.path.exists(csv_path):
-        print(f" [WARN] Fichier CSV introuvable pour {stem}")
-        return
+    if store is not None:
+        # Lignes en base : même texte que le CSV, sans copie .txt
+        if not store.has_page(page, "lines"):
+            print(f" [WARN] Lignes de texte introuvables en base pour {stem}")
+            return
+        side_text = store.lines_csv(page)
+    else:
+        if not os.path.exists(csv_path):
+            print(f" [WARN] Fichier CSV introuvable pour {stem}")
+            return
 
-    try:
-        with open(csv_path, "r", encoding="utf-8") as f:
-            csv_content = f.read()
-        with open(txt_path, "w", encoding="utf-8") as f:
-            f.write(csv_content)
-    except Exception as e:
-        print(f" [ERR] Impossible de lire/écrire le CSV/TXT : {e}")
-        return
+        try:
+            with open(csv_path, "r", encoding="utf-8") as f:
+                csv_content = f.read()
+            with open(txt_path, "w", encoding="utf-8") as f:
+                f.write(csv_content)
+        except Exception as e:
+            print(f" [ERR] Impossible de lire/écrire le CSV/TXT : {e}")
+            return
 
     # 3. CHARGEMENT IMAGE ET PROMPT
+    # Octets du fichier envoyés tels quels : la page n'est pas décodée (seul l'en-tête est lu
+    # pour vérifier le format), le SDK n'a pas à la ré-encoder
     try:
-        image = PIL.Image.open(image_path)
+        with PIL.Image.open(image_path) as img:
+            mime_type = PIL.Image.MIME[img.format]
+        with open(image_path, "rb") as f:
+            image = types.Part.from_bytes(data=f.read(), mime_type=mime_type)
     except Exception as e:
         print(f" [ERR] Impossible d'ouvrir l'image {image_path}: {e}")
         return
 
     base_prompt = read_file(prompt_file)
-    try:
-        side_text = read_file(txt_path)
-    except Exception:
-        side_text = ""
+    if store is None:
+        try:
+            side_text = read_file(txt_path)
+        except Exception:
+            side_text = ""
 
     full_prompt = (
             base_prompt
@@ -299,6 +233,13 @@ def process_image_file(client: genai.Client, image_path: str) -> None:
         return
 
     # 5. SAUVEGARDE JSON
+    if store is not None:
+        if save_exercises_to_store(store, page, resp_text, out_json):
+            print(f" [OK] Exercices sauvegardés en base : {store.path}")
+        else:
+            print(f" [ERR] Réponse non exploitable pour {stem}, texte brut : {out_json}")
+        return
+
     save_json_safely(resp_text, out_json)
     print(f" [OK] JSON sauvegardé : {out_json}")
 
@@ -306,20 +247,52 @@ def process_image_file(client: genai.Client, image_path: str) -> None:
     convert_json_to_tsv(out_json, out_tsv)
 
 
+def process_image_file_threaded(client: genai.Client, image_path: str, store_path: Optional[str]) -> None:
+    """process_image_file depuis un thread du pool : connexion SQLite propre au thread."""
+    store = DocStore(store_path) if store_path else None
+    try:
+        process_image_file(client, image_path, store)
+    finally:
+        if store is not None:
+            store.close()
+
+
 def main():
-    api_key = load_api_key(api_key_path)
-    client = genai.Client(api_key=api_key)
+    if args.base_url:
+        # Serveur compatible (mock_gemini.py) : la clé n'est pas vérifiée
+        api_key = load_api_key(api_key_path) if api_key_path.exists() else "mock"
+        client = genai.Client(api_key=api_key, http_options=types.HttpOptions(base_url=args.base_url))
+        print(f"[INFO] API Gemini : {args.base_url}")
+    else:
+        client = genai.Client(api_key=load_api_key(api_key_path))
+
+    # Stockage unique du document (MALIN_STORE), hors mode style (sortie extractionOutStyle)
+    store = open_store() if not STYLE_MODE else None
 
     print(f"Dossier images : {image_dir}")
-    print(f"Dossier sortie : {output_dir}")
+    print(f"Dossier sortie : {store.path if store is not None else output_dir}")
 
     # Parcours des images
-    for fname in sorted(os.listdir(image_dir)):
-        if fname.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
-            fpath = os.path.join(image_dir, fname)
-            process_image_file(client, fpath)
-
-    print("\n[DONE] Extraction terminée.")
+    fpaths = [os.path.join(image_dir, fname) for fname in sorted(os.listdir(image_dir))
+              if fname.lower().endswith((".png", ".jpg", ".jpeg", ".webp")) and page_selected(page_of(fname))]
+    start = time.perf_counter()
+    workers = args.workers
+    if page_budget() is not None and workers > page_budget():
+        # Mode mémoire bornée : une page en mémoire par appel en cours
+        print(f"[WARN] --workers {workers} ramené à {page_budget()} (MALIN_MAX_PAGES)")
+        workers = page_budget()
+    if workers > 1:
+        # Appels Gemini concurrents : le temps est passé à attendre l'API
+        store_path = store.path if store is not None else None
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda fpath: process_image_file_threaded(client, fpath, store_path), fpaths))
+    else:
+        for fpath in fpaths:
+            process_image_file(client, fpath, store)
+    if store is not None:
+        store.close()
+
+    print(f"\n[DONE] Extraction terminée ({len(fpaths)} pages en {time.perf_counter() - start:.1f} s).")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,225 @@
+import csv
+import hashlib
+import json
+import re
+import shutil
+from pathlib import Path
+
+from docstore import TSV_COLUMNS
+from exercises_tsv import exercise_tsv_row
+from workspace import atomic_open
+
+# Détection des pages modifiées d'une nouvelle édition d'un manuel (main.py --previous).
+#
+# Empreinte par page, calculée avec PyMuPDF sans rendu : flux de contenu de la page, texte extrait,
+# polices, et contenu des images / XObjects utilisés. Les numéros d'objet (xref) ne sont pas pris
+# en compte : ils changent d'une édition à l'autre pour une page identique.
+#
+# Chaque exécution archive, à côté des sorties (SORTIES/<pdf>/pages/page_N.json), les résultats par
+# page (exercices, prédictions, exercices stylisés) avec l'empreinte de la page, et ses découpes d'images
+# (SORTIES/<pdf>/pages/crops/pNcK.png). Une nouvelle édition comparée à cette archive ne fait passer
+# que les pages modifiées par le rendu, Gemini et la classification ; les pages inchangées sont reprises,
+# éventuellement sous un autre numéro de page (ids p9_ex3 -> p10_ex3, images \image{p9c1} -> \image{p10c1},
+# découpes p9c1.png -> p10c1.png).
+
+FINGERPRINTS_FILE = "fingerprints.json"
+ARCHIVE_DIR = "pages"
+CROPS_DIR = Path("output") / "detImages" / "predict" / "crops"  # découpes de cropImages.py
+
+
+def page_fingerprints(pdf_path, pages=None):
+    """{page (1-based): sha256} des pages demandées (toutes par défaut)."""
+    import fitz  # PyMuPDF, déjà requis par pdfToTxtStyle.py
+
+    stream_digests = {}  # xref -> empreinte du flux brut (images et formulaires partagés entre pages)
+
+    def stream_digest(doc, xref):
+        if xref not in stream_digests:
+            stream_digests[xref] = hashlib.sha256(doc.xref_stream_raw(xref) or b"").hexdigest()
+        return stream_digests[xref]
+
+    out = {}
+    with fitz.open(pdf_path) as doc:
+        for page_num in (pages if pages is not None else range(1, len(doc) + 1)):
+            page = doc[page_num - 1]
+            h = hashlib.sha256()
+            h.update(f"{tuple(page.rect)}|{page.rotation}\0".encode())
+            h.update(page.read_contents())
+            h.update(page.get_text("text").encode("utf-8"))
+            for xref, _, _, basefont, name, encoding in page.get_fonts(full=False):
+                h.update(f"\0font|{basefont}|{name}|{encoding}".encode())
+            for img in page.get_images(full=True):
+                # (xref, smask, largeur, hauteur, bpc, espace couleur, alt, nom, filtre, référent)
+                h.update(f"\0img|{img[2]}|{img[3]}|{img[4]}|{img[5]}|{img[7]}|".encode())
+                h.update(stream_digest(doc, img[0]).encode())
+            for xref, name, _, _ in page.get_xobjects():
+                h.update(f"\0xobj|{name}|".encode())
+                h.update(stream_digest(doc, xref).encode())
+            out[page_num] = h.hexdigest()
+    return out
+
+
+def load_fingerprints(output_root):
+    """{page: empreinte} des pages archivées d'une exécution précédente ({} si aucune)."""
+    try:
+        with open(Path(output_root) / FINGERPRINTS_FILE, "r", encoding="utf-8") as f:
+            return {int(page): digest for page, digest in json.load(f)["pages"].items()}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def match_pages(previous, current):
+    """{nouvelle page: ancienne page} des pages inchangées.
+
+    À empreinte égale (pages blanches, pages répétées), on garde le même numéro si possible,
+    sinon la première ancienne page non utilisée.
+    """
+    by_digest = {}
+    for page in sorted(previous):
+        by_digest.setdefault(previous[page], []).append(page)
+    mapping = {}
+    for page in sorted(current):
+        candidates = by_digest.get(current[page])
+        if not candidates:
+            continue
+        old = page if page in candidates else candidates[0]
+        candidates.remove(old)
+        mapping[page] = old
+    return mapping
+
+
+def remap_page_refs(text, old, new):
+    """Remplace les références à la page old par new : p9_ex3, p9_titre, p9c1."""
+    if old == new:
+        return text
+    return re.sub(rf"(?<![A-Za-z0-9])p{old}(?=_|c\d)", f"p{new}", text)
+
+
+# --- archive des résultats par page ---
+
+def page_record(work, page, store=None):
+    """Résultats d'une page (fichiers des étapes ou stockage unique), ou None si incomplets."""
+    if store is not None:
+        if not (store.has_page(page, "exercises") and store.has_page(page, "predictions")):
+            return None
+        styled = store.get_styled(page) if store.has_page(page, "styled") else None
+        return {"exercises": store.get_exercises(page), "predictions": store.get_predictions(page),
+                "styled": styled}
+
+    json_path = work / "extractionOut" / f"page_{page}.json"
+    pred_path = work / "classificationOut" / f"pred_page_{page}.tsv"
+    style_path = work / "extractionOutStyle" / f"page_{page}--style.json"
+    if not (json_path.exists() and pred_path.exists()):
+        return None
+    with open(json_path, "r", encoding="utf-8") as f:
+        exercises = json.load(f)
+    with open(pred_path, "r", encoding="utf-8", newline="") as f:
+        predictions = {row["id"]: row["pred"] for row in csv.DictReader(f, delimiter="\t")}
+    styled = None
+    if style_path.exists():
+        with open(style_path, "r", encoding="utf-8") as f:
+            styled = json.load(f)
+    return {"exercises": exercises, "predictions": predictions, "styled": styled}
+
+
+def archive_pages(work, output_root, fingerprints, store=None, prune=False):
+    """Archive les résultats des pages traitées avec leur empreinte ; renvoie le nombre de pages archivées.
+
+    Les pages archivées par une exécution précédente du même document et absentes de celle-ci sont gardées,
+    sauf avec prune (nouvelle édition : ces pages n'existent plus).
+    """
+    archive = Path(output_root) / ARCHIVE_DIR
+    (archive / "crops").mkdir(parents=True, exist_ok=True)
+    index = load_fingerprints(output_root)
+    if prune:
+        for page in set(index) - set(fingerprints):
+            (archive / f"page_{page}.json").unlink(missing_ok=True)
+            for crop in (archive / "crops").glob(f"p{page}c*.png"):
+                crop.unlink()
+            del index[page]
+    count = 0
+    for page, digest in sorted(fingerprints.items()):
+        record = page_record(Path(work), page, store)
+        if record is None:
+            continue
+        # Découpes d'abord : une archive de page présente a toujours ses découpes
+        for crop in (archive / "crops").glob(f"p{page}c*.png"):
+            crop.unlink()
+        for crop in (Path(work) / CROPS_DIR).glob(f"p{page}c*.png"):
+            shutil.copy(crop, archive / "crops" / crop.name)
+        with atomic_open(archive / f"page_{page}.json", "w", encoding="utf-8") as f:
+            json.dump(dict(record, fingerprint=digest), f, ensure_ascii=False)
+        index[page] = digest
+        count += 1
+    with atomic_open(Path(output_root) / FINGERPRINTS_FILE, "w", encoding="utf-8") as f:
+        json.dump({"pages": {str(p): d for p, d in sorted(index.items())}}, f, indent=2)
+    return count
+
+
+def load_archived(output_root, old, new):
+    """Résultats archivés de la page old, renumérotés en page new (None si absents ou illisibles)."""
+    try:
+        text = (Path(output_root) / ARCHIVE_DIR / f"page_{old}.json").read_text(encoding="utf-8")
+        return json.loads(remap_page_refs(text, old, new))
+    except (OSError, ValueError):
+        return None
+
+
+def restore_page(work, page, record, store=None):
+    """Écrit les résultats repris d'une page là où les étapes les auraient écrits."""
+    predictions = record["predictions"]
+    if store is not None:
+        rows = [dict(zip(TSV_COLUMNS, exercise_tsv_row(ex))) for ex in record["exercises"]]
+        store.put_exercises(page, record["exercises"], rows)
+        store.put_predictions(page, predictions.items())
+        if record["styled"] is not None:
+            store.put_styled(page, record["styled"])
+        return
+
+    extraction_dir = work / "extractionOut"
+    classification_dir = work / "classificationOut"
+    extraction_dir.mkdir(parents=True, exist_ok=True)
+    classification_dir.mkdir(parents=True, exist_ok=True)
+    with atomic_open(extraction_dir / f"page_{page}.json", "w", encoding="utf-8") as f:
+        json.dump(record["exercises"], f, indent=2, ensure_ascii=False)
+    rows = [exercise_tsv_row(ex) for ex in record["exercises"]]
+    with atomic_open(extraction_dir / f"page_{page}.tsv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow(TSV_COLUMNS)
+        writer.writerows(rows)
+    # Prédictions au format de classification.py : TSV d'entrée + colonne pred, et une étiquette par ligne
+    preds = [predictions.get(row[1], "") for row in rows]
+    with atomic_open(classification_dir / f"pred_page_{page}.tsv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        writer.writerow([*TSV_COLUMNS, "pred"])
+        writer.writerows([*row, pred] for row, pred in zip(rows, preds))
+    with atomic_open(classification_dir / f"pred_page_{page}.txt", "w") as f:
+        f.writelines(f"{pred}\n" for pred in preds)
+    if record["styled"] is not None:
+        style_dir = work / "extractionOutStyle"
+        style_dir.mkdir(parents=True, exist_ok=True)
+        with atomic_open(style_dir / f"page_{page}--style.json", "w", encoding="utf-8") as f:
+            json.dump(record["styled"], f, indent=2, ensure_ascii=False)
+
+
+def restore_crops(work, output_root, old, new):
+    """Copie les découpes archivées de la page old sous les noms de la page new (p9c1 -> p10c1)."""
+    crops_dir = work / CROPS_DIR
+    crops_dir.mkdir(parents=True, exist_ok=True)
+    for crop in (Path(output_root) / ARCHIVE_DIR / "crops").glob(f"p{old}c*.png"):
+        shutil.copy(crop, crops_dir / remap_page_refs(crop.name, old, new))
+
+
+def carry_over(work, previous_root, mapping, store=None):
+    """Reprend les pages inchangées {nouvelle: ancienne} ; renvoie les nouvelles pages reprises."""
+    carried = []
+    for page, old in sorted(mapping.items()):
+        record = load_archived(previous_root, old, page)
+        if record is None:
+            print(f"[WARN] page {page} : archive de la page {old} illisible, page retraitée")
+            continue
+        restore_page(Path(work), page, record, store)
+        restore_crops(Path(work), previous_root, old, page)
+        carried.append(page)
+    return carried
+
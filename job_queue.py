@@ -0,0 +1,538 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from run_manifest import pdf_page_count, stage_artifacts
+from triage import TRIAGE_FILE, load_decisions, save_decisions, skipped_pages
+from workspace import PAGES_ENV, WORKDIR_ENV, format_pages, work_dir
+
+# File de tâches par page pour traiter un catalogue de PDF sur plusieurs machines.
+#
+# Une base SQLite (queue.sqlite) dans un dossier partagé (NFS, SMB...) contient les documents soumis
+# et une tâche par (document, étape, page). Chaque document a son propre dossier de travail
+# (docs/<pdf>/, MALIN_WORKDIR) à côté de la base ; les workers y lancent les scripts d'étape
+# restreints à leurs pages (MALIN_PAGES).
+#
+# - bail (lease) : un worker réserve un lot de tâches pour --lease secondes et le prolonge
+#   (heartbeat) tant que le script tourne ; un bail expiré (machine arrêtée) rend la tâche
+#   à nouveau disponible ;
+# - reprise : une tâche en échec est relancée plus tard (attente croissante), jusqu'à --max-attempts ;
+# - une page ne passe à l'étape suivante que quand l'étape précédente est faite pour cette page ;
+# - triage (submit --triage) : les pages écartées après pdfToTxtStyle.py ne passent pas aux étapes suivantes ;
+# - le coordinateur lance organize_outputs.py quand toutes les pages d'un document sont faites ou écartées.
+#
+# Pas de MALIN_STORE ici : le verrouillage WAL de SQLite ne fonctionne pas sur un partage réseau.
+# La base de la file est donc en journal classique (DELETE), avec des transactions courtes.
+
+QUEUE_ENV = "MALIN_QUEUE"
+QUEUE_DB = "queue.sqlite"
+
+# Étapes d'une tâche et scripts lancés, dans l'ordre du pipeline
+TASK_STAGES = {
+    "render": ["pdfToImages.py", "pdfToTxtStyle.py", "detectImages.py", "cropImages.py", "drawBoxes.py"],
+    "extract": ["extraction-gemini-vision.py"],
+    "classify": ["classification.py"],
+    "style": ["style-post.py"],
+}
+STAGE_ORDER = list(TASK_STAGES)
+
+BASE_DIR = Path(__file__).resolve().parent
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc TEXT PRIMARY KEY, pdf TEXT NOT NULL, work_dir TEXT NOT NULL, pages INTEGER NOT NULL,
+    options TEXT NOT NULL, status TEXT NOT NULL, submitted REAL NOT NULL, finished REAL);
+CREATE TABLE IF NOT EXISTS tasks (
+    doc TEXT NOT NULL, stage TEXT NOT NULL, stage_index INTEGER NOT NULL, page INTEGER NOT NULL,
+    status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_until REAL,
+    not_before REAL NOT NULL DEFAULT 0, error TEXT, updated REAL,
+    PRIMARY KEY (doc, stage, page));
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, stage, doc);
+"""
+
+
+def default_queue_dir():
+    path = os.environ.get(QUEUE_ENV)
+    return Path(path) if path else work_dir() / "queue"
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    def __init__(self, root):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None : transactions explicites (BEGIN IMMEDIATE pour réserver sans conflit)
+        self.conn = sqlite3.connect(self.root / QUEUE_DB, timeout=120, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        return _Immediate(self.conn)
+
+    # --- documents ---
+
+    def submit(self, pdf_path, options):
+        """Copie le PDF dans le dossier du document et crée ses tâches ; False si déjà soumis."""
+        pdf_path = Path(pdf_path)
+        doc = pdf_path.stem
+        if self.conn.execute("SELECT 1 FROM documents WHERE doc = ?", (doc,)).fetchone():
+            return False
+        doc_dir = self.root / "docs" / doc
+        (doc_dir / "PdfSource").mkdir(parents=True, exist_ok=True)
+        shutil.copy(pdf_path, doc_dir / "PdfSource" / pdf_path.name)
+        pages = pdf_page_count(pdf_path)
+        now = time.time()
+        with self._transaction():
+            self.conn.execute(
+                "INSERT INTO documents (doc, pdf, work_dir, pages, options, status, submitted) "
+                "VALUES (?, ?, ?, ?, ?, 'running', ?)",
+                (doc, pdf_path.name, str(doc_dir.relative_to(self.root)), pages, json.dumps(options), now))
+            self.conn.executemany(
+                "INSERT INTO tasks (doc, stage, stage_index, page, status, updated) VALUES (?, ?, ?, ?, 'pending', ?)",
+                [(doc, stage, i, page, now) for i, stage in enumerate(STAGE_ORDER) for page in range(1, pages + 1)])
+        return True
+
+    def document(self, doc):
+        row = self.conn.execute("SELECT * FROM documents WHERE doc = ?", (doc,)).fetchone()
+        return dict(row, options=json.loads(row["options"]), work_dir=self.root / row["work_dir"])
+
+    # --- tâches ---
+
+    def claim(self, worker, stages, batch, lease, max_attempts):
+        """Réserve jusqu'à `batch` pages d'un même document pour une même étape.
+
+        Tâches disponibles : en attente (délai de reprise écoulé) ou au bail expiré, dont la page
+        est faite à l'étape précédente. Renvoie (doc, stage, pages) ou None.
+        """
+        now = time.time()
+        marks = ", ".join("?" * len(stages))
+        available = f"""
+            FROM tasks t JOIN documents d ON d.doc = t.doc
+            WHERE d.status = 'running' AND t.stage IN ({marks}) AND t.attempts < ?
+              AND ((t.status = 'pending' AND t.not_before <= ?) OR (t.status = 'leased' AND t.lease_until < ?))
+              AND (t.stage_index = 0 OR EXISTS (
+                   SELECT 1 FROM tasks p WHERE p.doc = t.doc AND p.page = t.page
+                   AND p.stage_index = t.stage_index - 1 AND p.status = 'done'))"""
+        params = [*stages, max_attempts, now, now]
+        with self._transaction():
+            # Étapes avancées d'abord : les documents commencés se terminent avant d'en ouvrir d'autres
+            first = self.conn.execute(
+                f"SELECT t.doc, t.stage {available} ORDER BY t.stage_index DESC, d.submitted, t.page LIMIT 1",
+                params).fetchone()
+            if first is None:
+                return None
+            doc, stage = first["doc"], first["stage"]
+            pages = [row["page"] for row in self.conn.execute(
+                f"SELECT t.page {available} AND t.doc = ? AND t.stage = ? ORDER BY t.page LIMIT ?",
+                [*params, doc, stage, batch])]
+            self.conn.executemany(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                "updated = ? WHERE doc = ? AND stage = ? AND page = ?",
+                [(worker, now + lease, now, doc, stage, page) for page in pages])
+        return doc, stage, pages
+
+    def heartbeat(self, worker, doc, stage, pages, lease):
+        """Prolonge le bail ; renvoie les pages encore tenues par ce worker."""
+        now = time.time()
+        marks = ", ".join("?" * len(pages))
+        with self._transaction():
+            self.conn.execute(
+                f"UPDATE tasks SET lease_until = ?, updated = ? WHERE doc = ? AND stage = ? AND page IN ({marks}) "
+                "AND status = 'leased' AND worker = ?", (now + lease, now, doc, stage, *pages, worker))
+            return [row["page"] for row in self.conn.execute(
+                f"SELECT page FROM tasks WHERE doc = ? AND stage = ? AND page IN ({marks}) "
+                "AND status = 'leased' AND worker = ?", (doc, stage, *pages, worker))]
+
+    def complete(self, worker, doc, stage, done, failed, error, max_attempts, retry_delay, skipped=()):
+        """Pages faites ; pages en échec remises en attente (délai croissant) ou définitivement en échec.
+
+        skipped : pages faites écartées par le triage, dont les étapes suivantes sont ignorées dans la même
+        transaction (sinon un autre worker pourrait réserver leur extraction entre les deux).
+        """
+        now = time.time()
+        held = "doc = ? AND stage = ? AND page = ? AND status = 'leased' AND worker = ?"
+        with self._transaction():
+            self.conn.executemany(
+                f"UPDATE tasks SET status = 'done', error = NULL, lease_until = NULL, updated = ? WHERE {held}",
+                [(now, doc, stage, page, worker) for page in done])
+            self.conn.executemany(
+                "UPDATE tasks SET status = 'skipped', updated = ? WHERE doc = ? AND page = ? AND stage_index > ?",
+                [(now, doc, page, STAGE_ORDER.index(stage)) for page in skipped])
+            for page in failed:
+                row = self.conn.execute(f"SELECT attempts FROM tasks WHERE {held}",
+                                        (doc, stage, page, worker)).fetchone()
+                if row is None:
+                    continue  # bail perdu : la tâche a été reprise par un autre worker
+                status = "failed" if row["attempts"] >= max_attempts else "pending"
+                delay = retry_delay * 2 ** (row["attempts"] - 1)
+                self.conn.execute(
+                    f"UPDATE tasks SET status = ?, error = ?, not_before = ?, lease_until = NULL, updated = ? "
+                    f"WHERE {held}", (status, error, now + delay, now, doc, stage, page, worker))
+
+    def release(self, worker, doc, stage, pages):
+        """Rend des tâches réservées sans les compter comme tentative (arrêt du worker)."""
+        marks = ", ".join("?" * len(pages))
+        with self._transaction():
+            self.conn.execute(
+                f"UPDATE tasks SET status = 'pending', attempts = attempts - 1, lease_until = NULL, updated = ? "
+                f"WHERE doc = ? AND stage = ? AND page IN ({marks}) AND status = 'leased' AND worker = ?",
+                (time.time(), doc, stage, *pages, worker))
+
+    def expire(self, max_attempts):
+        """Bails expirés sans tentative restante : tâches en échec. Renvoie leur nombre."""
+        with self._transaction():
+            return self.conn.execute(
+                "UPDATE tasks SET status = 'failed', error = 'bail expiré', updated = ? "
+                "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (time.time(), time.time(), max_attempts)).rowcount
+
+    def busy(self):
+        """Reste-t-il des tâches à faire ou des documents à finaliser ?"""
+        return self.conn.execute(
+            "SELECT 1 FROM documents WHERE status IN ('running', 'finalizing') LIMIT 1").fetchone() is not None
+
+    # --- coordinateur ---
+
+    def documents_to_finalize(self):
+        """[(doc, statut)] : 'finalize' si toutes les tâches sont faites, 'failed' si l'une a échoué."""
+        out = []
+        for row in self.conn.execute(
+                "SELECT d.doc, SUM(t.status IN ('done', 'skipped')) AS done, SUM(t.status = 'failed') AS failed, "
+                "COUNT(*) AS n "
+                "FROM documents d JOIN tasks t ON t.doc = d.doc WHERE d.status = 'running' GROUP BY d.doc"):
+            if row["failed"]:
+                out.append((row["doc"], "failed"))
+            elif row["done"] == row["n"]:
+                out.append((row["doc"], "finalize"))
+        return out
+
+    def set_document_status(self, doc, status):
+        with self._transaction():
+            self.conn.execute("UPDATE documents SET status = ?, finished = ? WHERE doc = ?",
+                              (status, time.time() if status in ("done", "failed") else None, doc))
+
+    def status(self):
+        """{doc: {statut, étapes: {stage: {status: n}}}}."""
+        out = {}
+        for row in self.conn.execute("SELECT doc, status, pages FROM documents ORDER BY submitted"):
+            out[row["doc"]] = {"status": row["status"], "pages": row["pages"], "stages": {}}
+        for row in self.conn.execute("SELECT doc, stage, status, COUNT(*) AS n FROM tasks GROUP BY doc, stage, status"):
+            out[row["doc"]]["stages"].setdefault(row["stage"], {})[row["status"]] = row["n"]
+        return out
+
+
+class _Immediate:
+    """BEGIN IMMEDIATE ... COMMIT / ROLLBACK : un seul écrivain à la fois sur la base partagée."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+# --- exécution des tâches ---
+
+def stage_scripts(stage, options):
+    """Scripts d'une étape ; triage.py après pdfToTxtStyle.py si le document est soumis avec --triage."""
+    scripts = list(TASK_STAGES[stage])
+    if options.get("triage") and "pdfToTxtStyle.py" in scripts:
+        scripts.insert(scripts.index("pdfToTxtStyle.py") + 1, "triage.py")
+    return scripts
+
+
+def stage_commands(stage, doc_info, classif_server=None, triage_log=None):
+    """(script, commande) des scripts d'une étape, pour le dossier de travail du document."""
+    work = doc_info["work_dir"]
+    pdf_path = work / "PdfSource" / doc_info["pdf"]
+    options = doc_info["options"]
+    runs = ["--runs"] if options.get("style_runs") else []
+    render_dpi = options.get("render_dpi", 450)
+    crop_dpi = options.get("crop_dpi")
+    args = {
+        # Pages choisies par MALIN_PAGES, d'où "true" (toutes)
+        "pdfToImages.py": [pdf_path, work / "files", "true", "", "", render_dpi],
+        "pdfToTxtStyle.py": [pdf_path, work / "files_style", "true", *runs],
+        "cropImages.py": ["--pdf", pdf_path, "--dpi", crop_dpi] if crop_dpi else [],
+        "drawBoxes.py": ["--dpi", render_dpi],
+        "extraction-gemini-vision.py": ["--style", "false"],
+        "classification.py": ["--server", classif_server] if classif_server else [],
+        "style-post.py": ["--workers", 1],
+        "triage.py": ["--series", options.get("triage"), "--output", triage_log],
+    }
+    return [(script, [sys.executable, str(BASE_DIR / script), *map(str, args.get(script, []))])
+            for script in stage_scripts(stage, options)]
+
+
+def missing_pages(stage, doc_info, pages, skipped=()):
+    """Pages dont un artefact obligatoire d'un des scripts de l'étape manque (cf. run_manifest.py).
+
+    Pages écartées par le triage : seuls les scripts qui précèdent triage.py sont vérifiés.
+    """
+    work = doc_info["work_dir"]
+    style_runs = doc_info["options"].get("style_runs", False)
+    scripts = stage_scripts(stage, doc_info["options"])
+    missing = []
+    for page in pages:
+        for script in scripts:
+            if script == "triage.py":
+                if page in skipped:
+                    break
+                continue
+            required, _ = stage_artifacts(Path(script).stem, page, store=False, style_runs=style_runs)
+            if not all(list(work.glob(rel)) if "*" in rel else (work / rel).exists() for rel in required):
+                missing.append(page)
+                break
+    return missing
+
+
+def discard_artifacts(stage, doc_info, pages):
+    """Supprime les artefacts des scripts de l'étape pour ces pages (cf. RunManifest._discard).
+
+    Une tâche relancée repart de zéro : sinon une réponse Gemini illisible, gardée en JSON brut,
+    ne serait jamais redemandée (extraction-gemini-vision.py ne refait que le TSV).
+    """
+    work = doc_info["work_dir"]
+    style_runs = doc_info["options"].get("style_runs", False)
+    for script in stage_scripts(stage, doc_info["options"]):
+        if script == "triage.py":
+            continue
+        for page in pages:
+            required, optional = stage_artifacts(Path(script).stem, page, store=False, style_runs=style_runs)
+            for rel in required + optional:
+                for path in (work.glob(rel) if "*" in rel else [work / rel]):
+                    path.unlink(missing_ok=True)
+
+
+def run_task(queue, worker, doc, stage, pages, lease, heartbeat, classif_server=None):
+    """Lance les scripts de l'étape sur les pages en prolongeant le bail.
+
+    Renvoie (pages faites, pages en échec, message d'erreur, pages écartées par le triage).
+    Sortie des scripts dans logs/, journal du triage dans triage/.
+    """
+    doc_info = queue.document(doc)
+    work = doc_info["work_dir"]
+    env = os.environ.copy()
+    env["PYTHONIOENCODING"] = "utf-8"
+    env[WORKDIR_ENV] = str(work)
+    env[PAGES_ENV] = format_pages(pages)
+    env.pop("MALIN_STORE", None)
+
+    log_dir = work / "logs"
+    log_dir.mkdir(exist_ok=True)
+    log_path = log_dir / f"{stage}_{env[PAGES_ENV]}_{worker.replace(':', '-')}.log"
+    triage_log = work / "triage" / f"triage_{env[PAGES_ENV]}.json"
+    skipped = set()
+    discard_artifacts(stage, doc_info, pages)  # tentative précédente en échec ou bail expiré
+    with open(log_path, "a", encoding="utf-8") as log:
+        for script, cmd in stage_commands(stage, doc_info, classif_server, triage_log):
+            if not env[PAGES_ENV]:
+                break  # toutes les pages du lot écartées par le triage
+            log.write(f"\n$ {' '.join(cmd)}\n")
+            log.flush()
+            process = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env, cwd=BASE_DIR)
+            while True:
+                try:
+                    returncode = process.wait(timeout=heartbeat)
+                    break
+                except subprocess.TimeoutExpired:
+                    held = queue.heartbeat(worker, doc, stage, pages, lease)
+                    if len(held) < len(pages):
+                        # Bail expiré et repris ailleurs : inutile de continuer
+                        process.kill()
+                        process.wait()
+                        return [], pages, "bail perdu", set()
+            if returncode != 0:
+                return [], pages, f"{script} : code {returncode} (cf. {log_path.relative_to(queue.root)})", set()
+            if script == "triage.py":
+                skipped = skipped_pages(triage_log) & set(pages)
+                env[PAGES_ENV] = format_pages(p for p in pages if p not in skipped)
+
+    failed = missing_pages(stage, doc_info, pages, skipped)
+    done = [p for p in pages if p not in failed]
+    return done, failed, "artefacts manquants" if failed else None, skipped & set(done)
+
+
+def run_worker(args):
+    queue = JobQueue(args.queue)
+    worker = worker_id()
+    stages = args.stages.split(",") if args.stages else STAGE_ORDER
+    print(f"[INFO] Worker {worker} : étapes {', '.join(stages)}, lots de {args.batch} page(s)")
+    try:
+        while True:
+            claimed = queue.claim(worker, stages, args.batch, args.lease, args.max_attempts)
+            if claimed is None:
+                if args.exit_when_idle and not queue.busy():
+                    print("[DONE] Plus de tâches")
+                    return
+                time.sleep(args.poll)
+                continue
+            doc, stage, pages = claimed
+            print(f"[RUN] {doc} {stage} pages {format_pages(pages)}")
+            start = time.perf_counter()
+            try:
+                done, failed, error, skipped = run_task(queue, worker, doc, stage, pages, args.lease, args.heartbeat,
+                                                        args.classif_server)
+            except KeyboardInterrupt:
+                queue.release(worker, doc, stage, pages)
+                raise
+            queue.complete(worker, doc, stage, done, failed, error, args.max_attempts, args.retry_delay, skipped)
+            if skipped:
+                print(f"[SKIP] {doc} pages {format_pages(skipped)} écartées par le triage")
+            if failed:
+                print(f"[ERR] {doc} {stage} pages {format_pages(failed)} : {error}")
+            else:
+                print(f"[OK] {doc} {stage} pages {format_pages(done)} ({time.perf_counter() - start:.1f} s)")
+    except KeyboardInterrupt:
+        print("[INFO] Worker arrêté, tâches en cours rendues à la file")
+    finally:
+        queue.close()
+
+
+def run_coordinator(args):
+    queue = JobQueue(args.queue)
+    try:
+        while True:
+            expired = queue.expire(args.max_attempts)
+            if expired:
+                print(f"[WARN] {expired} tâche(s) en échec après expiration du bail")
+            for doc, action in queue.documents_to_finalize():
+                if action == "failed":
+                    queue.set_document_status(doc, "failed")
+                    print(f"[ERR] {doc} : tâches en échec, document non finalisé (cf. status)")
+                    continue
+                doc_info = queue.document(doc)
+                queue.set_document_status(doc, "finalizing")
+                print(f"[RUN] {doc} : organize_outputs.py")
+                env = os.environ.copy()
+                env["PYTHONIOENCODING"] = "utf-8"
+                env[WORKDIR_ENV] = str(doc_info["work_dir"])
+                env.pop(PAGES_ENV, None)
+                env.pop("MALIN_STORE", None)
+                result = subprocess.run([sys.executable, str(BASE_DIR / "organize_outputs.py"), doc_info["pdf"],
+                                         "--format", doc_info["options"].get("output_format", "files")],
+                                        env=env, cwd=BASE_DIR)
+                queue.set_document_status(doc, "done" if result.returncode == 0 else "failed")
+                merge_triage_logs(doc_info)
+                if result.returncode == 0:
+                    print(f"[OK] {doc} : {doc_info['work_dir'] / 'SORTIES' / doc_info['pdf']}")
+                else:
+                    print(f"[ERR] {doc} : organize_outputs.py a échoué")
+            if args.once or (args.exit_when_idle and not queue.busy()):
+                return
+            time.sleep(args.poll)
+    finally:
+        queue.close()
+
+
+def merge_triage_logs(doc_info):
+    """Journaux de triage des tâches réunis dans SORTIES/<pdf>/triage.json."""
+    logs = sorted((doc_info["work_dir"] / "triage").glob("triage_*.json"))
+    if not logs:
+        return
+    decisions = {}
+    for path in logs:
+        decisions.update(load_decisions(path))
+    output_root = doc_info["work_dir"] / "SORTIES" / doc_info["pdf"]
+    output_root.mkdir(parents=True, exist_ok=True)
+    save_decisions(output_root / TRIAGE_FILE, decisions, doc_info["options"].get("triage"), "triage_rules.json")
+
+
+def print_status(queue):
+    for doc, info in queue.status().items():
+        stages = ", ".join(
+            f"{stage} " + "/".join(f"{n} {status}" for status, n in sorted(counts.items()))
+            for stage, counts in sorted(info["stages"].items(), key=lambda kv: STAGE_ORDER.index(kv[0])))
+        print(f"{doc} [{info['status']}] {info['pages']} p. : {stages}")
+    for row in queue.conn.execute("SELECT doc, stage, page, attempts, error FROM tasks WHERE status = 'failed' "
+                                  "ORDER BY doc, stage_index, page"):
+        print(f"[ERR] {row['doc']} {row['stage']} page {row['page']} ({row['attempts']} tentative(s)) : "
+              f"{row['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="File de tâches par page pour traiter des PDF sur plusieurs machines")
+    parser.add_argument("--queue", type=Path, default=default_queue_dir(),
+                        help=f"Dossier partagé de la file (défaut : ${QUEUE_ENV} ou ./queue)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_submit = sub.add_parser("submit", help="Soumettre des PDF (toutes leurs pages)")
+    p_submit.add_argument("pdfs", nargs="+", type=Path)
+    p_submit.add_argument("--style-runs", action="store_true", help="Exporter les runs de caractères (cf. main.py)")
+    p_submit.add_argument("--output-format", choices=["files", "jsonl"], default="files")
+    p_submit.add_argument("--render-dpi", type=int, default=450, help="Résolution du rendu des pages (cf. main.py)")
+    p_submit.add_argument("--crop-dpi", type=int, default=None, help="Découpes rendues depuis le PDF (cf. main.py)")
+    p_submit.add_argument("--triage", nargs="?", const="default", default=None, metavar="SERIE",
+                          help="Écarter les pages sans exercices (collection de triage_rules.json, cf. main.py)")
+
+    p_worker = sub.add_parser("worker", help="Traiter des tâches")
+    p_worker.add_argument("--stages", type=str, default="",
+                          help=f"Étapes prises par ce worker, séparées par des virgules ({', '.join(STAGE_ORDER)})")
+    p_worker.add_argument("--batch", type=int, default=4,
+                          help="Pages par tâche réservée (modèles chargés une fois par lot)")
+    p_worker.add_argument("--classif-server", type=str, default=None, help="URL du service de classification")
+    p_worker.add_argument("--exit-when-idle", action="store_true", help="S'arrêter quand la file est vide")
+
+    p_coord = sub.add_parser("coordinator", help="Finaliser les documents terminés (organize_outputs)")
+    p_coord.add_argument("--once", action="store_true", help="Un seul passage")
+    p_coord.add_argument("--exit-when-idle", action="store_true", help="S'arrêter quand tout est finalisé")
+
+    for p in (p_worker, p_coord):
+        p.add_argument("--lease", type=float, default=600, help="Durée du bail d'une tâche (s)")
+        p.add_argument("--max-attempts", type=int, default=3, help="Tentatives par tâche avant échec définitif")
+        p.add_argument("--poll", type=float, default=5, help="Attente entre deux consultations de la file (s)")
+    p_worker.add_argument("--heartbeat", type=float, default=30, help="Intervalle de prolongation du bail (s)")
+    p_worker.add_argument("--retry-delay", type=float, default=30, help="Attente avant la 1re reprise (s), doublée ensuite")
+
+    sub.add_parser("status", help="Avancement par document et par étape")
+
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        queue = JobQueue(args.queue)
+        for pdf in args.pdfs:
+            if not pdf.exists():
+                print(f"[ERR] PDF introuvable : {pdf}")
+                continue
+            options = {"style_runs": args.style_runs, "output_format": args.output_format,
+                       "render_dpi": args.render_dpi, "crop_dpi": args.crop_dpi, "triage": args.triage}
+            if queue.submit(pdf, options):
+                print(f"[OK] {pdf.name} soumis ({queue.document(pdf.stem)['pages']} pages)")
+            else:
+                print(f"[SKIP] {pdf.name} déjà soumis")
+        queue.close()
+    elif args.command == "worker":
+        if args.stages:
+            for stage in args.stages.split(","):
+                if stage not in TASK_STAGES:
+                    parser.error(f"étape inconnue : {stage} (choix : {', '.join(STAGE_ORDER)})")
+        if args.heartbeat >= args.lease:
+            parser.error("--heartbeat doit être plus court que --lease")
+        run_worker(args)
+    elif args.command == "coordinator":
+        run_coordinator(args)
+    else:
+        queue = JobQueue(args.queue)
+        print_status(queue)
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
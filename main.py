@@ -2,11 +2,22 @@ import os
 import shutil
 import subprocess
 import sys
+import time
 import argparse
 from pathlib import Path
 
-# Définition du chemin de base
+from docstore import STORE_ENV, open_store
+from fingerprints import archive_pages, carry_over, load_fingerprints, match_pages, page_fingerprints
+from memory_budget import MAX_PAGES_ENV
+from profiling import PROFILE_DIR_ENV, PROFILE_ENV, STAGES, profiled_stages, python_cmd, write_summary
+from run_manifest import PAGE_STAGES, RunManifest, pdf_page_count
+from run_report import RunReport, rss_mb
+from triage import TRIAGE_FILE, skipped_pages
+from workspace import PAGES_ENV, format_pages, work_dir
+
+# Définition du chemin de base (scripts) et du dossier de travail (données, MALIN_WORKDIR)
 BASE_DIR = Path(__file__).resolve().parent
+WORK_DIR = work_dir()
 
 # Dossiers à nettoyer
 DIRS_TO_RESET = [
@@ -19,30 +30,68 @@ DIRS_TO_RESET = [
 def reset_directories():
     """Supprime et recrée les dossiers de sortie."""
     for directory in DIRS_TO_RESET:
-        dir_path = BASE_DIR / directory
+        dir_path = WORK_DIR / directory
         shutil.rmtree(dir_path, ignore_errors=True)
         os.makedirs(dir_path, exist_ok=True)
         print(f"[OK] Reset: {dir_path}")
 
 
-def run_script(script_name, *args):
-    """Exécute un script python externe avec des arguments et l'encodage forcé."""
+def reset_store(pdf_name):
+    """(Re)crée la base unique des artefacts du document et l'active pour les scripts (MALIN_STORE)."""
+    store_path = WORK_DIR / "store" / f"{Path(pdf_name).stem}.sqlite"
+    store_path.parent.mkdir(exist_ok=True)
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{store_path}{suffix}").unlink(missing_ok=True)
+    os.environ[STORE_ENV] = str(store_path)
+    print(f"[OK] Store: {store_path}")
+
+
+def reuse_store(pdf_name):
+    """Reprise : réactive la base existante du document sans la vider."""
+    store_path = WORK_DIR / "store" / f"{Path(pdf_name).stem}.sqlite"
+    store_path.parent.mkdir(exist_ok=True)
+    os.environ[STORE_ENV] = str(store_path)
+    print(f"[OK] Store (reprise): {store_path}")
+
+
+def run_script(script_name, *args, report=None, manifest=None):
+    """Exécute un script python externe avec des arguments et l'encodage forcé.
+
+    report : RunReport où enregistrer temps réel, CPU, pic de RSS et volumes de l'étape.
+    manifest : RunManifest ; l'étape ne tourne que sur ses pages restantes (MALIN_PAGES)
+    et l'état de chaque page est enregistré à la fin.
+    """
     script_path = BASE_DIR / script_name
 
     if not script_path.exists():
         print(f"[ERR] Script not found: {script_path}")
         sys.exit(1)
 
+    stage = Path(script_name).stem
+    pending = None
+    if manifest is not None and stage in PAGE_STAGES:
+        pending = manifest.pending(stage)
+        if not pending:
+            print(f"\n[SKIP] {script_name} : toutes les pages sont déjà faites")
+            return
+        if len(pending) < len(manifest.data["pages"]):
+            os.environ[PAGES_ENV] = format_pages(pending)
+            print(f"\n[INFO] {script_name} : pages restantes {os.environ[PAGES_ENV]}")
+        else:
+            os.environ.pop(PAGES_ENV, None)
+        manifest.begin_stage(stage, pending)
+
     print(f"\n[RUN] Running {script_name}...")
 
-    # On convertit tous les arguments en string pour subprocess
-    cmd_args = [sys.executable, str(script_path), *map(str, args)]
+    # On convertit tous les arguments en string pour subprocess (sous cProfile si l'étape est profilée)
+    cmd_args = [*python_cmd(stage, script_path), *map(str, args)]
 
     # --- MODIFICATION ICI : Création d'un environnement modifié ---
     my_env = os.environ.copy()
     my_env["PYTHONIOENCODING"] = "utf-8"
     # --------------------------------------------------------------
 
+    start = time.perf_counter()
     process = subprocess.Popen(
         cmd_args,
         stdout=subprocess.PIPE,
@@ -60,15 +109,49 @@ def run_script(script_name, *args):
             break
 
     process.stdout.close()
-    process.wait()
+    usage = None
+    if hasattr(os, "wait4"):
+        # POSIX : on récupère aussi la consommation CPU / mémoire du processus
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    else:
+        process.wait()
+
+    wall = time.perf_counter() - start
+    if pending is not None:
+        failed = manifest.finish_stage(stage, pending, process.returncode)
+        if failed:
+            print(f"[WARN] {script_name} : pages sans artefacts complets {format_pages(failed)}")
+    elif manifest is not None:
+        manifest.finish_document_stage(stage, process.returncode)
+    if report is not None:
+        report.add_stage(script_name, wall, usage, process.returncode)
+    if usage is not None:
+        print(f"[INFO] {script_name} : {wall:.1f} s, pic RSS {rss_mb(usage.ru_maxrss):.0f} Mo")
+    if stage in profiled_stages():
+        summarize_profile(stage, report)
 
     if process.returncode == 0:
         print(f"[OK] {script_name} finished successfully")
     else:
         print(f"[ERR] {script_name} failed. Stopping pipeline.")
+        if report is not None:
+            report.save()
         sys.exit(1)
 
 
+def summarize_profile(stage, report=None):
+    """Top N des points chauds de tous les <stage>*.prof, à côté du rapport d'exécution."""
+    profile_dir = Path(os.environ[PROFILE_DIR_ENV])
+    txt = write_summary(sorted(profile_dir.glob(f"{stage}*.prof")), profile_dir / f"{stage}.txt")
+    if txt is None:
+        print(f"[WARN] Aucun profil pour {stage}")
+        return
+    print(f"[OK] Profile: {txt}")
+    if report is not None:
+        report.annotate(**{f"profile_{stage}": str(txt.relative_to(report.path.parent))})
+
+
 def str2bool(v):
     """Fonction utilitaire pour convertir un string en booléen."""
     if isinstance(v, bool):
@@ -96,10 +179,69 @@ if __name__ == "__main__":
     # 3. Gestion du style (Optionnel, défaut False)
     parser.add_argument("--style", type=str, default="false", help="Mode style (true/false)")
 
+    # 4. Service de classification déjà lancé (optionnel, sinon inference.py par page)
+    parser.add_argument("--classif-server", type=str, default=None,
+                        help="URL du service de classification (ex: http://127.0.0.1:8765)")
+
+    # 5. Classification multi-cœurs (K processus x T threads, cf. sharded_inference.py autotune)
+    parser.add_argument("--classif-workers", type=int, default=None, help="Nombre de processus de classification")
+    parser.add_argument("--classif-threads", type=int, default=1, help="Threads torch par processus")
+
+    # 6. Post-traitement du style en parallèle sur les pages
+    parser.add_argument("--style-workers", type=int, default=1, help="Nombre de processus pour style-post")
+
+    # 7. Styles exacts par caractère (page_N.runs.json) au lieu du style dominant de ligne du CSV
+    parser.add_argument("--style-runs", action="store_true",
+                        help="Exporter les runs de caractères PyMuPDF, lus directement par style-post")
+
+    # 8. Artefacts intermédiaires dans une base SQLite par document au lieu de petits fichiers par page
+    parser.add_argument("--store", action="store_true",
+                        help="Stocker lignes, détections, exercices et prédictions dans store/<pdf>.sqlite")
+
+    # 9. Format des sorties classées : un JSON par exercice (files) ou un .jsonl par catégorie (jsonl)
+    parser.add_argument("--output-format", choices=["files", "jsonl"], default="files",
+                        help="Format des dossiers CategorisationExercices de SORTIES/")
+
+    # 10. Profilage cProfile d'étapes choisies (ex: pdfToTxtStyle,style-post,inference)
+    parser.add_argument("--profile", type=str, default="",
+                        help=f"Étapes à profiler, séparées par des virgules ({', '.join(STAGES)})")
+
+    # 11. Mode mémoire bornée (très gros manuels) : au plus N pages décodées à la fois par étape
+    parser.add_argument("--max-pages-in-memory", type=int, default=None,
+                        help="Pages décodées simultanément au maximum (lots YOLO, appels Gemini), tampons libérés "
+                             "entre les pages")
+
+    # 12. Reprise d'une exécution interrompue (run_manifest.json du dossier de travail)
+    parser.add_argument("--resume", action="store_true",
+                        help="Reprendre l'exécution interrompue : seules les pages non terminées de chaque étape "
+                             "sont relancées")
+
+    # 13. Nouvelle édition d'un manuel déjà traité : seules les pages modifiées sont retraitées
+    parser.add_argument("--previous", type=str, default=None,
+                        help="PDF de l'édition précédente (sorties dans SORTIES/<pdf>) dont les pages inchangées "
+                             "sont reprises")
+
+    # 14. Résolutions par usage : raster des pages (YOLO, Gemini, drawBoxes) et découpes rendues depuis le PDF
+    parser.add_argument("--render-dpi", type=int, default=450,
+                        help="Résolution du rendu des pages (détection, images annotées envoyées à Gemini)")
+    parser.add_argument("--crop-dpi", type=int, default=None,
+                        help="Rendre les découpes d'images depuis le PDF à cette résolution au lieu de les "
+                             "prendre dans le rendu des pages")
+
+    # 15. Triage des pages (sommaire, leçons, corrigés) avant détection et Gemini, règles par collection
+    parser.add_argument("--triage", nargs="?", const="default", default=None, metavar="SERIE",
+                        help="Écarter les pages sans exercices avant détection et Gemini (collection de "
+                             "triage_rules.json, défaut : default)")
+    parser.add_argument("--triage-rules", type=str, default=None, help="Fichier de règles de triage")
+
     args = parser.parse_args()
+    profile = [s.strip() for s in args.profile.split(",") if s.strip()]
+    for stage in profile:
+        if stage not in STAGES:
+            parser.error(f"étape inconnue pour --profile : {stage} (choix : {', '.join(STAGES)})")
 
     # --- INITIALISATION DES VARIABLES ---
-    PDF_PATH = BASE_DIR / "PdfSource" / args.pdf_name
+    PDF_PATH = WORK_DIR / "PdfSource" / args.pdf_name
 
     if not PDF_PATH.exists():
         print(f"[ERREUR] Le fichier PDF est introuvable ici : {PDF_PATH}")
@@ -128,15 +270,103 @@ if __name__ == "__main__":
 
     # --- EXÉCUTION DU PIPELINE ---
 
-    reset_directories()
-    run_script("pdfToImages.py", PDF_PATH, BASE_DIR / "files", all_flag, FIRST_PAGE, LAST_PAGE)
-    run_script("pdfToTxtStyle.py", PDF_PATH, BASE_DIR / "files_style", all_flag, FIRST_PAGE, LAST_PAGE)
-    run_script("detectImages.py")
-    run_script("cropImages.py")
-    run_script("drawBoxes.py")
-    run_script("extraction-gemini-vision.py", "--style", "false")
-    run_script("classification.py")
-    run_script("style-post.py")
-    run_script("organize_outputs.py", args.pdf_name)
+    # Pages et options qui déterminent les artefacts : une reprise doit les retrouver à l'identique
+    options = {"all": ALL_PAGES, "first": FIRST_PAGE, "last": LAST_PAGE,
+               "style_runs": args.style_runs, "store": args.store, "previous": args.previous,
+               "render_dpi": args.render_dpi, "crop_dpi": args.crop_dpi, "triage": args.triage}
+    total = pdf_page_count(PDF_PATH)
+    pages = range(1, total + 1) if ALL_PAGES else range(max(1, FIRST_PAGE), min(LAST_PAGE, total) + 1)
+
+    if args.resume:
+        manifest = RunManifest.load(WORK_DIR)
+        if manifest is None:
+            print(f"[ERR] Aucune exécution à reprendre dans {WORK_DIR}")
+            sys.exit(1)
+        problem = manifest.check_resumable(args.pdf_name, PDF_PATH, options)
+        if problem:
+            print(f"[ERR] Reprise impossible : {problem}")
+            sys.exit(1)
+        print(f"[INFO] Reprise de l'exécution du {manifest.data['created']}")
+        if args.store:
+            reuse_store(args.pdf_name)
+    else:
+        reset_directories()
+        (WORK_DIR / TRIAGE_FILE).unlink(missing_ok=True)  # décisions d'un document précédent
+        if args.store:
+            reset_store(args.pdf_name)
+        manifest = RunManifest.create(WORK_DIR, args.pdf_name, PDF_PATH, pages, options)
+
+    # Empreintes des pages (archivées avec les sorties) ; reprise des pages inchangées de l'édition précédente
+    fingerprints = page_fingerprints(PDF_PATH, pages)
+    if args.previous and not args.resume:
+        previous_root = WORK_DIR / "SORTIES" / args.previous
+        previous = load_fingerprints(previous_root)
+        if not previous:
+            print(f"[WARN] Aucune empreinte dans {previous_root} : toutes les pages sont traitées")
+        store = open_store()
+        carried = carry_over(WORK_DIR, previous_root, match_pages(previous, fingerprints), store)
+        if store is not None:
+            store.close()
+        manifest.mark_carried(carried)
+        print(f"[INFO] {len(carried)} page(s) inchangée(s) reprise(s) de {args.previous}, "
+              f"{len(fingerprints) - len(carried)} page(s) à traiter")
+    report = RunReport(args.pdf_name, WORK_DIR)
+    if args.max_pages_in_memory:
+        os.environ[MAX_PAGES_ENV] = str(max(1, args.max_pages_in_memory))
+        print(f"[INFO] Mode mémoire bornée : {os.environ[MAX_PAGES_ENV]} page(s) décodée(s) au plus par étape")
+    if profile:
+        os.environ[PROFILE_ENV] = ",".join(profile)
+        os.environ[PROFILE_DIR_ENV] = str(report.path.parent / "profiles")
+        if "style-post" in profile and args.style_workers > 1:
+            # cProfile ne suit pas les processus du pool : profil séquentiel
+            print("[WARN] style-post profilé : --style-workers ignoré (1 processus)")
+            args.style_workers = 1
+    run_script("pdfToImages.py", PDF_PATH, WORK_DIR / "files", all_flag, FIRST_PAGE, LAST_PAGE, args.render_dpi,
+               report=report, manifest=manifest)
+    style_args = ["--runs"] if args.style_runs else []
+    run_script("pdfToTxtStyle.py", PDF_PATH, WORK_DIR / "files_style", all_flag, FIRST_PAGE, LAST_PAGE, *style_args,
+               report=report, manifest=manifest)
+    if args.triage:
+        os.environ.pop(PAGES_ENV, None)  # triage de toutes les pages extraites
+        triage_args = ["--series", args.triage, *(["--rules", args.triage_rules] if args.triage_rules else [])]
+        run_script("triage.py", *triage_args, report=report, manifest=manifest)
+        skipped = skipped_pages(WORK_DIR / TRIAGE_FILE) & set(manifest.data["pages"])
+        manifest.apply_triage("pdfToTxtStyle", skipped)
+        report.annotate(triage_skipped_pages=len(skipped))
+        print(f"[INFO] Triage : {len(skipped)} page(s) écartée(s) de la détection, de Gemini et de la "
+              f"classification")
+    run_script("detectImages.py", report=report, manifest=manifest)
+    crop_args = ["--pdf", PDF_PATH, "--dpi", args.crop_dpi] if args.crop_dpi else []
+    run_script("cropImages.py", *crop_args, report=report, manifest=manifest)
+    run_script("drawBoxes.py", "--dpi", args.render_dpi, report=report, manifest=manifest)
+    run_script("extraction-gemini-vision.py", "--style", "false", report=report, manifest=manifest)
+    if args.classif_server:
+        run_script("classification.py", "--server", args.classif_server, report=report, manifest=manifest)
+    elif args.classif_workers:
+        run_script("classification.py", "--workers", args.classif_workers, "--threads", args.classif_threads,
+                   report=report, manifest=manifest)
+    else:
+        run_script("classification.py", report=report, manifest=manifest)
+    if "inference" in profile:
+        summarize_profile("inference", report)
+    run_script("style-post.py", "--workers", args.style_workers, report=report, manifest=manifest)
+    prune_args = ["--prune"] if args.previous else []
+    run_script("organize_outputs.py", args.pdf_name, "--format", args.output_format, *prune_args, report=report,
+               manifest=manifest)
+
+    store = open_store()
+    archived = archive_pages(WORK_DIR, WORK_DIR / "SORTIES" / args.pdf_name, fingerprints, store,
+                             prune=bool(args.previous))
+    if store is not None:
+        store.close()
+    print(f"[OK] {archived} page(s) archivée(s) avec leur empreinte : {WORK_DIR / 'SORTIES' / args.pdf_name}")
+
+    if args.triage and (WORK_DIR / TRIAGE_FILE).exists():
+        shutil.copy(WORK_DIR / TRIAGE_FILE, WORK_DIR / "SORTIES" / args.pdf_name / TRIAGE_FILE)
+        print(f"[OK] Journal du triage : {WORK_DIR / 'SORTIES' / args.pdf_name / TRIAGE_FILE}")
 
+    report.save()
+    for stage, counts in manifest.summary().items():
+        print(f"[INFO] {stage} : {counts['done']} faite(s), {counts['failed']} en échec, "
+              f"{counts['pending']} restante(s), {counts['skipped']} écartée(s)")
     print("\n[DONE] All tasks completed successfully!")
\ No newline at end of file
@@ -0,0 +1,40 @@
+import ctypes
+import ctypes.util
+import gc
+import os
+import sys
+
+# Mode mémoire bornée (main.py --max-pages-in-memory N) pour les très gros manuels :
+# une page A4 rendue à 450 dpi pèse ~58 Mo une fois décodée (3700x5260 RGB).
+# MALIN_MAX_PAGES = nombre maximal de pages décodées en même temps dans une étape
+# (lots YOLO de detectImages, appels Gemini simultanés de l'extraction). Les étapes
+# libèrent aussi explicitement leurs tampons entre deux pages.
+# Sans MALIN_MAX_PAGES, comportement habituel.
+
+MAX_PAGES_ENV = "MALIN_MAX_PAGES"
+
+
+def page_budget():
+    """Nombre maximal de pages décodées simultanément, ou None si le mode n'est pas activé."""
+    value = os.environ.get(MAX_PAGES_ENV)
+    return max(1, int(value)) if value else None
+
+
+_libc = None
+
+
+def release_buffers():
+    """Libère les tampons d'une page traitée (mode mémoire bornée uniquement).
+
+    gc.collect() pour les cycles (résultats YOLO, dicts PyMuPDF), puis malloc_trim
+    pour rendre au système la mémoire libérée par glibc (Linux).
+    """
+    global _libc
+    if page_budget() is None:
+        return
+    gc.collect()
+    if sys.platform.startswith("linux"):
+        if _libc is None:
+            _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+        if hasattr(_libc, "malloc_trim"):
+            _libc.malloc_trim(0)
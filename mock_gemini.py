@@ -0,0 +1,253 @@
+import argparse
+import csv
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Serveur local qui imite l'endpoint generateContent de Gemini, pour tester en charge
+# extraction-gemini-vision.py sans consommer de quota (100 % hors-ligne).
+# Réponses : exercices construits depuis le CSV du prompt (numéro en début de ligne = nouvel exercice),
+# ou une réponse fixe (--canned). Pannes simulées : latence, erreurs 429, balises ```json mal formées,
+# JSON tronqué.
+
+# Run ce script avec :
+# python mock_gemini.py --port 8766 --latency-ms 2000 --latency-dist lognormal \
+# --rate-429 0.05 --rate-bad-fence 0.05 --rate-truncated 0.02 --max-concurrent 8
+# puis :
+# python extraction-gemini-vision.py --base-url http://127.0.0.1:8766 --workers 8
+
+# Endpoints :
+# POST /v1beta/models/<modèle>:generateContent  (format de l'API Gemini, appelé par genai.Client)
+# GET  /health
+# GET  /metrics
+
+CSV_MARKER = '--- { CSV input :  "\n'
+
+LATENCY_DISTS = ["fixed", "uniform", "exponential", "lognormal"]
+
+QUOTA_ERROR = {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                         "message": "Resource has been exhausted (e.g. check quota)."}}
+
+
+class FaultPlan:
+    """Tirages (latence, panne) reproductibles d'une requête à l'autre (--seed)."""
+
+    def __init__(self, latency_ms=0.0, latency_dist="fixed", rate_429=0.0, rate_bad_fence=0.0, rate_truncated=0.0,
+                 max_concurrent=None, seed=0):
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.rates = [("quota", rate_429), ("bad_fence", rate_bad_fence), ("truncated", rate_truncated)]
+        self.max_concurrent = max_concurrent
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self):
+        """-> (latence en secondes, panne : None | quota | bad_fence | truncated)."""
+        with self.lock:
+            if self.latency_dist == "fixed":
+                latency = self.latency_ms
+            elif self.latency_dist == "uniform":
+                latency = self.rng.uniform(0, 2 * self.latency_ms)
+            elif self.latency_dist == "exponential":
+                latency = self.rng.expovariate(1 / self.latency_ms) if self.latency_ms else 0.0
+            else:
+                # médiane = latency_ms, queue longue
+                latency = self.latency_ms * self.rng.lognormvariate(0, 0.5)
+            u = self.rng.random()
+        fault = None
+        for name, rate in self.rates:
+            if u < rate:
+                fault = name
+                break
+            u -= rate
+        return latency / 1000, fault
+
+
+def prompt_text(request):
+    """Concatène les parties texte des contents de la requête (les images sont ignorées)."""
+    texts = []
+    for content in request.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                texts.append(part["text"])
+    return "\n".join(texts)
+
+
+def page_key(request):
+    """Pseudo numéro de page stable pour les ids (le prompt ne contient pas le numéro de page) :
+    empreinte de l'image et du texte de la requête, indépendante de l'ordre d'arrivée (--workers N)."""
+    h = hashlib.sha256()
+    for content in request.get("contents", []):
+        for part in content.get("parts", []):
+            inline = part.get("inlineData") or part.get("inline_data") or {}
+            h.update(str(inline.get("data", "")).encode())
+            h.update(part.get("text", "").encode("utf-8"))
+    return int(h.hexdigest()[:8], 16)
+
+
+def template_exercises(prompt, page):
+    """Exercices au format de prompt.txt depuis le CSV du prompt : une ligne "N texte" ouvre l'exercice N."""
+    side_text = prompt.split(CSV_MARKER, 1)[1].rsplit('\n"}', 1)[0] if CSV_MARKER in prompt else ""
+    phrases = [row["phrase"] for row in csv.DictReader(io.StringIO(side_text), delimiter=";") if row.get("phrase")]
+
+    exercises = []
+    for phrase in phrases:
+        m = re.match(r"^(\d+)\s+(.*)$", phrase)
+        if m or not exercises:
+            number, instruction = (m.group(1), m.group(2)) if m else (str(len(exercises) + 1), phrase)
+            exercises.append({"id": f"p{page}_ex{number}", "type": "exercise", "images": False, "image_type": "none",
+                              "properties": {"number": number, "instruction": instruction, "labels": [],
+                                             "statement": "", "hint": None, "example": None, "references": None}})
+        else:
+            props = exercises[-1]["properties"]
+            props["statement"] = f"{props['statement']}\n{phrase}" if props["statement"] else phrase
+    return exercises
+
+
+def apply_fault(text, fault):
+    if fault == "bad_fence":
+        # Texte avant la balise et balise fermante absente
+        return f"Voici les exercices extraits :\n```json\n{text}\n"
+    if fault == "truncated":
+        return text[:max(1, len(text) // 2)]
+    return f"```json\n{text}\n```"
+
+
+class MockGemini:
+    def __init__(self, plan, canned=None):
+        self.plan = plan
+        self.canned = canned
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.stats = {"requests": 0, "ok": 0, "quota": 0, "concurrency_429": 0, "bad_fence": 0, "truncated": 0,
+                      "max_inflight": 0, "latency_seconds": 0.0}
+
+    def _count(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+    def generate(self, model, request):
+        """-> (statut HTTP, réponse JSON)."""
+        with self.lock:
+            self.stats["requests"] += 1
+            self.inflight += 1
+            self.stats["max_inflight"] = max(self.stats["max_inflight"], self.inflight)
+            over_limit = self.plan.max_concurrent is not None and self.inflight > self.plan.max_concurrent
+        try:
+            if over_limit:
+                self._count("concurrency_429")
+                return 429, QUOTA_ERROR
+
+            latency, fault = self.plan.draw()
+            time.sleep(latency)
+            self._count("latency_seconds", latency)
+            if fault == "quota":
+                self._count("quota")
+                return 429, QUOTA_ERROR
+
+            if self.canned is not None:
+                text = self.canned
+            else:
+                exercises = template_exercises(prompt_text(request), page_key(request))
+                text = json.dumps(exercises, ensure_ascii=False, indent=2)
+            self._count(fault or "ok")
+            return 200, {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": apply_fault(text, fault)}]},
+                                "finishReason": "MAX_TOKENS" if fault == "truncated" else "STOP", "index": 0}],
+                "usageMetadata": {"promptTokenCount": len(prompt_text(request)) // 4,
+                                  "candidatesTokenCount": len(text) // 4,
+                                  "totalTokenCount": (len(prompt_text(request)) + len(text)) // 4},
+                "modelVersion": model,
+            }
+        finally:
+            with self.lock:
+                self.inflight -= 1
+
+    def metrics(self):
+        with self.lock:
+            stats = dict(self.stats)
+        answered = stats["requests"] - stats["concurrency_429"] or 1
+        stats["mean_latency_ms"] = 1000 * stats["latency_seconds"] / answered
+        return stats
+
+
+def make_handler(mock, started_at):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok"})
+            elif self.path == "/metrics":
+                metrics = mock.metrics()
+                metrics["uptime_seconds"] = time.time() - started_at
+                self._send(200, metrics)
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            m = re.match(r"^/[^/]+/models/([^/:]+):generateContent", self.path)
+            if not m:
+                self._send(404, {"error": {"code": 404, "message": f"not found: {self.path}", "status": "NOT_FOUND"}})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length).decode("utf-8"))
+            except ValueError as e:
+                self._send(400, {"error": {"code": 400, "message": f"JSON invalide : {e}",
+                                           "status": "INVALID_ARGUMENT"}})
+                return
+            self._send(*mock.generate(m.group(1), request))
+
+        def log_message(self, format, *args):
+            pass  # pas de log par requête
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--canned", default=None, help="Fichier dont le contenu est renvoyé à chaque requête")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latence (moyenne ou médiane selon la loi)")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTS, default="fixed")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Part des requêtes refusées (quota)")
+    parser.add_argument("--rate-bad-fence", type=float, default=0.0,
+                        help="Part des réponses avec texte avant ```json et sans balise fermante")
+    parser.add_argument("--rate-truncated", type=float, default=0.0, help="Part des réponses au JSON coupé")
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="Au-delà de N requêtes simultanées : 429 immédiat")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    canned = None
+    if args.canned:
+        with open(args.canned, "r", encoding="utf-8") as f:
+            canned = f.read()
+
+    plan = FaultPlan(args.latency_ms, args.latency_dist, args.rate_429, args.rate_bad_fence, args.rate_truncated,
+                     args.max_concurrent, args.seed)
+    mock = MockGemini(plan, canned)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(mock, time.time()))
+    print(f"[OK] Gemini simulé sur http://{args.host}:{args.port} "
+          f"(latence {args.latency_ms} ms {args.latency_dist}, 429 {args.rate_429:.0%}, "
+          f"balises {args.rate_bad_fence:.0%}, tronqué {args.rate_truncated:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"[INFO] Bilan : {json.dumps(mock.metrics(), ensure_ascii=False)}")
@@ -1,12 +1,15 @@
 import os
+import csv
+import hashlib
 import json
 import shutil
 import argparse
-import pandas as pd
-from pathlib import Path
 import sys
 import re
 
+from docstore import open_store, page_of
+from workspace import work_dir
+
 if sys.platform == "win32":
     sys.stdout.reconfigure(encoding="utf-8")
 
@@ -37,9 +40,136 @@ def convert_id(old_id):
     return old_id
 
 
-def organize(pdf_name):
+STATE_FILE = "organize_state.json"
+
+
+def digest(*parts):
+    """Empreinte des entrées d'une page (bytes des fichiers sources ou données de la base)."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(b"\0missing" if part is None else part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def file_pages(extraction_dir, extraction_style_dir, classification_dir):
+    """(page, empreinte des sources, chargement) depuis les fichiers des étapes.
+
+    chargement() -> (prédictions, exercices, exercices stylisés ou None) ; n'est appelé que si la page a changé.
+    """
+    for tsv_path in classification_dir.glob("pred_page_*.tsv"):
+
+        page_name = tsv_path.stem.replace("pred_", "")
+        json_path = extraction_dir / f"{page_name}.json"
+        json_style_path = extraction_style_dir / f"{page_name}--style.json"
+
+        if not json_path.exists():
+            continue
+
+        # Une seule lecture par fichier : l'empreinte et le parsing partent des mêmes bytes
+        tsv_bytes = tsv_path.read_bytes()
+        json_bytes = json_path.read_bytes()
+        style_bytes = json_style_path.read_bytes() if json_style_path.exists() else None
+
+        def load(tsv_bytes=tsv_bytes, json_bytes=json_bytes, style_bytes=style_bytes):
+            rows = csv.DictReader(tsv_bytes.decode("utf-8").splitlines(), delimiter="\t")
+            pred_map = {row["id"]: row["pred"] for row in rows}
+            exercises = json.loads(json_bytes.decode("utf-8"))
+            style_data = json.loads(style_bytes.decode("utf-8")) if style_bytes is not None else None
+            return pred_map, exercises, style_data
+
+        yield page_name, digest(tsv_bytes, json_bytes, style_bytes), load
+
+
+def store_pages(store):
+    """Même chose depuis le stockage unique du document (MALIN_STORE)."""
+    for page in store.pages("predictions"):
+        if not store.has_page(page, "exercises"):
+            continue
+        style_data = store.get_styled(page) if store.has_page(page, "styled") else None
+        data = (store.get_predictions(page), store.get_exercises(page), style_data)
+        encoded = json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        yield f"page_{page}", digest(encoded), lambda data=data: data
+
+
+def load_state(state_path):
+    """Manifeste de la dernière exécution : {page: {digest, files, total, matched}}."""
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)["pages"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def save_state(state_path, pages):
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"pages": pages}, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+
+
+class FileOutput:
+    """Sortie par défaut : un fichier JSON indenté par exercice dans le dossier de sa catégorie."""
+
+    def __init__(self, out_classification, out_classification_style):
+        self.roots = (out_classification, out_classification_style)
+        for root in self.roots:
+            for label in LABEL_DICT.keys():
+                (root / get_folder_name(label)).mkdir(exist_ok=True)
+
+    def write(self, folder, new_id, ex_obj, style_obj):
+        """Écrit les fichiers de l'exercice et renvoie leurs chemins."""
+        written = []
+        for root, obj in zip(self.roots, (ex_obj, style_obj)):
+            if obj is not None:
+                path = root / folder / f"{new_id}.json"
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(obj, f, indent=4, ensure_ascii=False)
+                written.append(path)
+        return written
+
+    def close(self, output_root, summary):
+        pass
+
+
+class JsonlOutput:
+    """Sortie archive : un fichier <catégorie>.jsonl par catégorie (un exercice par ligne) + manifest.json."""
+
+    def __init__(self, out_classification, out_classification_style):
+        self.roots = (out_classification, out_classification_style)
+        self.files = {}
+        self.counts = {}
+
+    def write(self, folder, new_id, ex_obj, style_obj):
+        for i, (root, obj) in enumerate(zip(self.roots, (ex_obj, style_obj))):
+            if obj is None:
+                continue
+            if (i, folder) not in self.files:
+                self.files[(i, folder)] = open(root / f"{folder}.jsonl", "w", encoding="utf-8")
+            self.files[(i, folder)].write(json.dumps(obj, ensure_ascii=False) + "\n")
+            self.counts[(i, folder)] = self.counts.get((i, folder), 0) + 1
+        return []  # fichiers par catégorie, pas par page
+
+    def close(self, output_root, summary):
+        for f in self.files.values():
+            f.close()
+        manifest = dict(summary, format="jsonl", categories={})
+        for (i, folder), count in sorted(self.counts.items()):
+            root = self.roots[i]
+            entry = manifest["categories"].setdefault(folder, {})
+            entry["style" if i else "normal"] = {"file": f"{root.name}/{folder}.jsonl", "count": count}
+        with open(output_root / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=4, ensure_ascii=False)
+        print(f"[OK] Manifest : {output_root / 'manifest.json'}")
+
+
+OUTPUT_FORMATS = {"files": FileOutput, "jsonl": JsonlOutput}
+
 
-    base_dir = Path(__file__).resolve().parent
+def organize(pdf_name, output_format="files", prune=False):
+    """prune : supprime les sorties des pages absentes de cette exécution (cf. main.py --previous)."""
+
+    base_dir = work_dir()
 
     extraction_dir = base_dir / "extractionOut"
     extraction_style_dir = base_dir / "extractionOutStyle"
@@ -60,38 +190,49 @@ def organize(pdf_name):
     ]:
         folder.mkdir(parents=True, exist_ok=True)
 
-    for label in LABEL_DICT.keys():
-        (out_classification / get_folder_name(label)).mkdir(exist_ok=True)
-        (out_classification_style / get_folder_name(label)).mkdir(exist_ok=True)
+    output = OUTPUT_FORMATS[output_format](out_classification, out_classification_style)
+
+    store = open_store()
+    if store is not None:
+        pages = store_pages(store)
+    else:
+        pages = file_pages(extraction_dir, extraction_style_dir, classification_dir)
 
-    tsv_files = list(classification_dir.glob("pred_page_*.tsv"))
+    # Incrémental (format files) : seules les pages dont les sources ont changé sont réécrites
+    incremental = output_format == "files"
+    state_path = output_root / STATE_FILE
+    state = load_state(state_path) if incremental else {}
 
     total_exercises = 0
     matched_exercises = 0
-
-    for tsv_path in tsv_files:
-
-        page_name = tsv_path.stem.replace("pred_", "")
-        json_path = extraction_dir / f"{page_name}.json"
-        json_style_path = extraction_style_dir / f"{page_name}--style.json"
-
-        if not json_path.exists():
+    page_names = []
+    skipped = 0
+
+    for page_name, page_digest, load in pages:
+        page_names.append(page_name)
+
+        previous = state.get(page_name)
+        if (previous is not None and previous["digest"] == page_digest
+                and all((output_root / rel).exists() for rel in previous["files"])):
+            total_exercises += previous["total"]
+            matched_exercises += previous["matched"]
+            skipped += 1
             continue
 
-        df = pd.read_csv(tsv_path, sep="\t")
-        pred_map = dict(zip(df["id"], df["pred"]))
+        pred_map, exercises, style_data = load()
+        page_total, page_matched = total_exercises, matched_exercises
+        written = [out_extraction / f"{page_name}.json"]
 
         # -------- NORMAL PAGE --------
-        with open(json_path, "r", encoding="utf-8") as f:
-            exercises = json.load(f)
-
         id_mapping = {}
+        by_id = {}  # nouvel id -> premier exercice portant cet id
 
         for ex in exercises:
             old_id = ex["id"]
             new_id = convert_id(old_id)
             id_mapping[old_id] = new_id
             ex["id"] = new_id
+            by_id.setdefault(new_id, ex)
             total_exercises += 1
 
         with open(out_extraction / f"{page_name}.json", "w", encoding="utf-8") as f:
@@ -99,10 +240,7 @@ def organize(pdf_name):
 
         # -------- STYLE PAGE --------
         exercises_style = {}
-        if json_style_path.exists():
-            with open(json_style_path, "r", encoding="utf-8") as f:
-                style_data = json.load(f)
-
+        if style_data is not None:
             for ex in style_data:
                 old_id = ex["id"]
                 if old_id in id_mapping:
@@ -111,6 +249,7 @@ def organize(pdf_name):
 
             with open(out_extraction_style / f"{page_name}.json", "w", encoding="utf-8") as f:
                 json.dump(style_data, f, indent=4, ensure_ascii=False)
+            written.append(out_extraction_style / f"{page_name}.json")
 
         # -------- CLASSIFICATION --------
         for old_id, new_id in id_mapping.items():
@@ -125,20 +264,40 @@ def organize(pdf_name):
                 print(f"[WARN] Label inconnu {label}")
                 continue
 
-            folder = get_folder_name(label)
-
-            # Normal
-            ex_obj = next(e for e in exercises if e["id"] == new_id)
-            with open(out_classification / folder / f"{new_id}.json", "w", encoding="utf-8") as f:
-                json.dump(ex_obj, f, indent=4, ensure_ascii=False)
-
-            # Style
-            if old_id in exercises_style:
-                with open(out_classification_style / folder / f"{new_id}.json", "w", encoding="utf-8") as f:
-                    json.dump(exercises_style[old_id], f, indent=4, ensure_ascii=False)
+            # Normal + Style
+            written += output.write(get_folder_name(label), new_id, by_id[new_id], exercises_style.get(old_id))
 
             matched_exercises += 1
 
+        if incremental:
+            # Fichiers de la version précédente de la page qui n'existent plus (ids ou étiquettes changés)
+            files = sorted({str(path.relative_to(output_root)) for path in written})
+            for rel in set(previous["files"] if previous else []) - set(files):
+                (output_root / rel).unlink(missing_ok=True)
+            state[page_name] = {"digest": page_digest, "files": files,
+                                "total": total_exercises - page_total, "matched": matched_exercises - page_matched}
+
+    if store is not None:
+        store.close()
+
+    if prune:
+        current = set(page_names)
+        for page_name in set(state) - current:
+            for rel in state.pop(page_name)["files"]:
+                (output_root / rel).unlink(missing_ok=True)
+        for folder in (out_extraction, out_extraction_style):
+            for path in folder.glob("page_*.json"):
+                if path.stem not in current:
+                    path.unlink()
+        print("[INFO] Sorties des pages absentes de cette exécution supprimées")
+
+    if incremental:
+        save_state(state_path, state)
+        print(f"[INFO] {len(page_names) - skipped} pages réécrites, {skipped} inchangées")
+
+    output.close(output_root, {"pdf": pdf_name, "pages": sorted(page_names, key=lambda p: page_of(p) or 0),
+                               "total_exercises": total_exercises, "matched_exercises": matched_exercises})
+
     print("\n========== RÉSUMÉ ==========")
     print(f"Total exercices trouvés : {total_exercises}")
     print(f"Total classés : {matched_exercises}")
@@ -148,5 +307,9 @@ def organize(pdf_name):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("pdf_name")
+    parser.add_argument("--format", choices=sorted(OUTPUT_FORMATS), default="files",
+                        help="files : un JSON par exercice ; jsonl : un fichier par catégorie + manifest.json")
+    parser.add_argument("--prune", action="store_true",
+                        help="Supprimer les sorties des pages qui ne font plus partie du document")
     args = parser.parse_args()
-    organize(args.pdf_name)
+    organize(args.pdf_name, args.format, args.prune)
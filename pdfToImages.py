@@ -1,8 +1,11 @@
 import os
+import socket
 import subprocess
 import sys
 from pathlib import Path
 
+from workspace import page_ranges, selected_pages
+
 
 def pdf_to_images_best_quality(pdf_path, output_folder, dpi=450,
                                all_pages=True, first_page=None, last_page=None):
@@ -13,8 +16,11 @@ def pdf_to_images_best_quality(pdf_path, output_folder, dpi=450,
     device = "png16m"   # 24-bit PNG
     gs = "gswin64c" if os.name == "nt" else "gs"
 
-    # On génère d'abord des fichiers temporaires : tmp-001.png, tmp-002.png, ...
-    tmp_pattern = str(output_folder / "tmp-%03d.png")
+    # On génère d'abord des fichiers temporaires : tmp<machine>-<pid>-001.png, tmp<machine>-<pid>-002.png, ...
+    # (préfixe du processus et de la machine : des workers de plusieurs machines peuvent rendre des pages
+    # du même document sur le dossier partagé, cf. job_queue.py)
+    tmp_prefix = f"tmp{socket.gethostname()}-{os.getpid()}"
+    tmp_pattern = str(output_folder / f"{tmp_prefix}-%03d.png")
 
     cmd = [
         gs,
@@ -41,14 +47,14 @@ def pdf_to_images_best_quality(pdf_path, output_folder, dpi=450,
 
     subprocess.run(cmd, check=True)
 
-    # Renommage : tmp-001.png -> page_X.png
+    # Renommage : tmp<machine>-<pid>-001.png -> page_X.png
     # Si all_pages=True : on commence à 1 -> page_1.png, page_2.png, ...
     # Sinon : on commence à first_page -> page_15.png, etc.
     start_page = first_page if (first_page is not None) else 1
 
     index = 1
     while True:
-        tmp_file = output_folder / f"tmp-{index:03d}.png"
+        tmp_file = output_folder / f"{tmp_prefix}-{index:03d}.png"
         if not tmp_file.exists():
             break
 
@@ -88,11 +94,20 @@ if __name__ == "__main__":
 
     dpi = int(sys.argv[6]) if len(sys.argv) >= 7 else 450
 
-    pdf_to_images_best_quality(
-        pdf_path,
-        output_folder,
-        dpi=dpi,
-        all_pages=all_pages,
-        first_page=first_page,
-        last_page=last_page,
-    )
+    pages = selected_pages()
+    if pages is None:
+        pdf_to_images_best_quality(
+            pdf_path,
+            output_folder,
+            dpi=dpi,
+            all_pages=all_pages,
+            first_page=first_page,
+            last_page=last_page,
+        )
+    else:
+        # MALIN_PAGES (reprise) : un rendu Ghostscript par plage de pages consécutives
+        if not all_pages:
+            pages = {p for p in pages if first_page <= p <= last_page}
+        for first, last in page_ranges(pages):
+            pdf_to_images_best_quality(pdf_path, output_folder, dpi=dpi, all_pages=False,
+                                       first_page=first, last_page=last)
@@ -1,12 +1,17 @@
 # pip install pymupdf
 import fitz
 import csv
+import json
 import re
 import sys
 import glob
 from pathlib import Path
 from typing import Iterable, Tuple
 
+from docstore import open_store
+from memory_budget import page_budget, release_buffers
+from workspace import atomic_open, page_selected
+
 
 def to_hex_color(c):
     if isinstance(c, int):
@@ -78,86 +83,159 @@ def weighted_dominant_style(spans):
     return max(weights.items(), key=lambda kv: kv[1])[0]
 
 
+def phrase_rows(doc: fitz.Document, pages: Iterable[int]):
+    """Une ligne (phrase, font_family, size, color_hex, style_tag, overrides) par ligne de texte."""
+    # Blocs image ignorés : on ne fait pas extraire leurs données binaires par PyMuPDF
+    text_flags = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+    for p in pages:
+        page = doc[p]
+        d = page.get_text("dict", flags=text_flags)
+        # Mots de la page : extraits une fois, filtrés ensuite par ligne
+        words = page.get_text("words")
+
+        for b in d.get("blocks", []):
+            if b.get("type", 0) != 0:
+                continue
+
+            for l in b.get("lines", []):
+                spans, texts = [], []
+
+                for s in l.get("spans", []):
+                    t = s.get("text", "")
+                    if t == "":
+                        continue  
+                    spans.append({
+                        "bbox": tuple(s["bbox"]),
+                        "font": s.get("font", ""),
+                        "size": float(s.get("size", 0.0)),
+                        "color": s.get("color", 0),
+                        "text": t
+                    })
+                    texts.append(t)
+
+                if not spans:
+                    continue
+
+                raw_phrase = "".join(texts)
+                phrase = raw_phrase
+                fam_d, tag_d, size_d, col_d = weighted_dominant_style(spans)
+
+                overrides = []
+
+                x0 = min(s["bbox"][0] for s in spans)
+                y0 = min(s["bbox"][1] for s in spans)
+                x1 = max(s["bbox"][2] for s in spans)
+                y1 = max(s["bbox"][3] for s in spans)
+                lbbox = (x0, y0, x1, y1)
+
+                for (wx0, wy0, wx1, wy1, word, *_rest) in words:
+                    wbbox = (wx0, wy0, wx1, wy1)
+                    if rect_intersection_area(lbbox, wbbox) <= 0:
+                        continue
+
+                    fam_w, tag_w, size_w, col_w = style_for_word_from_spans(wbbox, spans)
+
+                    if (fam_w != fam_d) or (tag_w != tag_d) or abs(size_w - size_d) > 1e-6 or (col_w.lower() != col_d.lower()):
+                        if word.strip():
+                            overrides.append(f"{word}|{fam_w}|{size_w:g}|{col_w}|{tag_w}")
+
+                yield (
+                    phrase,
+                    fam_d,
+                    size_d,
+                    col_d,
+                    tag_d,
+                    "||".join(overrides) if overrides else ""
+                )
+
+
 def export_phrase_compact_from_doc(doc: fitz.Document, out_csv: str, pages: Iterable[int]):
-    page_indexes = pages
     Path(out_csv).parent.mkdir(parents=True, exist_ok=True)
 
-    with open(out_csv, "w", newline="", encoding="utf-8") as f:
+    with atomic_open(out_csv, "w", newline="", encoding="utf-8") as f:
         w = csv.writer(f, delimiter=";")
         w.writerow(["phrase", "font_family", "size", "color_hex", "style_tag", "overrides"])
+        for phrase, fam, size, col, tag, overrides in phrase_rows(doc, pages):
+            w.writerow([phrase, fam, f"{size:g}", col, tag, overrides])
 
-        for p in page_indexes:
-            page = doc[p]
-            d = page.get_text("dict")
+    print(f"[OK] Export: {out_csv}")
 
-            for b in d.get("blocks", []):
-                if b.get("type", 0) != 0:
-                    continue
 
-                for l in b.get("lines", []):
-                    spans, texts = [], []
-
-                    for s in l.get("spans", []):
-                        t = s.get("text", "")
-                        if t == "":
-                            continue  
-                        spans.append({
-                            "bbox": tuple(s["bbox"]),
-                            "font": s.get("font", ""),
-                            "size": float(s.get("size", 0.0)),
-                            "color": s.get("color", 0),
-                            "text": t
-                        })
-                        texts.append(t)
-
-                    if not spans:
-                        continue
+BOLD_WEIGHTS = ("black", "bold", "semibold", "medium")
 
-                    raw_phrase = "".join(texts)
-                    phrase = raw_phrase
-                    fam_d, tag_d, size_d, col_d = weighted_dominant_style(spans)
 
-                    overrides = []
-                    words = page.get_text("words")
+def style_flags(fontname: str) -> int:
+    """Bits de style d'une police : 1 = gras, 2 = italique (mêmes règles que style-post)."""
+    _, tag = normalize_style(fontname)
+    weight, _, italic = tag.partition("/")
+    return (1 if weight in BOLD_WEIGHTS else 0) | (2 if italic else 0)
 
-                    x0 = min(s["bbox"][0] for s in spans)
-                    y0 = min(s["bbox"][1] for s in spans)
-                    x1 = max(s["bbox"][2] for s in spans)
-                    y1 = max(s["bbox"][3] for s in spans)
-                    lbbox = (x0, y0, x1, y1)
 
-                    for (wx0, wy0, wx1, wy1, word, *_rest) in words:
-                        wbbox = (wx0, wy0, wx1, wy1)
-                        if rect_intersection_area(lbbox, wbbox) <= 0:
-                            continue
+def export_char_runs_from_doc(doc: fitz.Document, out_json: str, pages: Iterable[int]):
+    """Artefact colonnaire des runs de caractères d'une page (sans passer par le CSV).
 
-                        fam_w, tag_w, size_w, col_w = style_for_word_from_spans(wbbox, spans)
+    text   : texte des lignes concaténées (une ligne = une "phrase" du CSV)
+    lines  : offset de début de chaque ligne dans text
+    colors : table des couleurs ; runs.color y fait référence
+    runs   : colonnes offset / length / flags (1 = gras, 2 = italique) / color, un run par span
+    """
+    Path(out_json).parent.mkdir(parents=True, exist_ok=True)
 
-                        if (fam_w != fam_d) or (tag_w != tag_d) or abs(size_w - size_d) > 1e-6 or (col_w.lower() != col_d.lower()):
-                            if word.strip():
-                                overrides.append(f"{word}|{fam_w}|{size_w:g}|{col_w}|{tag_w}")
+    parts, lines = [], []
+    colors, color_ids = [], {}
+    offsets, lengths, flags, color_col = [], [], [], []
+    pos = 0
+    # Pas de TEXT_PRESERVE_IMAGES : les blocs image ne sont pas décodés
+    text_flags = fitz.TEXTFLAGS_RAWDICT & ~fitz.TEXT_PRESERVE_IMAGES
 
-                    w.writerow([
-                        phrase,
-                        fam_d,
-                        f"{size_d:g}",
-                        col_d,
-                        tag_d,
-                        "||".join(overrides) if overrides else ""
-                    ])
-
-    print(f"[OK] Export: {out_csv}")
+    for p in pages:
+        d = doc[p].get_text("rawdict", flags=text_flags)
+        for b in d.get("blocks", []):
+            if b.get("type", 0) != 0:
+                continue
+            for l in b.get("lines", []):
+                line_start = pos
+                for s in l.get("spans", []):
+                    t = "".join(ch.get("c", "") for ch in s.get("chars", []))
+                    if t == "":
+                        continue
+                    col = to_hex_color(s.get("color", 0))
+                    if col not in color_ids:
+                        color_ids[col] = len(colors)
+                        colors.append(col)
+                    offsets.append(pos)
+                    lengths.append(len(t))
+                    flags.append(style_flags(s.get("font", "")))
+                    color_col.append(color_ids[col])
+                    parts.append(t)
+                    pos += len(t)
+                if pos > line_start:
+                    lines.append(line_start)
+
+    with atomic_open(out_json, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": 1,
+            "text": "".join(parts),
+            "lines": lines,
+            "colors": colors,
+            "runs": {"offset": offsets, "length": lengths, "flags": flags, "color": color_col},
+        }, f, ensure_ascii=False, separators=(",", ":"))
+
+    print(f"[OK] Export runs: {out_json}")
 
 
 def main():
-    # Usage: python pdfToTxtStyle.py <pdf_path> <output_folder> <all(true|false)> [first_page] [last_page]
-    if len(sys.argv) < 4:
-        print("Usage: python pdfToTxtStyle.py <pdf_path> <output_folder> <all(true|false)> [first_page] [last_page]")
+    # Usage: python pdfToTxtStyle.py <pdf_path> <output_folder> <all(true|false)> [first_page] [last_page] [--runs]
+    # --runs : écrit aussi page_N.runs.json (runs de caractères, lu directement par style-post)
+    runs = "--runs" in sys.argv
+    argv = [a for a in sys.argv if a != "--runs"]
+    if len(argv) < 4:
+        print("Usage: python pdfToTxtStyle.py <pdf_path> <output_folder> <all(true|false)> [first_page] [last_page] [--runs]")
         sys.exit(1)
 
-    pdf_path = sys.argv[1]
-    output_dir = Path(sys.argv[2])
-    all_flag = sys.argv[3].lower().strip()
+    pdf_path = argv[1]
+    output_dir = Path(argv[2])
+    all_flag = argv[3].lower().strip()
 
     with fitz.open(pdf_path) as doc:
         total = len(doc)
@@ -168,11 +246,11 @@ def main():
             first_page = 1
             last_page = total
         else:
-            if len(sys.argv) < 6:
+            if len(argv) < 6:
                 print("Error: need first_page and last_page when all_flag is false")
                 sys.exit(1)
-            first_page = int(sys.argv[4])
-            last_page = int(sys.argv[5])
+            first_page = int(argv[4])
+            last_page = int(argv[5])
 
             if first_page < 1:
                 first_page = 1
@@ -183,12 +261,30 @@ def main():
 
         output_dir.mkdir(parents=True, exist_ok=True)
 
+        # Stockage unique du document (MALIN_STORE) : lignes en base au lieu des CSV
+        store = open_store()
+
         # pages 1-based -> index 0-based
         for page_num in range(first_page, last_page + 1):
+            if not page_selected(page_num):
+                continue  # MALIN_PAGES
             page_idx = page_num - 1
-            out_csv = output_dir / f"page_{page_num}.csv"
-            print(f"->  Export page {page_num} vers {out_csv}")
-            export_phrase_compact_from_doc(doc, str(out_csv), pages=[page_idx])
+            if store is not None:
+                store.put_lines(page_num, phrase_rows(doc, [page_idx]))
+                print(f"->  Export page {page_num} vers {store.path}")
+            else:
+                out_csv = output_dir / f"page_{page_num}.csv"
+                print(f"->  Export page {page_num} vers {out_csv}")
+                export_phrase_compact_from_doc(doc, str(out_csv), pages=[page_idx])
+            if runs:
+                export_char_runs_from_doc(doc, str(output_dir / f"page_{page_num}.runs.json"), pages=[page_idx])
+            if page_budget() is not None:
+                # Mode mémoire bornée : cache MuPDF (polices, images décodées) vidé entre deux pages
+                fitz.TOOLS.store_shrink(100)
+                release_buffers()
+
+        if store is not None:
+            store.close()
 
 
 if __name__ == "__main__":
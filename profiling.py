@@ -0,0 +1,58 @@
+import io
+import os
+import pstats
+import sys
+from pathlib import Path
+
+# Profilage des étapes du pipeline (main.py --profile <étape>[,<étape>]) avec cProfile.
+# Les étapes choisies et le dossier de sortie sont transmis aux scripts par variables
+# d'environnement, pour que classification.py puisse profiler ses appels à inference.py.
+# Sorties : <étape>.prof (pstats, lisible avec snakeviz / python -m pstats) + <étape>.txt (top N).
+
+PROFILE_ENV = "MALIN_PROFILE"
+PROFILE_DIR_ENV = "MALIN_PROFILE_DIR"
+
+TOP_N = 30
+
+# Étape = nom du script sans .py ; "inference" = appels à classification/src/inference.py
+STAGES = ["pdfToImages", "pdfToTxtStyle", "detectImages", "cropImages", "drawBoxes", "extraction-gemini-vision",
+          "classification", "inference", "style-post", "organize_outputs"]
+
+
+def profiled_stages():
+    return {s.strip() for s in os.environ.get(PROFILE_ENV, "").split(",") if s.strip()}
+
+
+def profile_path(stage, name=None):
+    """Chemin du .prof d'une étape (name distingue plusieurs exécutions, ex. une par page), None si non profilée."""
+    if stage not in profiled_stages() or not os.environ.get(PROFILE_DIR_ENV):
+        return None
+    profile_dir = Path(os.environ[PROFILE_DIR_ENV])
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    return profile_dir / f"{name or stage}.prof"
+
+
+def python_cmd(stage, script_path, name=None):
+    """[python, script] ou [python, -m, cProfile, -o, <prof>, script] si l'étape est profilée."""
+    prof = profile_path(stage, name)
+    if prof is None:
+        return [sys.executable, str(script_path)]
+    return [sys.executable, "-m", "cProfile", "-o", str(prof), str(script_path)]
+
+
+def write_summary(prof_paths, txt_path, top=TOP_N):
+    """Résumé texte des points chauds (tri par temps cumulé puis par temps propre) d'un ou plusieurs .prof."""
+    prof_paths = [str(p) for p in prof_paths if Path(p).exists()]
+    if not prof_paths:
+        return None
+    buf = io.StringIO()
+    stats = pstats.Stats(*prof_paths, stream=buf)
+    stats.strip_dirs()
+    buf.write(f"Profils : {', '.join(os.path.basename(p) for p in prof_paths)}\n")
+    buf.write(f"\n=== Top {top} : temps cumulé ===\n")
+    stats.sort_stats("cumulative").print_stats(top)
+    buf.write(f"\n=== Top {top} : temps propre ===\n")
+    stats.sort_stats("tottime").print_stats(top)
+    with open(txt_path, "w", encoding="utf-8") as f:
+        f.write(buf.getvalue())
+    return Path(txt_path)
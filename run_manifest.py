@@ -0,0 +1,313 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+from docstore import open_store
+
+# Manifeste de reprise (main.py --resume) : pour chaque page et chaque étape, done / failed / pending
+# avec les empreintes SHA-256 des artefacts produits. Écrit à la racine du dossier de travail
+# (run_manifest.json), qui ne contient qu'un document à la fois ; réécrit atomiquement
+# (fichier .tmp + os.replace) avant et après chaque étape.
+#
+# À la reprise :
+# - une page "done" dont les artefacts ont disparu ou changé repasse à refaire, ainsi que ses étapes suivantes ;
+# - une page interrompue en cours d'étape dont les artefacts obligatoires sont tous présents est adoptée
+#   sans relancer l'étape (les scripts écrivent leurs artefacts atomiquement, cf. workspace.atomic_open) ;
+# - l'étape ne tourne que sur les pages restantes (MALIN_PAGES) ;
+# - une page en échec ou périmée repart sans ses artefacts de l'étape (begin_stage).
+
+MANIFEST_NAME = "run_manifest.json"
+
+# Étapes par page, dans l'ordre du pipeline ; organize_outputs est une étape de document (incrémentale)
+PAGE_STAGES = ["pdfToImages", "pdfToTxtStyle", "detectImages", "cropImages", "drawBoxes",
+               "extraction-gemini-vision", "classification", "style-post"]
+
+STORE_PREFIX = "store:"
+
+
+def stage_artifacts(stage, page, store, style_runs=False):
+    """(obligatoires, facultatifs) d'une page pour une étape.
+
+    Chemins relatifs au dossier de travail, ou "store:<table>" en mode MALIN_STORE.
+    Une étape sans artefact obligatoire (cropImages) ne peut pas être adoptée : elle est relancée.
+    """
+    if stage == "pdfToImages":
+        return [f"files/page_{page}.png"], []
+    if stage == "pdfToTxtStyle":
+        runs = [f"files_style/page_{page}.runs.json"]
+        required = [f"{STORE_PREFIX}lines"] if store else [f"files_style/page_{page}.csv"]
+        return (required + runs, []) if style_runs else (required, runs)
+    if stage == "detectImages":
+        # Détection écrite en dernier pour chaque page, shapes vide sans détection (cf. labels_to_json)
+        detection = f"{STORE_PREFIX}shapes" if store else f"output/detImages/predict/page_{page}.json"
+        return [f"output/detImages/predict/page_{page}.png", detection], [
+            f"output/detImages/predict/labels/page_{page}.txt"]
+    if stage == "cropImages":
+        return [], [f"output/detImages/predict/crops/p{page}c*.png"]
+    if stage == "drawBoxes":
+        return [f"files-out/page_{page}.png"], []
+    if stage == "extraction-gemini-vision":
+        if store:
+            return [f"{STORE_PREFIX}exercises"], []
+        return [f"extractionOut/page_{page}.json", f"extractionOut/page_{page}.tsv"], []
+    if stage == "classification":
+        if store:
+            return [f"{STORE_PREFIX}predictions"], []
+        return [f"classificationOut/pred_page_{page}.tsv", f"classificationOut/pred_page_{page}.txt"], []
+    if stage == "style-post":
+        if store:
+            return [f"{STORE_PREFIX}styled"], []
+        return [f"extractionOutStyle/page_{page}--style.json"], []
+    raise ValueError(f"étape inconnue : {stage}")
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def pdf_page_count(pdf_path):
+    import fitz  # PyMuPDF, déjà requis par pdfToTxtStyle.py
+
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+
+class RunManifest:
+    def __init__(self, path, data):
+        self.path = Path(path)
+        self.data = data
+
+    @classmethod
+    def create(cls, work_dir, pdf_name, pdf_path, pages, options):
+        data = {
+            "pdf": pdf_name,
+            "pdf_sha256": file_sha256(pdf_path),
+            "options": options,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "pages": sorted(pages),
+            "stages": {},
+            "page_stages": {str(p): {} for p in sorted(pages)},
+        }
+        manifest = cls(Path(work_dir) / MANIFEST_NAME, data)
+        manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, work_dir):
+        """Manifeste du dossier de travail, ou None s'il n'existe pas."""
+        path = Path(work_dir) / MANIFEST_NAME
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(path, json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def check_resumable(self, pdf_name, pdf_path, options):
+        """Message d'incompatibilité avec l'exécution demandée, ou None."""
+        if self.data["pdf"] != pdf_name:
+            return f"le dossier de travail contient une exécution de {self.data['pdf']}"
+        if self.data["pdf_sha256"] != file_sha256(pdf_path):
+            return f"{pdf_name} a changé depuis l'exécution interrompue"
+        if self.data["options"] != options:
+            return f"options différentes de l'exécution interrompue ({self.data['options']})"
+        return None
+
+    def save(self):
+        self.data["updated"] = datetime.now().isoformat(timespec="seconds")
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    # --- artefacts ---
+
+    def _artifacts(self, stage, page):
+        store = self.data["options"].get("store", False)
+        return stage_artifacts(stage, page, store, self.data["options"].get("style_runs", False))
+
+    def _scan(self, stage, page, store):
+        """{artefact: sha256 | "store"} des artefacts présents, et liste des obligatoires manquants."""
+        work = self.path.parent
+        required, optional = self._artifacts(stage, page)
+        found, missing = {}, []
+        for rel in required + optional:
+            if rel.startswith(STORE_PREFIX):
+                if store is not None and store.has_page(page, rel[len(STORE_PREFIX):]):
+                    found[rel] = "store"
+                elif rel in required:
+                    missing.append(rel)
+                continue
+            paths = sorted(work.glob(rel)) if "*" in rel else [work / rel]
+            for path in paths:
+                if path.exists():
+                    found[str(path.relative_to(work))] = file_sha256(path)
+                elif rel in required:
+                    missing.append(rel)
+        return found, missing
+
+    def _verify(self, page, record, store):
+        work = self.path.parent
+        for rel, digest in record.get("artifacts", {}).items():
+            if digest == "store":
+                if store is None or not store.has_page(page, rel[len(STORE_PREFIX):]):
+                    return False
+            elif not (work / rel).exists() or file_sha256(work / rel) != digest:
+                return False
+        return True
+
+    # --- états ---
+
+    def _record(self, stage, page):
+        return self.data["page_stages"][str(page)].get(stage)
+
+    def _set(self, stage, page, status, artifacts=None, stale=False):
+        record = {"status": status}
+        if artifacts is not None:
+            record["artifacts"] = artifacts
+        if stale:
+            record["stale"] = True
+        self.data["page_stages"][str(page)][stage] = record
+
+    def _invalidate_after(self, stage, page):
+        """Les étapes suivantes d'une page à refaire sont à refaire aussi (artefacts existants périmés)."""
+        for later in PAGE_STAGES[PAGE_STAGES.index(stage) + 1:]:
+            if self._record(later, page) is not None:
+                self._set(later, page, "pending", stale=True)
+
+    def _discard(self, stage, page, store):
+        """Supprime les artefacts d'une page pour une étape, pour que son script ne les prenne pas
+        pour des résultats à jour (ex. JSON Gemini déjà présent)."""
+        work = self.path.parent
+        required, optional = self._artifacts(stage, page)
+        for rel in required + optional:
+            if rel.startswith(STORE_PREFIX):
+                if store is not None:
+                    store.delete_page(page, rel[len(STORE_PREFIX):])
+                continue
+            for path in (work.glob(rel) if "*" in rel else [work / rel]):
+                if path.exists():
+                    path.unlink()
+
+    def _discard_after(self, stage, page, store):
+        """Supprime les artefacts des étapes suivantes d'une page relancée."""
+        for later in PAGE_STAGES[PAGE_STAGES.index(stage) + 1:]:
+            self._discard(later, page, store)
+
+    def pending(self, stage):
+        """Pages à (re)faire pour une étape, après vérification des pages faites et adoption des pages
+        interrompues déjà complètes. Une page n'est proposée que si les étapes précédentes sont faites."""
+        previous = PAGE_STAGES[:PAGE_STAGES.index(stage)]
+        store = open_store()
+        todo = []
+        try:
+            for page in self.data["pages"]:
+                record = self._record(stage, page)
+                if record is not None and record["status"] == "skipped":
+                    continue  # écartée par le triage
+                if any((self._record(s, page) or {}).get("status") != "done" for s in previous):
+                    continue
+                if record is not None and record["status"] == "done":
+                    if self._verify(page, record, store):
+                        continue
+                    print(f"[WARN] page {page} : artefacts de {stage} modifiés ou absents, page à refaire")
+                    self._invalidate_after(stage, page)
+                elif (record is None or not record.get("stale")) and self._artifacts(stage, page)[0]:
+                    found, missing = self._scan(stage, page, store)
+                    if not missing:
+                        # Interrompue après écriture complète des artefacts : pas de nouvel appel
+                        self._set(stage, page, "done", found)
+                        continue
+                todo.append(page)
+        finally:
+            if store is not None:
+                store.close()
+        self.save()
+        return todo
+
+    def mark_carried(self, pages):
+        """Pages reprises d'une édition précédente (cf. fingerprints.py) : toutes les étapes faites."""
+        store = open_store()
+        try:
+            for page in pages:
+                for stage in PAGE_STAGES:
+                    self._set(stage, page, "done", self._scan(stage, page, store)[0])
+        finally:
+            if store is not None:
+                store.close()
+        self.save()
+
+    def apply_triage(self, after_stage, skipped):
+        """Pages écartées par le triage : étapes suivant after_stage ignorées (sauf celles déjà faites).
+
+        Une page de nouveau gardée (règles modifiées avant une reprise) redevient à faire.
+        """
+        later = PAGE_STAGES[PAGE_STAGES.index(after_stage) + 1:]
+        for page in self.data["pages"]:
+            for stage in later:
+                status = (self._record(stage, page) or {}).get("status")
+                if page in skipped and status != "done":
+                    self._set(stage, page, "skipped")
+                elif page not in skipped and status == "skipped":
+                    del self.data["page_stages"][str(page)][stage]
+        self.save()
+
+    def begin_stage(self, stage, pages):
+        store = open_store()
+        try:
+            for page in pages:
+                record = self._record(stage, page) or {}
+                if record.get("status") in ("failed", "done") or record.get("stale"):
+                    # Page en échec (ex. réponse Gemini illisible gardée en JSON brut), périmée ou aux
+                    # artefacts modifiés : l'étape repart de zéro. Une page simplement interrompue garde
+                    # ses artefacts partiels (ex. JSON Gemini sans TSV : pas de nouvel appel).
+                    self._discard(stage, page, store)
+                self._set(stage, page, "pending")
+                self._invalidate_after(stage, page)
+                self._discard_after(stage, page, store)
+        finally:
+            if store is not None:
+                store.close()
+        self.data["stages"][stage] = {"status": "running", "started": datetime.now().isoformat(timespec="seconds")}
+        self.save()
+
+    def finish_stage(self, stage, pages, returncode):
+        """Pages avec tous leurs artefacts obligatoires : done (+ empreintes) ; sinon failed."""
+        store = open_store()
+        failed = []
+        try:
+            for page in pages:
+                found, missing = self._scan(stage, page, store)
+                if missing or (returncode != 0 and not self._artifacts(stage, page)[0]):
+                    self._set(stage, page, "failed", found)
+                    failed.append(page)
+                else:
+                    self._set(stage, page, "done", found)
+        finally:
+            if store is not None:
+                store.close()
+        self.data["stages"][stage] = {"status": "done" if returncode == 0 else "failed",
+                                      "finished": datetime.now().isoformat(timespec="seconds"),
+                                      "pages": len(pages), "failed_pages": failed}
+        self.save()
+        return failed
+
+    def finish_document_stage(self, stage, returncode):
+        self.data["stages"][stage] = {"status": "done" if returncode == 0 else "failed",
+                                      "finished": datetime.now().isoformat(timespec="seconds")}
+        self.save()
+
+    def summary(self):
+        """{étape: {done: n, failed: n, pending: n, skipped: n}} sur toutes les pages."""
+        out = {}
+        for stage in PAGE_STAGES:
+            counts = {"done": 0, "failed": 0, "pending": 0, "skipped": 0}
+            for page in self.data["pages"]:
+                counts[(self._record(stage, page) or {}).get("status", "pending")] += 1
+            out[stage] = counts
+        return out
@@ -0,0 +1,161 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from docstore import open_store
+
+# Rapport d'exécution du pipeline (main.py) : une entrée par étape avec temps réel, temps CPU,
+# pic de RSS et volumes produits (pages, détections, exercices, prédictions).
+# Écrit dans SORTIES/<pdf>/run_report.json.
+
+# Comparer deux rapports :
+# python run_report.py compare SORTIES/doc.pdf/run_report.json autre_run_report.json
+
+REPORT_NAME = "run_report.json"
+
+
+def rss_mb(ru_maxrss):
+    """ru_maxrss est en Ko sous Linux, en octets sous macOS."""
+    return ru_maxrss / (1024 * 1024) if sys.platform == "darwin" else ru_maxrss / 1024
+
+
+def count_outputs(script_name, base_dir):
+    """Volumes produits par une étape, lus dans ses sorties (fichiers ou base MALIN_STORE)."""
+    base_dir = Path(base_dir)
+    store = open_store()
+    try:
+        if script_name == "pdfToImages.py":
+            return {"pages": len(list((base_dir / "files").glob("page_*.png")))}
+        if script_name == "pdfToTxtStyle.py":
+            if store is not None:
+                return {"pages": len(store.pages("lines")), "lines": store.count("lines")}
+            return {"pages": len(list((base_dir / "files_style").glob("page_*.csv")))}
+        if script_name == "detectImages.py":
+            if store is not None:
+                return {"pages": len(store.pages("shapes")), "shapes": store.count("shapes")}
+            detections = list((base_dir / "output" / "detImages" / "predict").glob("*.json"))
+            shapes = 0
+            for path in detections:
+                with open(path, "r", encoding="utf-8") as f:
+                    shapes += len(json.load(f).get("shapes", []))
+            return {"pages": len(detections), "shapes": shapes}
+        if script_name == "cropImages.py":
+            return {"crops": len(list((base_dir / "output" / "detImages" / "predict" / "crops").glob("*.png")))}
+        if script_name == "drawBoxes.py":
+            return {"pages": len(list((base_dir / "files-out").glob("*.png")))}
+        if script_name == "extraction-gemini-vision.py":
+            if store is not None:
+                return {"pages": len(store.pages("exercises")), "exercises": store.count("exercises")}
+            tsv_files = list((base_dir / "extractionOut").glob("*.tsv"))
+            return {"pages": len(tsv_files), "exercises": sum(count_lines(p) - 1 for p in tsv_files)}
+        if script_name == "classification.py":
+            if store is not None:
+                return {"pages": len(store.pages("predictions")), "predictions": store.count("predictions")}
+            txt_files = list((base_dir / "classificationOut").glob("pred_*.txt"))
+            return {"pages": len(txt_files), "predictions": sum(count_lines(p) for p in txt_files)}
+        if script_name == "style-post.py":
+            if store is not None:
+                return {"pages": len(store.pages("styled"))}
+            return {"pages": len(list((base_dir / "extractionOutStyle").glob("*--style.json")))}
+        return {}
+    finally:
+        if store is not None:
+            store.close()
+
+
+def count_lines(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+class RunReport:
+    def __init__(self, pdf_name, base_dir, argv=None):
+        self.base_dir = Path(base_dir)
+        self.path = self.base_dir / "SORTIES" / pdf_name / REPORT_NAME
+        self.started = time.perf_counter()
+        self.data = {
+            "pdf": pdf_name,
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "argv": list(argv if argv is not None else sys.argv[1:]),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "stages": [],
+        }
+
+    def add_stage(self, script_name, wall_seconds, usage, returncode):
+        """usage : rusage du processus de l'étape (os.wait4), None si indisponible (Windows)."""
+        stage = {"stage": script_name, "returncode": returncode, "wall_seconds": round(wall_seconds, 3)}
+        if usage is not None:
+            # rusage d'un enfant terminé : inclut ses propres sous-processus attendus (inference.py, pool...)
+            stage["cpu_user_seconds"] = round(usage.ru_utime, 3)
+            stage["cpu_system_seconds"] = round(usage.ru_stime, 3)
+            stage["peak_rss_mb"] = round(rss_mb(usage.ru_maxrss), 1)
+        try:
+            stage.update(count_outputs(script_name, self.base_dir))
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Comptage des sorties de {script_name} impossible : {e}")
+        self.data["stages"].append(stage)
+        return stage
+
+    def annotate(self, **fields):
+        """Ajoute des champs à la dernière étape enregistrée."""
+        if self.data["stages"]:
+            self.data["stages"][-1].update(fields)
+
+    def save(self):
+        self.data["total_wall_seconds"] = round(time.perf_counter() - self.started, 3)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        print(f"[OK] Run report: {self.path}")
+
+
+def load_report(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def fmt_delta(a, b):
+    if a is None or b is None:
+        return "-"
+    if not a:
+        return f"{b - a:+.3g}"
+    return f"{100 * (b - a) / a:+.1f}%"
+
+
+def compare(path_a, path_b):
+    """Affiche étape par étape les écarts entre deux rapports (B par rapport à A)."""
+    a, b = load_report(path_a), load_report(path_b)
+    stages_a = {s["stage"]: s for s in a["stages"]}
+    stages_b = {s["stage"]: s for s in b["stages"]}
+    names = [s["stage"] for s in a["stages"]] + [s["stage"] for s in b["stages"] if s["stage"] not in stages_a]
+    metrics = ["wall_seconds", "cpu_user_seconds", "cpu_system_seconds", "peak_rss_mb",
+               "pages", "shapes", "exercises", "predictions"]
+
+    print(f"A : {path_a} ({a.get('date')})")
+    print(f"B : {path_b} ({b.get('date')})")
+    print(f"{'étape':<30} {'mesure':<20} {'A':>12} {'B':>12} {'écart':>10}")
+    for name in names:
+        sa, sb = stages_a.get(name, {}), stages_b.get(name, {})
+        for metric in metrics:
+            va, vb = sa.get(metric), sb.get(metric)
+            if va is None and vb is None:
+                continue
+            print(f"{name:<30} {metric:<20} {str(va if va is not None else '-'):>12} "
+                  f"{str(vb if vb is not None else '-'):>12} {fmt_delta(va, vb):>10}")
+    ta, tb = a.get("total_wall_seconds"), b.get("total_wall_seconds")
+    print(f"{'TOTAL':<30} {'wall_seconds':<20} {str(ta):>12} {str(tb):>12} {fmt_delta(ta, tb):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_compare = sub.add_parser("compare", help="Comparer deux rapports d'exécution")
+    p_compare.add_argument("report_a")
+    p_compare.add_argument("report_b")
+    args = parser.parse_args()
+    compare(args.report_a, args.report_b)
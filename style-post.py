@@ -2,9 +2,18 @@ import json
 import csv
 import os
 import re
+import sys
+import time
+import argparse
 import difflib
 import glob
-from pathlib import Path
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from docstore import DocStore, open_store
+from workspace import atomic_open, page_selected, work_dir
 
 # --- FONCTIONS UTILITAIRES DE STYLE ---
 
@@ -34,81 +43,325 @@ def is_italic_style(s):
     return any(sub in s for sub in ['italic', 'oblique', 'italique'])
 
 
+# --- ALIGNEMENT TEXTE JSON <-> CSV ---
+
+class PageAligner:
+    """Index des k-grammes de la chaîne CSV d'une page (sans espaces), construit une seule fois.
+
+    find() cherche d'abord le nœud entier près de la position du match précédent, puis
+    seulement si besoin la plus longue sous-chaîne commune sur toute la page (mêmes
+    départages que difflib.SequenceMatcher.find_longest_match).
+    """
+
+    K = 6          # taille des k-grammes indexés
+    WINDOW = 2000  # fenêtre (en caractères) autour du curseur pour la recherche locale
+
+    def __init__(self, page_string):
+        self.page = page_string
+        self.index = {}
+        k = self.K
+        for i in range(len(page_string) - k + 1):
+            self.index.setdefault(page_string[i:i + k], []).append(i)
+
+    def find(self, node_string, cursor=0):
+        page = self.page
+        m = len(node_string)
+        if m == 0:
+            return difflib.Match(0, 0, 0)
+
+        # 1. Recherche locale : le nœud entier juste après (puis juste avant) le match précédent
+        window = max(self.WINDOW, 2 * m)
+        pos = page.find(node_string, max(0, cursor - m), cursor + window)
+        if pos < 0:
+            pos = page.rfind(node_string, max(0, cursor - window), cursor)
+        if pos >= 0:
+            return difflib.Match(pos, 0, m)
+
+        # 2. Recherche globale : nœud entier (première occurrence)
+        pos = page.find(node_string)
+        if pos >= 0:
+            return difflib.Match(pos, 0, m)
+
+        # 3. Plus longue sous-chaîne commune via l'index des k-grammes
+        k = self.K
+        n = len(page)
+        best_i, best_j, best_size = 0, 0, 0
+        for j in range(m - k + 1):
+            for i in self.index.get(node_string[j:j + k], ()):
+                if i > 0 and j > 0 and page[i - 1] == node_string[j - 1]:
+                    continue  # déjà couvert par le départ (i-1, j-1)
+                size = k
+                while i + size < n and j + size < m and page[i + size] == node_string[j + size]:
+                    size += 1
+                if size > best_size or (size == best_size and i < best_i):
+                    best_i, best_j, best_size = i, j, size
+        if best_size >= k:
+            return difflib.Match(best_i, best_j, best_size)
+
+        # 4. Pas de k-gramme commun : correspondance courte, difflib suffit
+        matcher = difflib.SequenceMatcher(None, page, node_string, autojunk=False)
+        return matcher.find_longest_match(0, n, 0, m)
+
+
+# --- CLASSES DE CARACTÈRES (précompilées) ---
+
+# Plages maximales de caractères non blancs (blanc = \s ou \x07)
+NON_BLANK_RE = re.compile(r'[^\s\x07]+')
+# Marqueur de liste en début de texte (a., 1), •...)
+LIST_MARKER_RE = re.compile(r'^\s*([a-zA-Z0-9]{1,3}[\.\)]|[●•\-–➝])\s*')
+
+
+# Caractère de mot (même définition que \w dans les frontières des overrides)
+WORD_CHAR_RE = re.compile(r'\w')
+
+
+def non_blank_spans(text):
+    """Masque des blancs d'une chaîne, calculé en une passe : liste des plages (début, fin) non blanches."""
+    return [m.span() for m in NON_BLANK_RE.finditer(text)]
+
+
+# --- OVERRIDES : RECHERCHE MULTI-MOTIFS ---
+
+class OverrideMatcher:
+    r"""Automate d'Aho–Corasick sur les mots d'override d'une ligne CSV.
+
+    Toutes les occurrences de tous les mots sont trouvées en une seule passe sur la phrase.
+    Les frontières de mot sont celles de l'ancienne regex par mot : (?<!\w) si le mot
+    commence par \w, (?!\w) s'il finit par \w ; occurrences non chevauchantes par mot,
+    comme re.finditer.
+    """
+
+    def __init__(self, words):
+        self.words = words
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for idx, word in enumerate(words):
+            node = 0
+            for ch in word:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[node][ch] = nxt
+                node = nxt
+            self.out[node].append(idx)
+
+        # Liens d'échec (parcours en largeur)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def find_all(self, text):
+        """Renvoie {indice du mot: [(début, fin), ...]} avec les frontières et sans chevauchement par mot."""
+        goto, fail, out, words = self.goto, self.fail, self.out, self.words
+        bound_start = [bool(WORD_CHAR_RE.match(w[0])) for w in words]
+        bound_end = [bool(WORD_CHAR_RE.match(w[-1])) for w in words]
+        last_end = [0] * len(words)
+        matches = {}
+        n = len(text)
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for idx in out[node]:
+                end = pos + 1
+                start = end - len(words[idx])
+                # Les occurrences d'un même mot arrivent dans l'ordre : glouton comme re.finditer
+                if start < last_end[idx]:
+                    continue
+                if bound_start[idx] and start > 0 and WORD_CHAR_RE.match(text[start - 1]):
+                    continue
+                if bound_end[idx] and end < n and WORD_CHAR_RE.match(text[end]):
+                    continue
+                last_end[idx] = end
+                matches.setdefault(idx, []).append((start, end))
+        return matches
+
+
+# --- REPRÉSENTATION DES STYLES ---
+
+class StyleTable:
+    """Table d'interning des styles (gras, italique, couleur) : un id entier par style distinct.
+
+    L'id 0 est le style neutre (False, False, None).
+    """
+
+    def __init__(self):
+        self.styles = [(False, False, None)]
+        self.ids = {self.styles[0]: 0}
+
+    def intern(self, bold, italic, color):
+        key = (bold, italic, color)
+        sid = self.ids.get(key)
+        if sid is None:
+            sid = len(self.styles)
+            self.styles.append(key)
+            self.ids[key] = sid
+        return sid
+
+
+def count_in(sorted_positions, lo, hi):
+    """Nombre de positions (liste triée) dans [lo, hi)."""
+    return bisect_left(sorted_positions, hi) - bisect_left(sorted_positions, lo)
+
+
 # --- MOTEUR PRINCIPAL ---
 
-def process_page(json_path, csv_path, output_path):
-    if not os.path.exists(json_path) or not os.path.exists(csv_path):
-        return
+def styles_from_rows(rows, table):
+    """Styles de page depuis les lignes de pdfToTxtStyle (dicts du CSV ou de la base) :
+    (caractères non blancs, id de style par caractère)."""
+    # Un id de style par caractère non blanc de la page (tableau compact, pas de dict par caractère)
+    global_csv_chars = []
+    global_csv_styles = array('H')
+
+    for row in rows:
+        phrase = row.get('phrase', '')
+        overrides = row.get('overrides', '').strip()
+        base_color = row.get('color_hex', '').strip()
+        base_style = row.get('style_tag', '').strip()
+
+        if not phrase: continue
+        N = len(phrase)
+
+        row_sid = table.intern(is_bold_style(base_style), is_italic_style(base_style), base_color)
+        char_style = array('H', [row_sid]) * N
+
+        if overrides:
+            # Mot -> style du DERNIER override de ce mot (l'ordre de la liste fait foi)
+            target_sid = {}
+            items = overrides.split('||')
+            for item in items:
+                parts = item.split('|')
+                if len(parts) >= 5:
+                    target = parts[0].strip()
+                    if not target: continue
+                    o_color = parts[3].strip()
+                    o_style = parts[4].strip()
+                    target_sid.pop(target, None)
+                    target_sid[target] = table.intern(is_bold_style(o_style), is_italic_style(o_style), o_color)
+
+            # Toutes les cibles en une passe ; application dans l'ordre des derniers overrides,
+            # si bien qu'un caractère couvert par plusieurs mots garde le style du plus tardif
+            targets = list(target_sid)
+            found = OverrideMatcher(targets).find_all(phrase) if targets else {}
+            for idx, target in enumerate(targets):
+                t_sid = target_sid[target]
+                for start, end in found.get(idx, ()):
+                    char_style[start:end] = array('H', [t_sid]) * (end - start)
+
+        # Marqueur de liste (a., 1), •...) : jamais stylisé
+        m_list = LIST_MARKER_RE.match(phrase)
+        if m_list:
+            start, end = m_list.span(1)
+            char_style[start:end] = array('H', [0]) * (end - start)
+
+        for start, end in non_blank_spans(phrase):
+            global_csv_chars.append(phrase[start:end])
+            global_csv_styles.extend(char_style[start:end])
+
+    return "".join(global_csv_chars), global_csv_styles
+
+
+def load_csv_styles(csv_path, table):
+    """Styles de page depuis le CSV de pdfToTxtStyle."""
+    with open(csv_path, mode='r', encoding='utf-8') as f:
+        return styles_from_rows(csv.DictReader(f, delimiter=';'), table)
+
+
+def load_run_styles(runs_path, table):
+    """Styles de page depuis page_N.runs.json (runs de caractères PyMuPDF, pdfToTxtStyle --runs).
+
+    Même sortie que load_csv_styles, mais avec le style exact de chaque span
+    au lieu du style dominant de la ligne corrigé par les overrides.
+    """
+    with open(runs_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    text = data["text"]
+    runs = data["runs"]
+    run_sids = [table.intern(bool(flags & 1), bool(flags & 2), data["colors"][color])
+                for flags, color in zip(runs["flags"], runs["color"])]
+
+    page_styles = array('H', [0]) * len(text)
+    for offset, length, sid in zip(runs["offset"], runs["length"], run_sids):
+        page_styles[offset:offset + length] = array('H', [sid]) * length
 
-    # 1. CHARGEMENT CSV
     global_csv_chars = []
-    global_csv_styles = []
+    global_csv_styles = array('H')
+    line_starts = data["lines"]
+    for i, line_start in enumerate(line_starts):
+        line_end = line_starts[i + 1] if i + 1 < len(line_starts) else len(text)
+        phrase = text[line_start:line_end]
+        char_style = page_styles[line_start:line_end]
 
-    with open(csv_path, mode='r', encoding='utf-8') as f:
-        reader = csv.DictReader(f, delimiter=';')
-        for row in reader:
-            phrase = row.get('phrase', '')
-            overrides = row.get('overrides', '').strip()
-            base_color = row.get('color_hex', '').strip()
-            base_style = row.get('style_tag', '').strip()
-
-            if not phrase: continue
-            N = len(phrase)
-
-            row_bold = is_bold_style(base_style)
-            row_italic = is_italic_style(base_style)
-
-            char_bold = [row_bold] * N
-            char_italic = [row_italic] * N
-            char_color = [base_color] * N
-            is_marker = [False] * N
-
-            if overrides:
-                items = overrides.split('||')
-                for item in items:
-                    parts = item.split('|')
-                    if len(parts) >= 5:
-                        target = parts[0].strip()
-                        if not target: continue
-                        o_color = parts[3].strip()
-                        o_style = parts[4].strip()
-                        t_bold = is_bold_style(o_style)
-                        t_italic = is_italic_style(o_style)
-
-                        target_esc = re.escape(target)
-                        if re.match(r'^\w', target, flags=re.UNICODE):
-                            target_esc = r'(?<!\w)' + target_esc
-                        if re.search(r'\w$', target, flags=re.UNICODE):
-                            target_esc = target_esc + r'(?!\w)'
-
-                        for m in re.finditer(target_esc, phrase, flags=re.UNICODE):
-                            for i in range(m.start(), m.end()):
-                                char_bold[i] = t_bold
-                                char_italic[i] = t_italic
-                                char_color[i] = o_color
-
-            m_list = re.match(r'^\s*([a-zA-Z0-9]{1,3}[\.\)]|[●•\-–➝])\s*', phrase)
-            if m_list:
-                start, end = m_list.span(1)
-                for i in range(start, end):
-                    is_marker[i] = True
-
-            for i in range(N):
-                c = phrase[i]
-                if not re.match(r'\s|\x07', c):
-                    global_csv_chars.append(c)
-                    global_csv_styles.append({
-                        'bold': False if is_marker[i] else char_bold[i],
-                        'italic': False if is_marker[i] else char_italic[i],
-                        'color': None if is_marker[i] else char_color[i]
-                    })
-
-    global_csv_string = "".join(global_csv_chars)
+        # Marqueur de liste (a., 1), •...) : jamais stylisé
+        m_list = LIST_MARKER_RE.match(phrase)
+        if m_list:
+            start, end = m_list.span(1)
+            char_style[start:end] = array('H', [0]) * (end - start)
+
+        for start, end in non_blank_spans(phrase):
+            global_csv_chars.append(phrase[start:end])
+            global_csv_styles.extend(char_style[start:end])
+
+    return "".join(global_csv_chars), global_csv_styles
+
+
+def process_page(json_path, style_path, output_path):
+    """style_path : CSV de pdfToTxtStyle ou page_N.runs.json."""
+    if not os.path.exists(json_path) or not os.path.exists(style_path):
+        return
+
+    table = StyleTable()
+
+    # 1. CHARGEMENT DES STYLES (CSV ou runs)
+    if style_path.endswith(".runs.json"):
+        global_csv_string, global_csv_styles = load_run_styles(style_path, table)
+    else:
+        global_csv_string, global_csv_styles = load_csv_styles(style_path, table)
 
     # 2. CHARGEMENT JSON
     with open(json_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
+    style_data(data, global_csv_string, global_csv_styles, table)
+
+    with atomic_open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"✅ Fichier stylisé généré : {output_path}")
+
+
+def process_store_page(store_path, page, runs_path=None):
+    """process_page sur le stockage unique du document (MALIN_STORE) : lignes + exercices lus en base,
+    exercices stylisés réécrits en base."""
+    store = DocStore(store_path)
+    table = StyleTable()
+    if runs_path is not None:
+        global_csv_string, global_csv_styles = load_run_styles(runs_path, table)
+    else:
+        global_csv_string, global_csv_styles = styles_from_rows(store.get_lines(page), table)
+    data = store.get_exercises(page)
+    style_data(data, global_csv_string, global_csv_styles, table)
+    store.put_styled(page, data)
+    store.close()
+    print(f"✅ Page stylisée en base : page_{page}")
+
+
+def style_data(data, global_csv_string, global_csv_styles, table):
+    """Applique en place les styles de la page aux champs texte des exercices de data."""
+    aligner = PageAligner(global_csv_string)
+
     nodes = []
 
     def gather_strings(node):
@@ -128,84 +381,75 @@ def process_page(json_path, csv_path, output_path):
     gather_strings(data)
 
     # 3. ALIGNEMENT
+    # Les styles d'un nœud sont des runs [début, fin, id_style] triés et disjoints ;
+    # les caractères hors runs ont le style neutre (id 0).
     cursor_hint = 0
     for node in nodes:
         text = node['text']
-        json_chars = []
-        json_indices = []
-        for i, c in enumerate(text):
-            if not re.match(r'\s|\x07', c):
-                json_chars.append(c)
-                json_indices.append(i)
-
-        node_nw_string = "".join(json_chars)
+        spans = non_blank_spans(text)
+        json_indices = [i for start, end in spans for i in range(start, end)]
+
+        node_nw_string = "".join(text[start:end] for start, end in spans)
         if not node_nw_string: continue
 
-        matcher = difflib.SequenceMatcher(None, global_csv_string, node_nw_string, autojunk=False)
-        match = matcher.find_longest_match(0, len(global_csv_string), 0, len(node_nw_string))
+        match = aligner.find(node_nw_string, cursor_hint)
 
         N_json = len(text)
-        final_bold = [False] * N_json
-        final_italic = [False] * N_json
-        final_color = [None] * N_json
+        runs = []
 
         if match.size > 0:
             csv_start = match.a
-            for i in range(match.size):
-                if i < len(json_indices):
-                    real_idx = json_indices[i]
-                    style = global_csv_styles[csv_start + i]
-                    final_bold[real_idx] = style['bold']
-                    final_italic[real_idx] = style['italic']
-                    final_color[real_idx] = style['color']
+            for i in range(min(match.size, len(json_indices))):
+                real_idx = json_indices[i]
+                sid = global_csv_styles[csv_start + i]
+                if runs and runs[-1][1] == real_idx and runs[-1][2] == sid:
+                    runs[-1][1] = real_idx + 1
+                else:
+                    runs.append([real_idx, real_idx + 1, sid])
             cursor_hint = csv_start + match.size
 
         # 4. LISSAGE
-        for i in range(1, N_json - 1):
-            if re.match(r'\s|\x07', text[i]):
-                l = i - 1
-                while l >= 0 and re.match(r'\s|\x07', text[l]): l -= 1
-                r = i + 1
-                while r < N_json and re.match(r'\s|\x07', text[r]): r += 1
-                if l >= 0 and r < N_json:
-                    if final_bold[l] == final_bold[r] and final_italic[l] == final_italic[r] and final_color[l] == \
-                            final_color[r]:
-                        final_bold[i] = final_bold[l]
-                        final_italic[i] = final_italic[l]
-                        final_color[i] = final_color[l]
+        # Un blanc entre deux caractères de même style prend ce style : on fusionne deux runs
+        # de même style séparés uniquement par des blancs (une seule passe linéaire)
+        smoothed = []
+        for run in runs:
+            if smoothed:
+                prev = smoothed[-1]
+                if prev[2] == run[2] and count_in(json_indices, prev[1], run[0]) == 0:
+                    prev[1] = run[1]
+                    continue
+            smoothed.append(run)
+        runs = smoothed
 
         # 5. LOGIQUE DELTA (GRAS / ITALIQUE / COULEUR)
         marker_len = 0
-        m_marker = re.match(r'^\s*([a-zA-Z0-9]{1,3}[\.\)]|[●•\-–➝])\s*', text)
+        m_marker = LIST_MARKER_RE.match(text)
         if m_marker: marker_len = m_marker.end()
 
-        valid_indices = []
-        for i in range(marker_len, N_json):
-            if not re.match(r'\s|\x07', text[i]):
-                valid_indices.append(i)
+        # Nombre de caractères non blancs "valides" (après le marqueur), au total et par run
+        n_valid = count_in(json_indices, marker_len, N_json)
+        run_valid = [count_in(json_indices, max(s, marker_len), max(e, marker_len)) for s, e, _ in runs]
 
-        if valid_indices:
+        if n_valid:
+            styles = table.styles
             # A. Delta Gras
-            all_bold = all(final_bold[i] for i in valid_indices)
-            if all_bold:
-                for i in range(N_json): final_bold[i] = False
-
+            all_bold = sum(n for n, (_, _, sid) in zip(run_valid, runs) if styles[sid][0]) == n_valid
             # B. Delta Italique
-            all_italic = all(final_italic[i] for i in valid_indices)
-            if all_italic:
-                for i in range(N_json): final_italic[i] = False
+            all_italic = sum(n for n, (_, _, sid) in zip(run_valid, runs) if styles[sid][1]) == n_valid
 
             # C. Delta COULEUR (INTELLIGENT)
-            visible_colors = []
-            for i in valid_indices:
-                if final_color[i]: visible_colors.append(final_color[i].lower())
+            visible_colors = Counter()
+            for n, (_, _, sid) in zip(run_valid, runs):
+                if n and styles[sid][2]:
+                    visible_colors[styles[sid][2].lower()] += n
 
+            drop_color = None  # fonction couleur -> bool : couleurs à retirer
             if visible_colors:
                 unique_colors = set(visible_colors)
 
                 # 1. Si tout est uniforme (ex: Tout Mauve, ou Tout Noir) -> On nettoie tout
                 if len(unique_colors) == 1:
-                    for i in range(N_json): final_color[i] = None
+                    drop_color = lambda c: True
                 else:
                     # 2. Si c'est mélangé (ex: Mauve + Noir)
                     # On cherche si le NOIR est présent. Si oui, le Noir est la BASE.
@@ -213,40 +457,45 @@ def process_page(json_path, csv_path, output_path):
 
                     if has_black:
                         # La base est le Noir. On nettoie le noir, on garde le reste.
-                        for i in range(N_json):
-                            if is_black_color(final_color[i]):
-                                final_color[i] = None
+                        drop_color = is_black_color
                     else:
                         # Pas de noir (ex: Rouge + Bleu). La base est la couleur majoritaire.
-                        from collections import Counter
-                        most_common = Counter(visible_colors).most_common(1)[0][0]
-                        for i in range(N_json):
-                            if final_color[i] and final_color[i].lower() == most_common:
-                                final_color[i] = None
-
-            # Sécurité finale : ne jamais baliser du noir standard
-            for i in range(N_json):
-                if is_black_color(final_color[i]): final_color[i] = None
+                        most_common = visible_colors.most_common(1)[0][0]
+                        drop_color = lambda c: bool(c) and c.lower() == most_common
+
+            # Les transformations s'appliquent à tous les caractères : on les applique par style
+            for run in runs:
+                b, it, c = styles[run[2]]
+                if all_bold: b = False
+                if all_italic: it = False
+                if drop_color is not None and drop_color(c): c = None
+                # Sécurité finale : ne jamais baliser du noir standard
+                if is_black_color(c): c = None
+                run[2] = table.intern(b, it, c)
 
         # 6. RECONSTRUCTION
+        # Segments = plages maximales de même style (les trous entre runs sont neutres)
         segments = []
-        curr_seg = ""
-        curr_b, curr_i, curr_c = False, False, None
-
-        for i in range(N_json):
-            b, it, c = final_bold[i], final_italic[i], final_color[i]
-            if b != curr_b or it != curr_i or c != curr_c:
-                if curr_seg: segments.append((curr_seg, curr_b, curr_i, curr_c))
-                curr_seg = text[i]
-                curr_b, curr_i, curr_c = b, it, c
+        pos = 0
+        for start, end, sid in runs + [[N_json, N_json, 0]]:
+            if start > pos:
+                segments.append([pos, start, 0])
+            if end > start:
+                segments.append([start, end, sid])
+            pos = end
+        merged = []
+        for seg in segments:
+            if merged and merged[-1][2] == seg[2]:
+                merged[-1][1] = seg[1]
             else:
-                curr_seg += text[i]
-        if curr_seg: segments.append((curr_seg, curr_b, curr_i, curr_c))
+                merged.append(seg)
 
-        result = ""
-        for seg_txt, b, it, c in segments:
+        result = []
+        for start, end, sid in merged:
+            seg_txt = text[start:end]
+            b, it, c = table.styles[sid]
             if not seg_txt.strip():
-                result += seg_txt
+                result.append(seg_txt)
                 continue
             lspace = len(seg_txt) - len(seg_txt.lstrip())
             rspace = len(seg_txt) - len(seg_txt.rstrip())
@@ -256,48 +505,107 @@ def process_page(json_path, csv_path, output_path):
             if b: formatted = f"\\bf{{{formatted}}}"
             if it: formatted = f"\\it{{{formatted}}}"
             if c: formatted = f"\\color{{\"{formatted}\", {c}}}"
-            result += seg_txt[:lspace] + formatted + (seg_txt[len(seg_txt) - rspace:] if rspace > 0 else "")
+            result.append(seg_txt[:lspace])
+            result.append(formatted)
+            if rspace > 0:
+                result.append(seg_txt[len(seg_txt) - rspace:])
 
-        node['parent'][node['key']] = result
+        node['parent'][node['key']] = "".join(result)
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"✅ Fichier stylisé généré : {output_path}")
 
+def timed_call(fn, *args):
+    """fn(*args) + durée (exécutable dans un processus du pool)."""
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
 
-def main():
-    # === NOUVEAUX DOSSIERS ===
-    base_dir = Path(__file__).resolve().parent
 
-    csv_dir = os.path.join(base_dir, "files_style")
-    json_dir = os.path.join(base_dir, "extractionOut")
-    output_dir = os.path.join(base_dir, "extractionOutStyle")
+def page_number(path):
+    m = re.search(r"page_(\d+)", os.path.basename(path))
+    return int(m.group(1)) if m else 0
 
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
 
-    # Trouve tous les JSON page_*.json
-    json_files = glob.glob(os.path.join(json_dir, "page_*.json"))
-
-    print(f"Fichiers trouvés : {len(json_files)}")
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1, help="Nombre de processus (1 = séquentiel)")
+    args = parser.parse_args()
 
-    for json_path in json_files:
-        filename = os.path.basename(json_path)
-        page_name = os.path.splitext(filename)[0]
+    # === NOUVEAUX DOSSIERS === (dossier de travail : MALIN_WORKDIR, défaut : dossier du script)
+    base_dir = work_dir()
 
-        # CSV correspondant dans files_style
-        csv_path = os.path.join(csv_dir, f"{page_name}.csv")
+    csv_dir = os.path.join(base_dir, "files_style")
+    json_dir = os.path.join(base_dir, "extractionOut")
+    output_dir = os.path.join(base_dir, "extractionOutStyle")
 
-        if os.path.exists(csv_path):
+    # Job = (page, fonction, arguments) ; les processus du pool rouvrent la base par son chemin
+    jobs = []
+    store = open_store()
+    if store is not None:
+        # Stockage unique du document (MALIN_STORE) : lignes et exercices lus en base
+        pages = [page for page in store.pages("exercises") if page_selected(page)]  # MALIN_PAGES
+        print(f"Pages trouvées en base : {len(pages)}")
+        for page in pages:
+            page_name = f"page_{page}"
+            runs_path = os.path.join(csv_dir, f"{page_name}.runs.json")
+            if os.path.exists(runs_path):
+                jobs.append((page_name, process_store_page, (store.path, page, runs_path)))
+            elif store.has_page(page, "lines"):
+                jobs.append((page_name, process_store_page, (store.path, page)))
+            else:
+                print(f"[SKIP] {page_name} : lignes de texte manquantes.")
+        store.close()
+    else:
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        # Trouve tous les JSON page_*.json
+        json_files = sorted(glob.glob(os.path.join(json_dir, "page_*.json")), key=page_number)
+        json_files = [p for p in json_files if page_selected(page_number(p))]  # MALIN_PAGES
+
+        print(f"Fichiers trouvés : {len(json_files)}")
+
+        for json_path in json_files:
+            filename = os.path.basename(json_path)
+            page_name = os.path.splitext(filename)[0]
+
+            # Styles correspondants dans files_style : runs de caractères (pdfToTxtStyle --runs) sinon CSV
+            runs_path = os.path.join(csv_dir, f"{page_name}.runs.json")
+            csv_path = os.path.join(csv_dir, f"{page_name}.csv")
+            style_path = runs_path if os.path.exists(runs_path) else csv_path
+
+            if os.path.exists(style_path):
+                output_path = os.path.join(output_dir, f"{page_name}--style.json")
+                jobs.append((page_name, process_page, (json_path, style_path, output_path)))
+            else:
+                print(f"[SKIP] {page_name} : CSV manquant.")
+
+    start = time.perf_counter()
+    timings = {}
+    if args.workers > 1 and len(jobs) > 1:
+        # Les pages sont indépendantes : une page par tâche
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = {pool.submit(timed_call, fn, *fn_args): page_name for page_name, fn, fn_args in jobs}
+            for future in as_completed(futures):
+                page_name = futures[future]
+                try:
+                    timings[page_name] = future.result()
+                    print(f"--> {page_name} : {timings[page_name]:.2f}s")
+                except Exception as e:
+                    print(f"[ERR] {page_name} : {e}")
+    else:
+        for page_name, fn, fn_args in jobs:
             print(f"--> Traitement de {page_name}...")
-            process_page(
-                json_path,
-                csv_path,
-                os.path.join(output_dir, f"{page_name}--style.json")
-            )
-        else:
-            print(f"[SKIP] {page_name} : CSV manquant.")
+            timings[page_name] = timed_call(fn, *fn_args)
+            print(f"    {page_name} : {timings[page_name]:.2f}s")
+
+    if timings:
+        slowest = max(timings, key=timings.get)
+        print(f"[INFO] {len(timings)} pages en {time.perf_counter() - start:.2f}s "
+              f"(cumul {sum(timings.values()):.2f}s, plus lente : {slowest} {timings[slowest]:.2f}s, "
+              f"workers={max(1, args.workers)})")
+    if len(timings) < len(jobs):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
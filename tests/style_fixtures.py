@@ -0,0 +1,146 @@
+import csv
+import json
+import random
+import re
+
+# Générateur de pages de test pour style-post.py : CSV de pdfToTxtStyle.py (lignes, style dominant,
+# overrides) et JSON d'exercices dont les textes sont repris de la page, plus ou moins fidèlement.
+# Reproductible : une graine par page.
+
+LINE_COLUMNS = ["phrase", "font_family", "size", "color_hex", "style_tag", "overrides"]
+
+WORDS = ["Complète", "les", "phrases", "avec", "le", "bon", "mot", "chat", "chien", "l'école", "à", "la",
+         "maison", "Recopie", "texte", "en", "corrigeant", "erreurs", "Entoure", "verbes", "il", "elle",
+         "mange", "mangeons", "été", "œuf", "garçon", "a", "b", "1", "12", ",", ".", "!", "?", ":", "«", "»",
+         "(", ")", "-", "aujourd'hui", "très", "grand", "grande", "petit"]
+MARKERS = ["1. ", "2) ", "a. ", "b) ", "• ", "● ", "- ", "– ", "➝ ", "12. ", "abc) "]
+BLANKS = [" ", " ", " ", "  ", "\t", "\x07", " ", " \x07 "]
+STYLES = ["Regular", "Bold", "Italic", "BoldItalic", "Medium", "Black", "Light", "SemiboldOblique", ""]
+COLORS = ["#000000", "#231f20", "#181715", "#e4007c", "#0072BC", "#0072bc", "#ffffff", "#7f3f98", ""]
+FIELDS = ["instruction", "statement", "hint", "example"]
+
+
+def make_phrase(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(1, 12))]
+    phrase = words[0]
+    for word in words[1:]:
+        phrase += rng.choice(BLANKS) + word
+    if rng.random() < 0.3:
+        phrase = rng.choice(MARKERS) + phrase
+    if rng.random() < 0.15:
+        phrase = rng.choice(BLANKS) + phrase
+    if rng.random() < 0.15:
+        phrase += rng.choice(BLANKS)
+    return phrase
+
+
+def make_overrides(rng, phrase):
+    """Overrides "mot|police|taille|couleur|style" séparés par "||" : mots de la phrase, groupes de mots,
+    fragments, mots absents, doublons, cibles vides et entrées incomplètes."""
+    tokens = [t for t in re.split(r"[\s\x07]+", phrase) if t]
+    items = []
+    for _ in range(rng.choice([0, 0, 1, 2, 3, 5])):
+        r = rng.random()
+        if r < 0.45 and tokens:
+            target = rng.choice(tokens)
+        elif r < 0.6 and len(tokens) > 1:
+            i = rng.randrange(len(tokens) - 1)
+            target = f"{tokens[i]} {tokens[i + 1]}"
+        elif r < 0.75 and phrase.strip():
+            i = rng.randrange(len(phrase))
+            target = phrase[i:i + rng.randint(1, 4)]
+        elif r < 0.85:
+            target = rng.choice(WORDS)
+        elif r < 0.9:
+            target = ""
+        else:
+            items.append(f"{rng.choice(WORDS)}|Font|10")  # moins de 5 champs : ignoré
+            continue
+        if "|" in target:
+            continue
+        items.append(f"{target}|Font-{rng.choice(STYLES)}|{rng.choice([9, 10.5, 12])}|"
+                     f"{rng.choice(COLORS)}|{rng.choice(STYLES)}")
+    if items and rng.random() < 0.2:
+        items.append(items[0])  # même mot surchargé deux fois
+    return "||".join(items)
+
+
+def make_rows(rng):
+    rows = []
+    for _ in range(rng.randint(1, 25)):
+        phrase = make_phrase(rng) if rng.random() > 0.03 else ""
+        rows.append({"phrase": phrase, "font_family": "Font", "size": "10",
+                     "color_hex": rng.choice(COLORS), "style_tag": rng.choice(STYLES),
+                     "overrides": make_overrides(rng, phrase)})
+    return rows
+
+
+def non_blank(text):
+    return re.sub(r"[\s\x07]", "", text)
+
+
+def occurrences(page, node):
+    count, pos = 0, page.find(node)
+    while pos >= 0:
+        count += 1
+        pos = page.find(node, pos + 1)
+    return count
+
+
+def make_text(rng, rows):
+    """Texte d'un nœud JSON : tranche d'une ligne, lignes consécutives, blancs changés, faute de frappe,
+    texte absent de la page."""
+    phrases = [row["phrase"] for row in rows if row["phrase"]]
+    if not phrases or rng.random() < 0.05:
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+    i = rng.randrange(len(phrases))
+    text = "\n".join(phrases[i:i + rng.choice([1, 1, 1, 2, 3])])
+    if rng.random() < 0.4:
+        a = rng.randrange(len(text))
+        text = text[a:a + rng.randint(1, len(text))]
+    if rng.random() < 0.3:
+        text = re.sub(r"[\s\x07]+", lambda m: rng.choice([" ", "\n", "", m.group(0)]), text)
+    if rng.random() < 0.15 and text:
+        a = rng.randrange(len(text))
+        text = text[:a] + rng.choice("xyzé ") + text[a + 1:]
+    return text
+
+
+def make_page(seed, unique_nodes=True):
+    """(lignes du CSV, exercices JSON) d'une page.
+
+    unique_nodes : les textes présents en entier sur la page n'y apparaissent qu'une fois (hors espaces),
+    seul cas où l'alignement ne dépend pas de la position du nœud précédent.
+    """
+    rng = random.Random(seed)
+    rows = make_rows(rng)
+    page = non_blank("".join(row["phrase"] for row in rows))
+
+    def text():
+        for _ in range(20):
+            t = make_text(rng, rows)
+            if not unique_nodes or occurrences(page, non_blank(t)) <= 1:
+                return t
+        return "texte absent de la page"
+
+    exercises = []
+    for n in range(rng.randint(1, 6)):
+        props = {field: (text() if rng.random() < 0.8 else None) for field in FIELDS}
+        props["number"] = str(n + 1)
+        props["labels"] = [text() for _ in range(rng.choice([0, 0, 1, 3]))]
+        exercises.append({"id": f"p1_ex{n + 1}", "type": "exercise", "properties": props})
+    return rows, exercises
+
+
+def write_page(directory, seed, unique_nodes=True):
+    """Écrit page_1.csv et page_1.json dans directory ; renvoie leurs chemins."""
+    rows, exercises = make_page(seed, unique_nodes)
+    csv_path = directory / "page_1.csv"
+    json_path = directory / "page_1.json"
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=LINE_COLUMNS, delimiter=";")
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(exercises, f, ensure_ascii=False, indent=2)
+    return csv_path, json_path
@@ -0,0 +1,67 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from crop_geometry import pdf_renderable, raster_box_to_pdf_rect
+
+DPI = 450
+A4 = (595, 842)
+
+
+def a4_page(cropbox=None):
+    """Page A4 avec un rectangle rouge en (100, 200, 300, 400) dans la MediaBox, CropBox éventuelle."""
+    doc = fitz.open()
+    page = doc.new_page(width=A4[0], height=A4[1])
+    page.draw_rect(fitz.Rect(100, 200, 300, 400), color=(1, 0, 0), fill=(1, 0, 0))
+    if cropbox is not None:
+        page.set_cropbox(cropbox)
+    return doc, page
+
+
+def ghostscript_raster(media_rect):
+    """Boîte en pixels et taille du raster de la MediaBox entière à DPI (rendu de pdfToImages.py)."""
+    k = DPI / 72
+    points = [[media_rect.x0 * k, media_rect.y0 * k], [media_rect.x1 * k, media_rect.y1 * k]]
+    return points, round(A4[0] * k), round(A4[1] * k)
+
+
+def assert_rect_close(rect, expected, tol=0.5):
+    assert all(abs(a - b) <= tol for a, b in zip(rect, expected)), (rect, expected)
+
+
+def test_full_page():
+    doc, page = a4_page()
+    points, w, h = ghostscript_raster(fitz.Rect(100, 200, 300, 400))
+    assert pdf_renderable(page, {"imageWidth": w, "imageHeight": h})
+    assert_rect_close(raster_box_to_pdf_rect(page, points, w, h), (100, 200, 300, 400))
+    doc.close()
+
+
+def test_inset_cropbox():
+    # Fond perdu d'un PDF d'impression : CropBox rentrée de 9 pt de chaque côté (proportions à 0,9 %)
+    doc, page = a4_page(fitz.Rect(9, 9, A4[0] - 9, A4[1] - 9))
+    points, w, h = ghostscript_raster(fitz.Rect(100, 200, 300, 400))
+    assert pdf_renderable(page, {"imageWidth": w, "imageHeight": h})
+    clip = raster_box_to_pdf_rect(page, points, w, h)
+    assert_rect_close(clip, (91, 191, 291, 391))
+
+    # La découpe rendue depuis le PDF est bien le rectangle rouge, bords compris
+    pix = page.get_pixmap(dpi=72, clip=clip)
+    for x, y in [(1, 1), (pix.width // 2, pix.height // 2), (pix.width - 2, pix.height - 2)]:
+        assert pix.pixel(x, y) == (255, 0, 0)
+    doc.close()
+
+
+def test_asymmetric_cropbox_clipped_to_page():
+    doc, page = a4_page(fitz.Rect(150, 20, A4[0], A4[1] - 9))
+    points, w, h = ghostscript_raster(fitz.Rect(100, 200, 300, 400))
+    # Partie de la boîte hors de la CropBox (x < 150) coupée
+    assert_rect_close(raster_box_to_pdf_rect(page, points, w, h), (0, 180, 150, 380))
+    doc.close()
+
+
+def test_rotated_page_not_renderable():
+    doc, page = a4_page()
+    page.set_rotation(90)
+    assert not pdf_renderable(page, {"imageWidth": 3719, "imageHeight": 5262})
+    doc.close()
@@ -0,0 +1,108 @@
+import difflib
+import importlib.util
+import random
+import re
+from pathlib import Path
+
+import pytest
+
+import style_post_reference as reference
+from style_fixtures import WORDS, make_overrides, make_phrase, non_blank, write_page
+
+# style-post.py (nom avec tiret) chargé comme module
+_spec = importlib.util.spec_from_file_location("style_post", Path(__file__).resolve().parent.parent / "style-post.py")
+style_post = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(style_post)
+
+PAGES = 800
+
+
+@pytest.mark.parametrize("chunk", range(8))
+def test_styled_output_byte_identical(tmp_path, chunk):
+    """Sortie stylisée identique octet pour octet à l'ancien moteur (textes uniques sur la page)."""
+    for seed in range(chunk * PAGES // 8, (chunk + 1) * PAGES // 8):
+        csv_path, json_path = write_page(tmp_path, seed)
+        reference.process_page(str(json_path), str(csv_path), str(tmp_path / "old.json"))
+        style_post.process_page(str(json_path), str(csv_path), str(tmp_path / "new.json"))
+        assert (tmp_path / "new.json").read_bytes() == (tmp_path / "old.json").read_bytes(), f"graine {seed}"
+
+
+def test_aligner_matches_difflib():
+    """PageAligner.find : même correspondance que find_longest_match quand le nœud n'est pas répété."""
+    rng = random.Random(0)
+    for _ in range(3000):
+        page = non_blank("".join(make_phrase(rng) for _ in range(rng.randint(1, 20))))
+        a = rng.randrange(len(page))
+        node = page[a:a + rng.randint(1, 80)]
+        if rng.random() < 0.5:
+            node = "".join(c if rng.random() > 0.05 else rng.choice("xyzé") for c in node)
+        if rng.random() < 0.1:
+            node = non_blank(" ".join(rng.choice(WORDS) for _ in range(4)))
+        if page.count(node) > 1:
+            continue
+        expected = difflib.SequenceMatcher(None, page, node, autojunk=False).find_longest_match(
+            0, len(page), 0, len(node))
+        found = style_post.PageAligner(page).find(node, rng.randrange(len(page) + 1))
+        if expected.size == 0:
+            assert found.size == 0
+        else:
+            assert tuple(found) == tuple(expected), (page, node)
+
+
+def test_aligner_follows_cursor_on_repeated_text():
+    """Texte répété : l'occurrence qui suit le nœud précédent, et non la première de la page."""
+    page = "Complètelesphrases" + "x" * 3000 + "Complètelesphrases"
+    aligner = style_post.PageAligner(page)
+    assert aligner.find("Complètelesphrases", 0).a == 0
+    assert aligner.find("Complètelesphrases", 3010).a == 3018
+
+
+def reference_row_styles(phrase, overrides):
+    """Styles (gras, italique, couleur) par caractère d'une ligne avec l'ancienne boucle regex par override."""
+    n = len(phrase)
+    bold, italic, color = [False] * n, [False] * n, [""] * n
+    for item in overrides.split("||"):
+        parts = item.split("|")
+        if len(parts) < 5 or not parts[0].strip():
+            continue
+        target = parts[0].strip()
+        target_esc = re.escape(target)
+        if re.match(r"^\w", target):
+            target_esc = r"(?<!\w)" + target_esc
+        if re.search(r"\w$", target):
+            target_esc = target_esc + r"(?!\w)"
+        for m in re.finditer(target_esc, phrase):
+            for i in range(m.start(), m.end()):
+                bold[i] = reference.is_bold_style(parts[4].strip())
+                italic[i] = reference.is_italic_style(parts[4].strip())
+                color[i] = parts[3].strip()
+    return list(zip(bold, italic, color))
+
+
+def test_override_matcher_matches_regex_loop():
+    """Overrides d'une ligne en une passe (OverrideMatcher) : mêmes styles que la boucle regex,
+    y compris mots qui se chevauchent, doublons et alphabet réduit."""
+    rng = random.Random(1)
+    for i in range(20000):
+        if i % 2:
+            phrase = "".join(rng.choice("ab a-'é") for _ in range(rng.randint(1, 30)))
+            overrides = "||".join(
+                f"{''.join(rng.choice('ab -é') for _ in range(rng.randint(1, 4)))}|F|10|"
+                f"{rng.choice(['#e4007c', '#0072bc'])}|{rng.choice(['Bold', 'Italic', ''])}"
+                for _ in range(rng.randint(1, 5)))
+        else:
+            phrase = make_phrase(rng)
+            overrides = make_overrides(rng, phrase)
+        row = {"phrase": phrase, "color_hex": "", "style_tag": "", "overrides": overrides}
+        table = style_post.StyleTable()
+        chars, sids = style_post.styles_from_rows([row], table)
+        expected = reference_row_styles(phrase, overrides)
+        marker = style_post.LIST_MARKER_RE.match(phrase)
+        for pos in range(*marker.span(1)) if marker else ():
+            expected[pos] = (False, False, None)  # marqueur de liste jamais stylisé
+        expected = [s for c, s in zip(phrase, expected) if not re.match(r"\s|\x07", c)]
+        got = [table.styles[sid] for sid in sids]
+        # Couleur absente : "" (ligne sans couleur) ou None (marqueur) selon l'origine
+        assert [(b, it, c or None) for b, it, c in got] == [(b, it, c or None) for b, it, c in expected], \
+            (phrase, overrides)
+        assert chars == non_blank(phrase)
@@ -0,0 +1,184 @@
+import argparse
+import csv
+import json
+import re
+import sys
+from pathlib import Path
+
+from docstore import open_store, page_of
+from workspace import atomic_open, page_selected, work_dir
+
+# Triage des pages avant détection et Gemini (main.py --triage <série>) : chaque page est notée
+# à partir des lignes de pdfToTxtStyle.py (densité de texte, numéros d'exercice, verbes de consigne,
+# consignes en gras, mots-clés de sommaire / corrigés). Les pages sous le seuil sont ignorées par les
+# étapes suivantes. Règles par collection de manuels dans triage_rules.json.
+#
+# Journal des décisions : triage.json dans le dossier de travail (copié dans SORTIES/<pdf>/ par main.py),
+# ou --output (un journal par tâche, cf. job_queue.py).
+
+BASE_DIR = Path(__file__).resolve().parent
+RULES_FILE = BASE_DIR / "triage_rules.json"
+TRIAGE_FILE = "triage.json"
+
+BOLD_TAGS = ("black", "bold", "semibold")
+
+
+def load_rules(path=RULES_FILE, series="default"):
+    """Règles 'default' complétées par celles de la série (clés *_extra : listes ajoutées)."""
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    rules = dict(config["default"])
+    if series != "default":
+        if series not in config.get("series", {}):
+            raise KeyError(f"série inconnue dans {path} : {series} (choix : {', '.join(config.get('series', {}))})")
+        for key, value in config["series"][series].items():
+            if key.endswith("_extra"):
+                base = key[:-len("_extra")]
+                rules[base] = [*rules.get(base, []), *value]
+            elif isinstance(value, dict):
+                rules[key] = dict(rules.get(key, {}), **value)
+            else:
+                rules[key] = value
+    return rules
+
+
+def page_lines(stem, files_style_dir, store=None):
+    """Lignes (dicts des colonnes du CSV) d'une page."""
+    if store is not None:
+        return store.get_lines(page_of(stem))
+    with open(files_style_dir / f"{stem}.csv", "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f, delimiter=";"))
+
+
+class PageScorer:
+    def __init__(self, rules):
+        self.rules = rules
+        self.number_re = re.compile(rules["number_pattern"])
+        verbs = sorted(rules["instruction_verbs"], key=len, reverse=True)
+        # Consigne : verbe en tête de ligne, éventuellement après le numéro de l'exercice
+        self.instruction_re = re.compile(
+            r"^\s*(?:\d{1,2}\s*[.)\-–]?\s*)?(?:" + "|".join(map(re.escape, verbs)) + r")(?!\w)", re.IGNORECASE)
+        # Mots-clés de sommaire / corrigés : mots entiers, cherchés dans les titres seulement
+        self.keyword_res = {k.lower(): re.compile(rf"(?<!\w){re.escape(k)}(?!\w)", re.IGNORECASE)
+                            for k in rules["skip_keywords"]}
+
+    def score(self, lines):
+        """(score, caractéristiques, raisons) d'une page."""
+        rules, weights, cap = self.rules, self.rules["weights"], self.rules["cap"]
+        chars = sum(len(row["phrase"]) for row in lines)
+        numbers = instructions = bold_instructions = 0
+        keywords = set()
+        for index, row in enumerate(lines):
+            phrase = row["phrase"]
+            bold = str(row.get("style_tag", "")).split("/")[0] in BOLD_TAGS
+            numbered = self.number_re.match(phrase) is not None
+            instruction = self.instruction_re.match(phrase) is not None
+            numbers += numbered
+            instructions += instruction
+            bold_instructions += instruction and bold
+            # Titre : ligne du haut de page ou en gras, hors numéro d'exercice et consigne
+            if (index < rules["heading_lines"] or bold) and not (numbered or instruction):
+                keywords.update(k for k, k_re in self.keyword_res.items() if k_re.search(phrase))
+
+        features = {"lines": len(lines), "chars": chars, "numbers": numbers, "instructions": instructions,
+                    "bold_instructions": bold_instructions, "keywords": sorted(keywords)}
+        reasons = []
+        if chars < rules["min_chars"]:
+            reasons.append(f"peu de texte ({chars} caractères)")
+            return 0.0, features, reasons
+
+        score = (weights["numbers"] * min(numbers, cap) + weights["instructions"] * min(instructions, cap)
+                 + weights["bold_instructions"] * min(bold_instructions, cap))
+        if keywords:
+            # Pénalité seulement sans consignes : des consignes sont une preuve plus forte qu'un titre
+            if instructions < rules["keyword_max_instructions"]:
+                score += weights["skip_keyword"]
+                reasons.append(f"mots-clés : {', '.join(sorted(keywords))}")
+            else:
+                reasons.append(f"mots-clés ignorés (consignes) : {', '.join(sorted(keywords))}")
+        reasons.append(f"{numbers} numéro(s), {instructions} consigne(s) dont {bold_instructions} en gras")
+        return round(score, 2), features, reasons
+
+    def decide(self, lines):
+        """Entrée du journal de triage d'une page."""
+        if not lines and self.rules["empty_page"] == "keep":
+            # Pas de couche texte (page scannée, page image) : le triage ne peut pas juger
+            return {"decision": "keep", "score": None, "features": {"lines": 0, "chars": 0},
+                    "reasons": ["pas de texte extrait, page gardée"]}
+        score, features, reasons = self.score(lines)
+        decision = "keep" if score >= self.rules["threshold"] else "skip"
+        return {"decision": decision, "score": score, "features": features, "reasons": reasons}
+
+
+def load_decisions(path):
+    """{page: entrée} d'un journal de triage ({} s'il n'existe pas)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return {int(page): entry for page, entry in json.load(f)["pages"].items()}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def skipped_pages(path):
+    return {page for page, entry in load_decisions(path).items() if entry["decision"] == "skip"}
+
+
+def save_decisions(path, decisions, series, rules_path):
+    with atomic_open(path, "w", encoding="utf-8") as f:
+        json.dump({"series": series, "rules": str(rules_path),
+                   "pages": {str(p): e for p, e in sorted(decisions.items())}}, f, indent=2, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Triage des pages avant détection et Gemini")
+    parser.add_argument("--series", type=str, default="default", help="Collection de manuels (triage_rules.json)")
+    parser.add_argument("--rules", type=Path, default=RULES_FILE, help="Fichier de règles")
+    parser.add_argument("--threshold", type=float, default=None, help="Seuil (remplace celui des règles)")
+    parser.add_argument("--output", type=Path, default=None, help=f"Journal des décisions (défaut : {TRIAGE_FILE})")
+    args = parser.parse_args()
+
+    try:
+        rules = load_rules(args.rules, args.series)
+    except KeyError as e:
+        print(f"[ERR] {e.args[0]}")
+        sys.exit(1)
+    if args.threshold is not None:
+        rules["threshold"] = args.threshold
+    scorer = PageScorer(rules)
+
+    work = work_dir()
+    files_style_dir = work / "files_style"
+    store = open_store()
+    if store is not None:
+        stems = [f"page_{page}" for page in store.pages("lines")]
+    else:
+        stems = [p.stem for p in files_style_dir.glob("page_*.csv")]
+    stems = sorted((s for s in stems if page_selected(page_of(s))), key=page_of)  # MALIN_PAGES
+
+    # Journal fusionné : une reprise (MALIN_PAGES) garde les décisions des autres pages
+    output = args.output or work / TRIAGE_FILE
+    decisions = load_decisions(output)
+    kept = 0
+    for stem in stems:
+        page = page_of(stem)
+        entry = dict(scorer.decide(page_lines(stem, files_style_dir, store)), series=args.series,
+                     threshold=rules["threshold"])
+        decisions[page] = entry
+        score = "-" if entry["score"] is None else entry["score"]
+        if entry["decision"] == "keep":
+            kept += 1
+            print(f"[OK] page {page} : score {score} -> traitée ({'; '.join(entry['reasons'])})")
+        else:
+            print(f"[SKIP] page {page} : score {score} < {rules['threshold']} -> ignorée "
+                  f"({'; '.join(entry['reasons'])})")
+
+    if store is not None:
+        store.close()
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    save_decisions(output, decisions, args.series, args.rules)
+    print(f"[INFO] Triage ({args.series}) : {kept} page(s) traitée(s), {len(stems) - kept} ignorée(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+# Dossier de travail des données du pipeline (PdfSource/, files/, output/, extractionOut/,
+# classificationOut/, SORTIES/...). Par défaut le dossier du projet ; la variable
+# d'environnement MALIN_WORKDIR fait tourner les étapes dans un autre dossier
+# (cf. benchmark_pipeline.py) sans toucher aux sorties réelles.
+# Les ressources du projet (models/, prompt.txt, apikey.txt, classification/) restent
+# lues à côté des scripts.
+
+WORKDIR_ENV = "MALIN_WORKDIR"
+
+# Pages à traiter par les scripts d'étape ("3,4,10-12"), cf. main.py --resume ; toutes si absent
+PAGES_ENV = "MALIN_PAGES"
+
+
+def work_dir():
+    path = os.environ.get(WORKDIR_ENV)
+    return Path(path).resolve() if path else Path(__file__).resolve().parent
+
+
+def page_ranges(pages):
+    """{3, 4, 10, 11, 12} -> [(3, 4), (10, 12)]."""
+    ranges = []
+    for page in sorted(pages):
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return [(a, b) for a, b in ranges]
+
+
+def format_pages(pages):
+    """{3, 4, 10, 11, 12} -> "3-4,10-12"."""
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in page_ranges(pages))
+
+
+def parse_pages(value):
+    pages = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        pages.update(range(int(first), int(last or first) + 1))
+    return pages
+
+
+def selected_pages():
+    """Pages de MALIN_PAGES, ou None si toutes les pages sont à traiter."""
+    value = os.environ.get(PAGES_ENV)
+    return parse_pages(value) if value is not None else None
+
+
+def page_selected(page):
+    pages = selected_pages()
+    return pages is None or page in pages
+
+
+@contextmanager
+def atomic_open(path, mode="w", **kwargs):
+    """open() sur <path>.tmp, renommé en path une fois le fichier fermé sans erreur.
+
+    Un artefact présent est donc toujours complet, même si l'étape est interrompue.
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise